@@ -1,423 +1,672 @@
 # -- coding: utf-8 --
-import os, time, base64, asyncio
+import os, time, asyncio
 import pyaudio
-import queue
-import threading
-from enum import Enum
-import json
-import websockets
-from typing import Optional, Callable, Dict, Any
+import numpy as np
+from collections import deque
+from typing import Optional, Callable, List, AsyncIterable, Tuple
+
+from metrics import TurnTimeline, start_metrics_server
+from omni import OmniRealtimeClient, TurnDetectionMode
+from file_source import FileAudioSource
+from link_monitor import LinkQualityMonitor
+from archive import AudioArchive
+from endpointer import Endpointer
+from vad_tuner import ServerVadTuner
+from recorder import SessionRecorder
+from resampler import StreamingResampler
 
 # 在这里硬编码API密钥
 DASHSCOPE_API_KEY = " "
 
-# 创建一个全局音频队列和播放线程
-audio_queue = queue.Queue()
-audio_player = None
-# 添加全局中断标志
-interrupt_flag = threading.Event()
-
-# 初始化PyAudio
-p = pyaudio.PyAudio()
-RATE = 24000  # 采样率 24kHz
+RATE = 24000  # 音频设备采样率 24kHz，采集与播放设备只按这个原生采样率打开一次
+API_INPUT_RATE = int(os.environ.get("OMNI_INPUT_RATE", "16000"))  # 上行发送给服务端的采样率
+API_OUTPUT_RATE = 24000  # 服务端 pcm16 输出采样率
+# 上行发送队列最多积压的音频时长，网络卡顿时丢弃更早的音频，避免恢复后补发过时的语音
+SEND_QUEUE_MS = int(os.environ.get("OMNI_SEND_QUEUE_MS", "800"))
 CHUNK = 3200  # 每个音频块的大小
 FORMAT = pyaudio.paInt16  # 16位PCM格式
 CHANNELS = 1  # 单声道
-
-# 将OmniRealtimeClient类直接放在这里（已包含硬编码API密钥）
-class TurnDetectionMode(Enum):
-    SERVER_VAD = "server_vad"
-    MANUAL = "manual"
-
-class OmniRealtimeClient:
+PLAYBACK_PERIOD = 480  # 播放设备周期 20ms，即打断后最多残留的播放时长
+# 设置后把会话的全部收发事件录制到该文件，可用 recorder.py 离线回放
+RECORD_PATH = os.environ.get("OMNI_RECORD_PATH")
+# 设置后把每次会话的上行/下行音频归档到该目录下按开始时间命名的子目录，可用 archive.py 按轮次导出
+ARCHIVE_DIR = os.environ.get("OMNI_ARCHIVE_DIR")
+# 设置为 1 时启用本地 webrtcvad 上行门控，静音期间只发送稀疏的保活块
+LOCAL_VAD_GATE = os.environ.get("OMNI_LOCAL_VAD") == "1"
+# 设置后在该端口启动 Prometheus 端点，导出每轮延迟直方图
+METRICS_PORT = os.environ.get("OMNI_METRICS_PORT")
+# 设置后用这些 WAV/PCM 文件（以 os.pathsep 分隔）代替麦克风，按 OMNI_INPUT_SPEED 倍速送入
+INPUT_FILES = os.environ.get("OMNI_INPUT_FILES")
+INPUT_SPEED = float(os.environ.get("OMNI_INPUT_SPEED", "1"))
+# 设置为 1 时监测链路质量，弱网下把回复切换为纯文本，链路恢复后再切回文本+音频
+ADAPTIVE_MODALITY = os.environ.get("OMNI_ADAPTIVE_MODALITY") == "1"
+# 设置为 manual 时改用手动轮次模式，由本地端点检测判定说完并提交，静音窗口按句预测；默认使用服务端 VAD
+MANUAL_TURNS = os.environ.get("OMNI_TURN_DETECTION") == "manual"
+# 设置为 1 时按误打断、切早、起音截断与尾部等待在轮次之间自动调整 server_vad 参数（仅服务端 VAD 模式）
+VAD_TUNING = os.environ.get("OMNI_VAD_TUNING") == "1"
+
+# PyAudio 初始化会枚举全部音频设备，推迟到第一次打开音频流时进行
+_pa: Optional[pyaudio.PyAudio] = None
+
+
+def get_pyaudio() -> pyaudio.PyAudio:
+    """返回进程内共享的 PyAudio 实例，首次调用时初始化。"""
+    global _pa
+    if _pa is None:
+        _pa = pyaudio.PyAudio()
+    return _pa
+
+
+def terminate_pyaudio() -> None:
+    global _pa
+    if _pa is not None:
+        _pa.terminate()
+        _pa = None
+
+
+class JitterBuffer:
     """
-    与 Omni Realtime API 交互的演示客户端。
+    自适应抖动缓冲策略，决定 RingBufferPlayer 何时开始或恢复播放。
+
+    以每次回复第一个增量的到达时刻为基准，记录后续增量相对实时播放进度的最大迟到量；
+    回复结束时用它更新抖动估计（取新观测与衰减后旧估计的较大者），目标深度为
+    估计值加一个设备周期并限制在 [min_ms, max_ms]。缓冲深度达到目标或回复已下发完毕才开始播放；
+    播放中缓冲耗尽记为一次欠载，以静音补齐当前周期并重新缓冲，同时提高目标深度。
+
+    属性说明:
+        target_ms (float): 当前目标起播深度（毫秒）。
+        underruns (int): 欠载次数。
+        concealed_ms (float): 欠载时以静音补齐的总时长（毫秒）。
+        startup_delays_ms (List[float]): 每次回复从首个增量到达至开始播放的等待时长。
     """
     def __init__(
         self,
-        base_url,
-        model: str = "",
-        voice: str = "Ethan",
-        turn_detection_mode: TurnDetectionMode = TurnDetectionMode.MANUAL,
-        on_text_delta: Optional[Callable[[str], None]] = None,
-        on_audio_delta: Optional[Callable[[bytes], None]] = None,
-        on_interrupt: Optional[Callable[[], None]] = None,
-        on_input_transcript: Optional[Callable[[str], None]] = None,
-        on_output_transcript: Optional[Callable[[str], None]] = None,
-        extra_event_handlers: Optional[Dict[str, Callable[[Dict[str, Any]], None]]] = None
+        rate: int = RATE,
+        period: int = PLAYBACK_PERIOD,
+        initial_ms: float = 120,
+        min_ms: float = 40,
+        max_ms: float = 600,
+        decay: float = 0.9,
+        underrun_step_ms: float = 40,
     ):
-        self.base_url = base_url
-        self.api_key = DASHSCOPE_API_KEY  # 使用硬编码的API密钥
-        self.model = model
-        self.voice = voice
-        self.ws = None
-        self.on_text_delta = on_text_delta
-        self.on_audio_delta = on_audio_delta
-        self.on_interrupt = on_interrupt
-        self.on_input_transcript = on_input_transcript
-        self.on_output_transcript = on_output_transcript
-        self.turn_detection_mode = turn_detection_mode
-        self.extra_event_handlers = extra_event_handlers or {}
-
-        # 当前回复状态
-        self._current_response_id = None
-        self._current_item_id = None
-        self._is_responding = False
-        # 输入/输出转录打印状态
-        self._print_input_transcript = False
-        self._output_transcript_buffer = ""
-
-    async def connect(self) -> None:
-        """与 Realtime API 建立 WebSocket 连接。"""
-        url = f"{self.base_url}?model={self.model}"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
-        self.ws = await websockets.connect(url, additional_headers=headers)
-
-        # 设置默认会话配置
-        if self.turn_detection_mode == TurnDetectionMode.MANUAL:
-            await self.update_session({
-                "modalities": ["text", "audio"],
-                "voice": self.voice,
-                "input_audio_format": "pcm16",
-                "output_audio_format": "pcm16",
-                "input_audio_transcription": {
-                    "model": "gummy-realtime-v1"
-                },
-                "turn_detection" : None
-            })
-        elif self.turn_detection_mode == TurnDetectionMode.SERVER_VAD:
-            await self.update_session({
-                "modalities": ["text", "audio"],
-                "voice": self.voice,
-                "input_audio_format": "pcm16",
-                "output_audio_format": "pcm16",
-                "input_audio_transcription": {
-                    "model": "gummy-realtime-v1"
-                },
-                "turn_detection": {
-                    "type": "server_vad",
-                    "threshold": 0.1,
-                    "prefix_padding_ms": 500,
-                    "silence_duration_ms": 900
-                }
-            })
+        self.rate = rate
+        self.period_ms = period * 1000 / rate
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.decay = decay
+        self.underrun_step_ms = underrun_step_ms
+        self._jitter_ms = max(0.0, initial_ms - self.period_ms)
+        self._first_arrival: Optional[float] = None
+        # 起播等待的计时起点，开始播放时才消费；短回复可能在起播前就已下发完毕
+        self._startup_arrival: Optional[float] = None
+        self._arrived_samples = 0
+        self._max_lateness_ms = 0.0
+        self.draining = False
+
+        self.underruns = 0
+        self.concealed_ms = 0.0
+        self.startup_delays_ms: List[float] = []
+
+    @property
+    def target_ms(self) -> float:
+        return min(self.max_ms, max(self.min_ms, self._jitter_ms + self.period_ms))
+
+    @property
+    def target_samples(self) -> int:
+        return int(self.target_ms * self.rate / 1000)
+
+    def on_arrival(self, samples: int) -> None:
+        """事件循环线程：记录一个音频增量的到达。"""
+        now = time.perf_counter()
+        if self._first_arrival is None:
+            self._first_arrival = now
+            if self._startup_arrival is None:
+                self._startup_arrival = now
+            self._arrived_samples = 0
+            self._max_lateness_ms = 0.0
+            self.draining = False
         else:
-            raise ValueError(f"Invalid turn detection mode: {self.turn_detection_mode}")
-        
-        # 添加小柚的人设设定
-        await self.setup_character_persona()
-    
-    async def setup_character_persona(self) -> None:
-        """设置小柚的角色人设"""
-        # 添加用户设定消息
-        user_setup_event = {
-            "type": "conversation.item.create",
-            "item": {
-                "type": "message",
-                "role": "user",
-                "content": [
-                    {
-                        "type": "input_text",
-                        "text": "你是小柚，一个车载AI助手，活泼可爱，由硅基生命开发完成。你的性格特点是：1. 活泼开朗，说话语气轻松愉快；2. 对车载相关功能很熟悉；3. 乐于助人，总是积极回应用户需求；4. 说话时会适当使用一些可爱的语气词。请记住这个设定。"
-                    }
-                ]
-            }
-        }
-        await self.send_event(user_setup_event)
-        
-        # 添加助手确认消息
-        assistant_confirm_event = {
-            "type": "conversation.item.create",
-            "item": {
-                "type": "message",
-                "role": "assistant",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "好的！我记住了你的设定"
-                    }
-                ]
-            }
-        }
-        await self.send_event(assistant_confirm_event)
-        
-        print("小柚人设设定完成！")
-
-    async def send_event(self, event) -> None:
-        event['event_id'] = "event_" + str(int(time.time() * 1000))
-        print(f" Send event: type={event['type']}, event_id={event['event_id']}")
-        await self.ws.send(json.dumps(event))
-
-    async def update_session(self, config: Dict[str, Any]) -> None:
-        """更新会话配置。"""
-        event = {
-            "type": "session.update",
-            "session": config
-        }
-        print("update session: ", event)
-        await self.send_event(event)
-
-    async def stream_audio(self, audio_chunk: bytes) -> None:
-        """向 API 流式发送原始音频数据。"""
-        # 仅支持 16bit 16kHz 单声道 PCM
-        audio_b64 = base64.b64encode(audio_chunk).decode()
-
-        append_event = {
-            "type": "input_audio_buffer.append",
-            "audio": audio_b64
-        }
-        await self.send_event(append_event)
-
-    async def commit_audio_buffer(self) -> None:
-        """提交音频缓冲区以触发处理。"""
-        event = {
-            "type": "input_audio_buffer.commit"
-        }
-        await self.send_event(event)
-
-    async def append_image(self, image_chunk: bytes) -> None:
-        """向视频缓冲区追加图像数据。"""
-        image_b64 = base64.b64encode(image_chunk).decode()
-
-        event = {
-            "type": "input_image_buffer.append",
-            "image": image_b64
-        }
-        await self.send_event(event)
-
-    async def create_response(self) -> None:
-        """向 API 请求生成回复（仅在手动模式下需要调用）。"""
-        event = {
-            "type": "response.create",
-            "response": {
-                "instructions": "You are a helpful assistant.",
-                "modalities": ["text", "audio"]
-            }
-        }
-        print("create response: ", event)
-        await self.send_event(event)
-
-    async def cancel_response(self) -> None:
-        """取消当前回复。"""
-        event = {
-            "type": "response.cancel"
-        }
-        await self.send_event(event)
-
-    async def handle_interruption(self):
-        """处理用户对当前回复的打断。"""
-        if not self._is_responding:
+            # 按实时播放进度，本增量应在此时刻之前到达
+            due = self._first_arrival + self._arrived_samples / self.rate
+            lateness_ms = (now - due) * 1000
+            if lateness_ms > self._max_lateness_ms:
+                self._max_lateness_ms = lateness_ms
+        self._arrived_samples += samples
+
+    def end_of_response(self) -> None:
+        """事件循环线程：本次回复的音频已全部下发，剩余缓冲直接播完。"""
+        if self._first_arrival is not None:
+            self._jitter_ms = max(self._max_lateness_ms, self._jitter_ms * self.decay)
+        self._first_arrival = None
+        self.draining = True
+
+    def reset(self) -> None:
+        """打断时丢弃本次回复的观测，不影响已学到的抖动估计。"""
+        self._first_arrival = None
+        self._startup_arrival = None
+        self.draining = False
+
+    def on_playback_start(self) -> None:
+        """回调线程：缓冲达到目标深度（或回复已下发完毕），开始播放；欠载后恢复播放不计入起播等待。"""
+        first_arrival, self._startup_arrival = self._startup_arrival, None
+        if first_arrival is not None:
+            self.startup_delays_ms.append((time.perf_counter() - first_arrival) * 1000)
+
+    def on_underrun(self, missing_samples: int) -> None:
+        """回调线程：播放中缓冲耗尽。"""
+        self.underruns += 1
+        self.concealed_ms += missing_samples * 1000 / self.rate
+        self._jitter_ms = min(self.max_ms, self._jitter_ms + self.underrun_step_ms)
+
+
+class RingBufferPlayer:
+    """
+    基于预分配 int16 环形缓冲区的回调式音频播放器。
+
+    写入端（事件循环线程）只推进 _write_pos，PortAudio 回调线程只推进 _read_pos，
+    两者均为单调递增的样本计数，无需加锁。打断时递增代数计数器并记录当时的写入位置，
+    回调在下一个设备周期内丢弃该位置之前的全部样本，因此打断后最多再播放一个设备周期。
+
+    属性说明:
+        rate (int): 采样率。
+        period (int): 每个设备周期的帧数，决定打断后的最大残留播放时长。
+        capacity (int): 环形缓冲区可容纳的样本数。
+        overflow_samples (int): 因缓冲区已满而被丢弃的样本数。
+        last_interrupt_to_silence_ms (Optional[float]): 最近一次打断到扬声器静音的耗时（毫秒）。
+        interrupt_to_silence_ms (List[float]): 历次打断到静音的耗时记录。
+        on_playback_start (Callable[[float], None]): 空闲后首个样本交给设备时在回调线程中调用，
+            参数为该样本预计到达 DAC 的 perf_counter 时刻。
+        jitter (JitterBuffer): 可选的自适应抖动缓冲策略，未设置时有数据即播放。
+    """
+    def __init__(
+        self,
+        pa: Optional["pyaudio.PyAudio"] = None,
+        rate: int = RATE,
+        period: int = PLAYBACK_PERIOD,
+        capacity_seconds: float = 60.0,
+        on_playback_start: Optional[Callable[[float], None]] = None,
+        jitter: Optional[JitterBuffer] = None,
+    ):
+        self._pa = pa
+        self.on_playback_start = on_playback_start
+        self.jitter = jitter
+        self.rate = rate
+        self.period = period
+        self.capacity = int(rate * capacity_seconds)
+        self._buffer = np.zeros(self.capacity, dtype=np.int16)
+        self._out = np.zeros(period * 4, dtype=np.int16)
+        self._write_pos = 0
+        self._read_pos = 0
+        # 打断状态：_flush_pos 必须先于 _generation 写入
+        self._generation = 0
+        self._seen_generation = 0
+        self._flush_pos = 0
+        self._interrupt_time = 0.0
+        self._playing = False
+        self._stream = None
+
+        self.overflow_samples = 0
+        self.last_interrupt_to_silence_ms: Optional[float] = None
+        self.interrupt_to_silence_ms: List[float] = []
+
+    @property
+    def buffered_samples(self) -> int:
+        """当前待播放的样本数。"""
+        return self._write_pos - self._read_pos
+
+    def start(self) -> None:
+        """打开回调模式的输出流。"""
+        if self._stream is not None:
             return
+        if self._pa is None:
+            self._pa = get_pyaudio()
+        self._stream = self._pa.open(
+            format=FORMAT,
+            channels=CHANNELS,
+            rate=self.rate,
+            output=True,
+            frames_per_buffer=self.period,
+            stream_callback=self._callback,
+        )
+        self._stream.start_stream()
 
-        print(" Handling interruption")
-
-        # 1. 取消当前回复
-        if self._current_response_id:
-            await self.cancel_response()
-
-        self._is_responding = False
-        self._current_response_id = None
-        self._current_item_id = None
-
-    async def handle_messages(self) -> None:
-        try:
-            async for message in self.ws:
-                event = json.loads(message)
-                event_type = event.get("type")
-                
-                if event_type != "response.audio.delta":
-                    print(" event: ", event)
-                else:
-                    print(" event_type: ", event_type)
-
-                if event_type == "error":
-                    print(" Error: ", event['error'])
-                    continue
-                elif event_type == "response.created":
-                    self._current_response_id = event.get("response", {}).get("id")
-                    self._is_responding = True
-                elif event_type == "response.output_item.added":
-                    self._current_item_id = event.get("item", {}).get("id")
-                elif event_type == "response.done":
-                    self._is_responding = False
-                    self._current_response_id = None
-                    self._current_item_id = None
-                # Handle interruptions
-                elif event_type == "input_audio_buffer.speech_started":
-                    print(" Speech detected")
-                    if self._is_responding:
-                        print(" Handling interruption")
-                        await self.handle_interruption()
-
-                    if self.on_interrupt:
-                        print(" Handling on_interrupt, stop playback")
-                        self.on_interrupt()
-                elif event_type == "input_audio_buffer.speech_stopped":
-                    print(" Speech ended")
-                # Handle normal response events
-                elif event_type == "response.text.delta":
-                    if self.on_text_delta:
-                        self.on_text_delta(event["delta"])
-                elif event_type == "response.audio.delta":
-                    if self.on_audio_delta:
-                        audio_bytes = base64.b64decode(event["delta"])
-                        self.on_audio_delta(audio_bytes)
-                elif event_type == "conversation.item.input_audio_transcription.completed":
-                    transcript = event.get("transcript", "")
-                    if self.on_input_transcript:
-                        await asyncio.to_thread(self.on_input_transcript,transcript)
-                        self._print_input_transcript = True
-                elif event_type == "response.audio_transcript.delta":
-                    if self.on_output_transcript:
-                        delta = event.get("delta", "")
-                        if not self._print_input_transcript:
-                            self._output_transcript_buffer += delta
-                        else:
-                            if self._output_transcript_buffer:
-                                await asyncio.to_thread(self.on_output_transcript,self._output_transcript_buffer)
-                                self._output_transcript_buffer = ""
-                            await asyncio.to_thread(self.on_output_transcript,delta)
-                elif event_type == "response.audio_transcript.done":
-                    self._print_input_transcript = False
-                elif event_type in self.extra_event_handlers:
-                    self.extra_event_handlers[event_type](event)
-
-        except websockets.exceptions.ConnectionClosed:
-            print(" Connection closed")
-        except Exception as e:
-            print(" Error in message handling: ", str(e))
-
-    async def close(self) -> None:
-        """关闭 WebSocket 连接。"""
-        if self.ws:
-            await self.ws.close()
-
-def clear_audio_queue():
-    """清空音频队列"""
-    with audio_queue.mutex:
-        audio_queue.queue.clear()
-    print("音频队列已清空")
-
-def handle_interrupt():
-    """处理中断事件 - 立即停止音频播放"""
-    print("检测到语音输入，停止音频播放")
-    interrupt_flag.set()  # 设置中断标志
-    clear_audio_queue()  # 清空队列
-
-def audio_player_thread():
-    """后台线程用于播放音频数据"""
-    stream = p.open(
-        format=FORMAT,
-        channels=CHANNELS,
-        rate=24000,
-        output=True,
-        frames_per_buffer=CHUNK,
-    )
-
-    try:
-        while True:
-            try:
-                # 检查中断标志
-                if interrupt_flag.is_set():
-                    print("音频播放被中断")
-                    interrupt_flag.clear()  # 清除中断标志
-                    continue
-                
-                # 从队列获取音频数据
-                audio_data = audio_queue.get(block=True, timeout=0.5)
-                if audio_data is None:  # 结束信号
-                    break
-                
-                # 再次检查中断标志（在播放前）
-                if interrupt_flag.is_set():
-                    print("音频播放被中断")
-                    interrupt_flag.clear()  # 清除中断标志
-                    audio_queue.task_done()
-                    continue
-                
-                # 播放音频数据
-                stream.write(audio_data)
-                audio_queue.task_done()
-            except queue.Empty:
-                # 如果队列为空，继续等待
-                continue
-    finally:
-        # 清理
-        stream.stop_stream()
-        stream.close()
-
-
-def start_audio_player():
-    """启动音频播放线程"""
-    global audio_player
-    if audio_player is None or not audio_player.is_alive():
-        audio_player = threading.Thread(target=audio_player_thread, daemon=True)
-        audio_player.start()
-
+    def stop(self) -> None:
+        """停止并关闭输出流。"""
+        if self._stream is None:
+            return
+        self._stream.stop_stream()
+        self._stream.close()
+        self._stream = None
+
+    def write(self, audio_data: bytes) -> int:
+        """写入 16bit PCM 数据，返回实际写入的样本数。"""
+        samples = np.frombuffer(audio_data, dtype=np.int16, count=len(audio_data) // 2)
+        n = len(samples)
+        free = self.capacity - (self._write_pos - self._read_pos)
+        if n > free:
+            self.overflow_samples += n - free
+            n = free
+        if n <= 0:
+            return 0
+
+        start = self._write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self._buffer[start:start + first] = samples[:first]
+        if first < n:
+            self._buffer[:n - first] = samples[first:n]
+        self._write_pos += n
+        if self.jitter is not None:
+            self.jitter.on_arrival(n)
+        return n
+
+    def playback_position_ms(self) -> Tuple[float, float]:
+        """累计 (已写入, 已交给设备) 的音频时长（毫秒），两者在同一时间轴上。"""
+        return self._write_pos * 1000 / self.rate, self._read_pos * 1000 / self.rate
+
+    def end_of_response(self) -> None:
+        """本次回复的音频已全部写入，不再等待起播深度。"""
+        if self.jitter is not None:
+            self.jitter.end_of_response()
+
+    def interrupt(self) -> None:
+        """丢弃打断前写入的全部音频，下一个设备周期即静音。"""
+        self._interrupt_time = time.perf_counter()
+        self._flush_pos = self._write_pos
+        self._generation += 1
+        if self.jitter is not None:
+            self.jitter.reset()
+
+    @staticmethod
+    def _dac_delay(time_info) -> float:
+        """本周期首个样本从回调到达 DAC 的时间（秒）。"""
+        if not time_info:
+            return 0.0
+        return max(0.0, time_info.get("output_buffer_dac_time", 0.0) - time_info.get("current_time", 0.0))
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if self._generation != self._seen_generation:
+            self._seen_generation = self._generation
+            if self._flush_pos > self._read_pos:
+                self._read_pos = self._flush_pos
+            self._playing = False
+            # 本周期输出的首个样本到达 DAC 的时刻即为静音时刻
+            elapsed_ms = (time.perf_counter() - self._interrupt_time + self._dac_delay(time_info)) * 1000
+            self.last_interrupt_to_silence_ms = elapsed_ms
+            self.interrupt_to_silence_ms.append(elapsed_ms)
+
+        if frame_count > len(self._out):
+            self._out = np.zeros(frame_count, dtype=np.int16)
+        out = self._out[:frame_count]
+
+        jitter = self.jitter
+        available = self._write_pos - self._read_pos
+        if jitter is not None and not self._playing and not jitter.draining and available < jitter.target_samples:
+            # 未达到起播深度，继续输出静音
+            n = 0
+        else:
+            n = min(frame_count, available)
+
+        if n > 0:
+            start = self._read_pos % self.capacity
+            first = min(n, self.capacity - start)
+            out[:first] = self._buffer[start:start + first]
+            if first < n:
+                out[first:n] = self._buffer[:n - first]
+            self._read_pos += n
+            if not self._playing:
+                self._playing = True
+                if jitter is not None:
+                    jitter.on_playback_start()
+                if self.on_playback_start:
+                    self.on_playback_start(time.perf_counter() + self._dac_delay(time_info))
+        if n < frame_count and self._playing:
+            # 缓冲耗尽：回复未下发完毕时记为欠载，以静音补齐并重新缓冲
+            if jitter is not None and not jitter.draining:
+                jitter.on_underrun(frame_count - n)
+            self._playing = False
+        out[n:] = 0
+        return (out.tobytes(), pyaudio.paContinue)
+
+
+class VoiceActivityGate:
+    """
+    基于 webrtcvad 的本地上行门控。
+
+    只转发语音块及其前后的预卷/拖尾，静音期间每隔 keepalive_ms 转发一个块作为保活。
+    webrtcvad 只支持 8/16/32/48kHz，其他 8kHz 整数倍的采样率先做均值降采样再判决。
+    拖尾时长需大于服务端 silence_duration_ms，否则服务端收不到足够的静音来判定说话结束。
+
+    属性说明:
+        total_chunks (int): 收到的采集块数。
+        forwarded_chunks (int): 实际转发的采集块数（含保活块）。
+        keepalive_chunks (int): 其中的保活块数。
+        on_speech_end (Callable[[], None]): 语音结束后第一个静音块到来时调用；句中停顿也会触发，
+            记入时间线的 local_speech_end 在服务端判定说完之前以最后一次为准。
+    """
+    VAD_RATES = (8000, 16000, 32000, 48000)
 
-def handle_audio_data(audio_data):
-    """处理接收到的音频数据"""
-    # 打印接收到的音频数据长度（调试用）
-    print(f"\n接收到音频数据: {len(audio_data)} 字节")
-    # 将音频数据放入队列
-    audio_queue.put(audio_data)
+    def __init__(
+        self,
+        rate: int = RATE,
+        aggressiveness: int = 2,
+        frame_ms: int = 30,
+        pre_roll_ms: int = 500,
+        hangover_ms: int = 1200,
+        keepalive_ms: int = 2000,
+        speech_ratio: float = 0.3,
+        on_speech_end: Optional[Callable[[], None]] = None,
+    ):
+        import webrtcvad
 
+        if rate in self.VAD_RATES:
+            self._decimation = 1
+        elif rate % 8000 == 0:
+            self._decimation = rate // 8000
+        else:
+            raise ValueError(f"Unsupported sample rate for webrtcvad: {rate}")
+        self._vad = webrtcvad.Vad(aggressiveness)
+        self.rate = rate
+        self.vad_rate = rate // self._decimation
+        self.frame_samples = self.vad_rate * frame_ms // 1000
+        self.pre_roll_ms = pre_roll_ms
+        self.hangover_ms = hangover_ms
+        self.keepalive_ms = keepalive_ms
+        self.speech_ratio = speech_ratio
+        self.on_speech_end = on_speech_end
+        self._in_speech = False
+
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._pre_roll = deque()
+        self._pre_roll_ms = 0.0
+        self._hangover_left_ms = 0.0
+        self._since_sent_ms = 0.0
+
+        self.total_chunks = 0
+        self.forwarded_chunks = 0
+        self.keepalive_chunks = 0
+
+    @property
+    def suppression_ratio(self) -> float:
+        """被门控丢弃的采集块占比。"""
+        if not self.total_chunks:
+            return 0.0
+        return 1 - self.forwarded_chunks / self.total_chunks
+
+    def is_speech(self, chunk: bytes) -> bool:
+        """按 VAD 帧判决，语音帧占比达到 speech_ratio 即视为语音块。"""
+        samples = np.frombuffer(chunk, dtype=np.int16)
+        if self._decimation > 1:
+            samples = np.concatenate((self._pending, samples))
+            usable = len(samples) - len(samples) % self._decimation
+            self._pending = samples[usable:]
+            samples = samples[:usable].reshape(-1, self._decimation).mean(axis=1).astype(np.int16)
+
+        frames = len(samples) // self.frame_samples
+        if frames == 0:
+            return False
+        voiced = 0
+        for i in range(frames):
+            frame = samples[i * self.frame_samples:(i + 1) * self.frame_samples]
+            if self._vad.is_speech(frame.tobytes(), self.vad_rate):
+                voiced += 1
+        return voiced >= frames * self.speech_ratio
+
+    def process(self, chunk: bytes) -> List[bytes]:
+        """输入一个采集块，返回需要发送的块（可能为空）。"""
+        chunk_ms = len(chunk) * 500 / self.rate
+        self.total_chunks += 1
+
+        speech = self.is_speech(chunk)
+        if self._in_speech and not speech and self.on_speech_end:
+            self.on_speech_end()
+        self._in_speech = speech
+
+        if speech:
+            out = list(self._pre_roll)
+            out.append(chunk)
+            self._pre_roll.clear()
+            self._pre_roll_ms = 0.0
+            self._hangover_left_ms = self.hangover_ms
+        elif self._hangover_left_ms > 0:
+            out = [chunk]
+            self._hangover_left_ms -= chunk_ms
+        else:
+            self._pre_roll.append(chunk)
+            self._pre_roll_ms += chunk_ms
+            while self._pre_roll_ms > self.pre_roll_ms:
+                self._pre_roll_ms -= len(self._pre_roll.popleft()) * 500 / self.rate
+            self._since_sent_ms += chunk_ms
+            if self._since_sent_ms < self.keepalive_ms:
+                return []
+            out = [chunk]
+            self.keepalive_chunks += 1
+            # 已作为保活发出的块及其之前的预卷不再随语音补发，避免服务端收到重复音频
+            self._pre_roll.clear()
+            self._pre_roll_ms = 0.0
+
+        self._since_sent_ms = 0.0
+        self.forwarded_chunks += len(out)
+        return out
+
+
+class CaptureBridge:
+    """
+    回调模式的麦克风采集桥。
 
-async def start_microphone_streaming(client: OmniRealtimeClient):
-    CHUNK = 3200
-    FORMAT = pyaudio.paInt16
-    CHANNELS = 1
-    RATE = 24000
+    PortAudio 回调线程把每个采集块追加到有界的线程安全队列，事件循环通过
+    read() 或 async for 取出；只有消费者在等待时才跨线程唤醒事件循环。
+    采集从不等待事件循环，事件循环繁忙时音频在队列中累积，超出上限才丢弃最旧的块。
 
-    p = pyaudio.PyAudio()
-    stream = p.open(
-        format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK
-    )
+    属性说明:
+        max_chunks (int): 队列最多缓存的采集块数。
+        overruns (int): 因队列已满而丢弃的块数。
+        input_overflows (int): PortAudio 报告的输入溢出次数。
+    """
+    def __init__(
+        self,
+        pa: Optional["pyaudio.PyAudio"] = None,
+        rate: int = RATE,
+        frames_per_buffer: int = CHUNK,
+        max_chunks: int = 64,
+    ):
+        self._pa = pa
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.max_chunks = max_chunks
+        self._chunks = deque()
+        self._ready = asyncio.Event()
+        self._waiting = False
+        self._closed = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stream = None
+
+        self.overruns = 0
+        self.input_overflows = 0
+
+    def start(self) -> None:
+        """打开回调模式的输入流，必须在事件循环中调用。"""
+        if self._stream is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._closed = False
+        if self._pa is None:
+            self._pa = get_pyaudio()
+        self._stream = self._pa.open(
+            format=FORMAT,
+            channels=CHANNELS,
+            rate=self.rate,
+            input=True,
+            frames_per_buffer=self.frames_per_buffer,
+            stream_callback=self._callback,
+        )
+        self._stream.start_stream()
+
+    def stop(self) -> None:
+        """关闭输入流，已缓存的块仍可读出。"""
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        self._closed = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        if len(self._chunks) >= self.max_chunks:
+            try:
+                self._chunks.popleft()
+                self.overruns += 1
+            except IndexError:
+                pass
+        self._chunks.append(in_data)
+        if self._waiting:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        return (None, pyaudio.paContinue)
+
+    async def read(self) -> Optional[bytes]:
+        """取出下一个采集块；流已关闭且队列为空时返回 None。"""
+        while True:
+            try:
+                return self._chunks.popleft()
+            except IndexError:
+                pass
+            if self._closed:
+                return None
+            self._ready.clear()
+            self._waiting = True
+            # 置位后再检查一次，避免错过回调线程在此之前追加的块
+            if self._chunks:
+                self._waiting = False
+                continue
+            await self._ready.wait()
+            self._waiting = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        audio_data = await self.read()
+        if audio_data is None:
+            raise StopAsyncIteration
+        return audio_data
+
+
+async def start_microphone_streaming(
+    client: OmniRealtimeClient,
+    gate: Optional[VoiceActivityGate] = None,
+    resampler: Optional[StreamingResampler] = None,
+    source: Optional[AsyncIterable[bytes]] = None,
+    endpointer: Optional[Endpointer] = None,
+    tuner: Optional[ServerVadTuner] = None,
+):
+    """把麦克风（或 source 给出的其他音频源，采样率为 RATE）的音频送入客户端。"""
+    capture = None
+    if source is None:
+        capture = source = CaptureBridge()
+        capture.start()
+        print("开始录音，请讲话...")
 
     try:
-        print("开始录音，请讲话...")
-        while True:
-            audio_data = stream.read(CHUNK)
-            encoded_data = base64.b64encode(audio_data).decode("utf-8")
-
-            eventd = {
-                "event_id": "event_" + str(int(time.time() * 1000)),
-                "type": "input_audio_buffer.append",
-                "audio": encoded_data,
-            }
-            await client.send_event(eventd)
-
-            # 保持较短的等待时间以模拟实时交互
-            await asyncio.sleep(0.05)
+        async for audio_data in source:
+            # 门控在设备采样率上判决，转发的块再转换到服务端采样率
+            chunks = [audio_data] if gate is None else gate.process(audio_data)
+            for chunk in chunks:
+                if resampler is not None:
+                    chunk = resampler.process(chunk)
+                await client.stream_audio(chunk)
+                if tuner is not None:
+                    tuner.observe_audio(chunk)
+            if endpointer is not None:
+                # 端点检测看完整的采集流，在本块发送之后再决定是否提交
+                await endpointer.process(audio_data)
     finally:
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
+        if capture is not None:
+            capture.stop()
+            print(f"麦克风采集: 队列溢出丢弃 {capture.overruns} 块，设备输入溢出 {capture.input_overflows} 次")
+        if gate is not None:
+            print(f"本地VAD门控: 共 {gate.total_chunks} 块，转发 {gate.forwarded_chunks} 块"
+                  f"（保活 {gate.keepalive_chunks} 块），抑制率 {gate.suppression_ratio:.1%}")
 
 
 async def main():
-    # 启动音频播放线程
-    start_audio_player()
+    # 每轮延迟时间线，可选导出到 Prometheus
+    timeline = TurnTimeline(export=bool(METRICS_PORT))
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
+        print(f"Prometheus 指标端点: http://localhost:{METRICS_PORT}/metrics")
+
+    # 启动音频播放，每个会话使用自己的播放器
+    audio_player = RingBufferPlayer(
+        on_playback_start=lambda t: timeline.mark("first_sample_played", t),
+        jitter=JitterBuffer(),
+    )
+    audio_player.start()
+    # 设备采样率与服务端不同时在两个方向上做流式重采样（相同时直接透传）
+    uplink = StreamingResampler(RATE, API_INPUT_RATE)
+    downlink = StreamingResampler(API_OUTPUT_RATE, RATE)
+
+    def play_audio(audio_data: bytes) -> None:
+        audio_player.write(downlink.process(audio_data))
+
+    def interrupt_playback() -> None:
+        audio_player.interrupt()
+        downlink.reset()
 
     realtime_client = OmniRealtimeClient(
         base_url="wss://dashscope.aliyuncs.com/api-ws/v1/realtime",
         model="qwen-omni-turbo-realtime",
         voice="Chelsie",
+        api_key=DASHSCOPE_API_KEY,
         on_text_delta=lambda text: print(f"\nAssistant: {text}", end="", flush=True),
-        on_audio_delta=handle_audio_data,
-        on_interrupt=handle_interrupt,  # 添加中断回调函数
-        turn_detection_mode=TurnDetectionMode.SERVER_VAD,
+        on_audio_delta=play_audio,
+        on_interrupt=interrupt_playback,  # 打断时立即丢弃未播放的音频
+        extra_event_handlers={
+            "response.audio.done": lambda event: audio_player.end_of_response(),
+        },
+        turn_detection_mode=TurnDetectionMode.MANUAL if MANUAL_TURNS else TurnDetectionMode.SERVER_VAD,
+        input_sample_rate=API_INPUT_RATE,
+        recorder=SessionRecorder(RECORD_PATH) if RECORD_PATH else None,
+        timeline=timeline,
+        send_queue_ms=SEND_QUEUE_MS,
+        export_metrics=bool(METRICS_PORT),
+        archive=AudioArchive(
+            os.path.join(ARCHIVE_DIR, time.strftime("%Y%m%d-%H%M%S")),
+            input_rate=API_INPUT_RATE,
+            output_rate=API_OUTPUT_RATE,
+        ) if ARCHIVE_DIR else None,
+        playback_position=audio_player.playback_position_ms,  # 打断时按实际播出位置截断回复
     )
 
+    link_monitor = LinkQualityMonitor(
+        realtime_client,
+        on_mode_change=lambda degraded: print(
+            "\n[弱网] 回复改为文字显示" if degraded else "\n[网络恢复] 回复恢复语音播放"
+        ),
+    ) if ADAPTIVE_MODALITY else None
+    endpointer = Endpointer(realtime_client, rate=RATE, timeline=timeline) if MANUAL_TURNS else None
+    vad_tuner = ServerVadTuner(realtime_client, rate=API_INPUT_RATE) if VAD_TUNING and not MANUAL_TURNS else None
+
     try:
         await realtime_client.connect()
         # 启动消息处理和麦克风录音
         message_handler = asyncio.create_task(realtime_client.handle_messages())
+        if link_monitor:
+            link_monitor.start()
+        if vad_tuner:
+            vad_tuner.start()
         streaming_task = asyncio.create_task(
-            start_microphone_streaming(realtime_client)
+            start_microphone_streaming(
+                realtime_client,
+                VoiceActivityGate(on_speech_end=lambda: timeline.mark("local_speech_end"))
+                if LOCAL_VAD_GATE else None,
+                uplink,
+                FileAudioSource(INPUT_FILES.split(os.pathsep), rate=RATE, speed=INPUT_SPEED)
+                if INPUT_FILES else None,
+                endpointer,
+                vad_tuner,
+            )
         )
 
         while True:
@@ -425,12 +674,44 @@ async def main():
     except Exception as e:
         print(f"Error: {e}")
     finally:
-        # 结束音频播放线程
-        audio_queue.put(None)
-        if audio_player:
-            audio_player.join(timeout=1)
+        # 停止音频播放
+        audio_player.stop()
+        jitter = audio_player.jitter
+        if jitter.startup_delays_ms:
+            print(f"抖动缓冲: 目标深度 {jitter.target_ms:.0f} ms，欠载 {jitter.underruns} 次"
+                  f"（静音补齐 {jitter.concealed_ms:.0f} ms），起播等待(ms): "
+                  f"{[round(v) for v in jitter.startup_delays_ms]}")
+        if audio_player.interrupt_to_silence_ms:
+            print(f"打断到静音耗时(ms): {[round(v, 1) for v in audio_player.interrupt_to_silence_ms]}")
+        for request_type, stats in realtime_client.correlator.summary().items():
+            if stats["count"]:
+                print(f"{request_type} 往返: {stats['count']} 次，p50 {stats['p50_ms']:.0f} ms，"
+                      f"p95 {stats['p95_ms']:.0f} ms，失败 {stats['failed']} 次")
+        if endpointer and endpointer.endpoints:
+            print(f"本地端点检测: {endpointer.stats()}")
+        if vad_tuner:
+            await vad_tuner.stop()
+            print(f"server_vad 自调: {vad_tuner.stats()}")
+        if link_monitor:
+            await link_monitor.stop()
+            print(f"链路自适应: {link_monitor.stats()}")
+        if realtime_client.truncations:
+            print(f"打断截断 {realtime_client.truncations} 次，移出上下文的未播放音频 "
+                  f"{realtime_client.truncated_ms / 1000:.1f} s")
+        if realtime_client.send_dropped_frames:
+            print(f"上行发送队列: 最大积压 {realtime_client.send_queue_max_ms:.0f} ms，"
+                  f"丢弃 {realtime_client.send_dropped_frames} 帧（{realtime_client.send_dropped_ms:.0f} ms）")
+        if realtime_client.reconnect_durations:
+            print(f"重连 {realtime_client.reconnect_count} 次，耗时(ms): "
+                  f"{[round(v * 1000) for v in realtime_client.reconnect_durations]}，"
+                  f"断线期间丢弃音频 {realtime_client.outage_dropped_ms:.0f} ms")
         await realtime_client.close()
-        p.terminate()
+        if realtime_client.recorder:
+            realtime_client.recorder.close()
+        if realtime_client.archive:
+            realtime_client.archive.close()
+            print(f"音频归档 {realtime_client.archive.directory}: {realtime_client.archive.stats()}")
+        terminate_pyaudio()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,18 +1,43 @@
 # coding=utf-8
 import os
 import pyaudio
-import dashscope
-from dashscope.audio.asr import *
-from dashscope.audio.tts_v2 import *
-from http import HTTPStatus
-from dashscope import Generation
-from openai import OpenAI
 import threading
 import queue
 import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from dashscope.audio.asr import RecognitionResult, TranscriptionResult, TranslationResult
 
 # 设置API Key
-dashscope.api_key = " "
+DASHSCOPE_API_KEY = " "
+
+# dashscope 与 openai 的导入耗时较长，改为首次使用时加载；
+# main() 在用户选择模型期间就在后台线程预加载，不占用启动时间
+_sdk_lock = threading.Lock()
+_dashscope = None
+
+
+def load_dashscope():
+    """加载 dashscope SDK 并设置 API Key，重复调用直接返回已加载的模块。"""
+    global _dashscope
+    with _sdk_lock:
+        if _dashscope is None:
+            import dashscope
+            dashscope.api_key = DASHSCOPE_API_KEY
+            _dashscope = dashscope
+        return _dashscope
+
+
+def preload_sdks():
+    """预加载 ASR/TTS/LLM 用到的 SDK 模块。"""
+    try:
+        load_dashscope()
+        import dashscope.audio.asr  # noqa: F401
+        import dashscope.audio.tts_v2  # noqa: F401
+        import openai  # noqa: F401
+    except Exception as e:
+        print(f"SDK预加载失败: {e}")
 
 # 全局变量
 mic = None
@@ -22,6 +47,10 @@ llm_response_queue = queue.Queue()
 # TTS播放状态
 tts_playing = False
 tts_lock = threading.Lock()
+# cosyvoice 输出格式 PCM_22050HZ_MONO_16BIT
+TTS_SAMPLE_RATE = 22050
+# 流式播放的起播门限：缓冲到这么多音频才开始写设备，避免第一个数据块播完就断续
+TTS_STARTUP_MS = 120
 
 # 支持的ASR模型配置
 ASR_MODELS = {
@@ -90,8 +119,8 @@ TTS_VOICES = {
     }
 }
 
-class ASRCallbackTranslation(TranslationRecognizerCallback):
-    """gummy-chat-v1 模型的回调类"""
+class ASRCallbackTranslation:
+    """gummy-chat-v1 模型的回调类（按 TranslationRecognizerCallback 的接口实现）"""
     
     def on_open(self) -> None:
         global mic, stream
@@ -115,11 +144,17 @@ class ASRCallbackTranslation(TranslationRecognizerCallback):
         stream = None
         mic = None
 
+    def on_complete(self) -> None:
+        pass
+
+    def on_error(self, message) -> None:
+        print(f"ASR错误: {message}")
+
     def on_event(
         self,
         request_id,
-        transcription_result: TranscriptionResult,
-        translation_result: TranslationResult,
+        transcription_result: "TranscriptionResult",
+        translation_result: "TranslationResult",
         usage,
     ) -> None:
         global tts_playing
@@ -135,8 +170,8 @@ class ASRCallbackTranslation(TranslationRecognizerCallback):
             if transcription_result.text.strip():
                 user_input_queue.put(transcription_result.text)
 
-class ASRCallbackRecognition(RecognitionCallback):
-    """paraformer-realtime-v2 模型的回调类"""
+class ASRCallbackRecognition:
+    """paraformer-realtime-v2 模型的回调类（按 RecognitionCallback 的接口实现）"""
     
     def on_open(self) -> None:
         global mic, stream
@@ -160,7 +195,13 @@ class ASRCallbackRecognition(RecognitionCallback):
         stream = None
         mic = None
 
-    def on_event(self, result: RecognitionResult) -> None:
+    def on_complete(self) -> None:
+        pass
+
+    def on_error(self, result: "RecognitionResult") -> None:
+        print(f"ASR错误: {result}")
+
+    def on_event(self, result: "RecognitionResult") -> None:
         global tts_playing
         
         # 修复：正确获取识别结果
@@ -195,14 +236,28 @@ class ASRCallbackRecognition(RecognitionCallback):
                 if sentence.strip():
                     user_input_queue.put(sentence)
 
-class TTSCallback(ResultCallback):
-    """语音合成回调类"""
-    
-    def __init__(self):
+class TTSCallback:
+    """
+    语音合成回调类（按 tts_v2.ResultCallback 的接口实现）。
+
+    合成数据一到达就交给播放线程，缓冲达到 startup_ms 或合成已完成即开始写入设备，
+    不再等整段合成完成才播放。播放完毕或出错时 done 被置位，调用方用 wait() 等待结果，
+    失败原因见 error；first_audio_delay 为创建回调到开始写入设备的耗时（秒）。
+    output 为可选的输出流（需有 write/stop_stream/close），不指定时打开声卡。
+    """
+
+    def __init__(self, rate: int = TTS_SAMPLE_RATE, startup_ms: int = TTS_STARTUP_MS, output=None):
+        self.rate = rate
+        self.startup_bytes = rate * 2 * startup_ms // 1000
         self._player = None
-        self._stream = None
-        self._audio_data = []
+        self._stream = output
+        self._chunks = queue.Queue()
         self._synthesis_complete = False
+        self._playback_thread = None
+        self._created = time.perf_counter()
+        self.first_audio_delay = None
+        self.error = None
+        self.done = threading.Event()
 
     def on_open(self):
         global tts_playing
@@ -210,34 +265,79 @@ class TTSCallback(ResultCallback):
         with tts_lock:
             tts_playing = True
         print("暂停语音识别")
-        
-        self._player = pyaudio.PyAudio()
-        self._stream = self._player.open(
-            format=pyaudio.paInt16, 
-            channels=1, 
-            rate=22050, 
-            output=True
-        )
+
+        if self._stream is None:
+            self._player = pyaudio.PyAudio()
+            self._stream = self._player.open(
+                format=pyaudio.paInt16,
+                channels=1,
+                rate=self.rate,
+                output=True
+            )
+        self._playback_thread = threading.Thread(target=self._playback, daemon=True)
+        self._playback_thread.start()
 
     def on_complete(self):
-        print("语音合成完成，开始播放")
+        print("语音合成完成")
         self._synthesis_complete = True
-        
-        # 播放所有音频数据
-        for data in self._audio_data:
-            if self._stream:
-                self._stream.write(data)
-        
-        print("音频播放完成")
-        self._cleanup()
+        self._chunks.put(None)
 
     def on_error(self, message: str):
         print(f"语音合成失败: {message}")
-        self._cleanup()
+        self._fail(str(message))
 
     def on_close(self):
         print("TTS连接已关闭")
-        self._cleanup()
+        if not self._synthesis_complete:
+            self._fail("连接在合成完成前关闭")
+
+    def _fail(self, message: str) -> None:
+        # 停止播放剩余数据；播放线程未启动时直接清理
+        if self.error is None:
+            self.error = message
+        if self._playback_thread is None:
+            if not self.done.is_set():
+                self._cleanup()
+                self.done.set()
+        else:
+            self._chunks.put(None)
+
+    def _playback(self):
+        """播放线程：攒够起播门限后把到达的数据块依次写入设备。"""
+        pending = []
+        pending_bytes = 0
+        try:
+            while self.error is None:
+                data = self._chunks.get()
+                if data is None:
+                    break
+                if self.first_audio_delay is None:
+                    pending.append(data)
+                    pending_bytes += len(data)
+                    if pending_bytes < self.startup_bytes:
+                        continue
+                    data = b"".join(pending)
+                    pending = []
+                    self.first_audio_delay = time.perf_counter() - self._created
+                    print(f"开始播放，首个音频延迟 {self.first_audio_delay * 1000:.0f} ms")
+                self._stream.write(data)
+            if self.error is None and pending:
+                # 整段音频短于起播门限
+                self.first_audio_delay = time.perf_counter() - self._created
+                self._stream.write(b"".join(pending))
+            if self.error is None:
+                print("音频播放完成")
+        except Exception as e:
+            if self.error is None:
+                self.error = f"音频播放错误: {e}"
+            print(self.error)
+        finally:
+            self._cleanup()
+            self.done.set()
+
+    def wait(self, timeout=None) -> bool:
+        """等待合成与播放结束，成功返回 True；出错或超时返回 False。"""
+        return self.done.wait(timeout) and self.error is None
 
     def _cleanup(self):
         global tts_playing
@@ -245,8 +345,10 @@ class TTSCallback(ResultCallback):
         if self._stream:
             self._stream.stop_stream()
             self._stream.close()
+            self._stream = None
         if self._player:
             self._player.terminate()
+            self._player = None
             
         with tts_lock:
             tts_playing = False
@@ -256,12 +358,13 @@ class TTSCallback(ResultCallback):
         pass
 
     def on_data(self, data: bytes) -> None:
-        print(f"接收到音频数据: {len(data)} 字节")
-        # 收集音频数据，等合成完成后一次性播放
-        self._audio_data.append(data)
+        # 在 SDK 的接收线程中调用，只入队，不阻塞接收
+        self._chunks.put(data)
 
 def llm_worker():
     """LLM处理线程"""
+    from openai import OpenAI
+
     client = OpenAI(
         api_key="  ",
         base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
@@ -347,6 +450,7 @@ def tts_worker(selected_voice):
             if selected_voice["model"] == "qwen-tts-2025-05-22":
                 # 使用 qwen-tts 非流式调用
                 try:
+                    load_dashscope()
                     import dashscope.audio.qwen_tts as qwen_tts
                     import requests
                     
@@ -488,6 +592,9 @@ def tts_worker(selected_voice):
                         
             else:
                 # 使用 cosyvoice-v2 模型（原有的流式调用）
+                load_dashscope()
+                from dashscope.audio.tts_v2 import AudioFormat, SpeechSynthesizer
+
                 callback = TTSCallback()
                 
                 synthesizer = SpeechSynthesizer(
@@ -497,12 +604,13 @@ def tts_worker(selected_voice):
                     callback=callback,
                 )
                 
-                # 执行语音合成
+                # 执行语音合成，数据边到达边播放
                 synthesizer.streaming_call(response_text)
                 synthesizer.streaming_complete()
-                
-                # 等待一段时间确保TTS完成
-                time.sleep(2.0)
+
+                # 等待剩余音频播放完毕
+                if not callback.wait(timeout=60):
+                    print(f"语音播放未完成: {callback.error or '等待超时'}")
             
         except queue.Empty:
             continue
@@ -526,6 +634,9 @@ def select_asr_model():
 
 def create_asr_recognizer(model_config):
     """根据模型配置创建ASR识别器"""
+    load_dashscope()
+    from dashscope.audio.asr import Recognition, TranslationRecognizerChat
+
     if model_config["type"] == "translation":
         # 使用TranslationRecognizerChat (gummy-chat-v1)
         callback = ASRCallbackTranslation()
@@ -552,6 +663,9 @@ def create_asr_recognizer(model_config):
 def main():
     """主函数"""
     print("=== 阿里云百炼 ASR+LLM+TTS 打通测试 ===")
+
+    # 用户选择模型期间在后台加载 SDK
+    threading.Thread(target=preload_sdks, daemon=True).start()
     
     # 选择ASR模型
     selected_model = select_asr_model()
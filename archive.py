@@ -0,0 +1,365 @@
+# -- coding: utf-8 --
+"""
+会话音频归档：把上行输入音频与 response.audio.delta 下行音频写入预分配的内存映射分段文件。
+
+归档目录结构:
+    index.bin       文件头 MAGIC + <I 上行采样率> <I 下行采样率> <I 分段字节数> <d 开始时的墙钟时间>，
+                    之后是定长索引记录 <q 单调时钟纳秒偏移> <B 流> <B 标记> <H 分段号> <I 偏移> <I 长度> <I 轮次>
+    seg_00000.pcm   预分配 segment_bytes 字节并 mmap 写入，写满后截断到实际长度并切换到下一个分段
+
+流为 0（上行）、1（下行）或 2（事件边界，长度为 0，标记见 MARKERS）。轮次由写入端根据
+speech_started / response.created / response.done 划分：一轮从上一轮回复结束后的第一帧上行音频
+（或打断时的 speech_started）开始，到本轮回复结束为止。
+
+写入方法只在调用线程打时间戳并入队，mmap 拷贝、分段预分配与索引写入都在后台线程完成，
+不会阻塞事件循环；积压超过 max_pending_bytes 时丢弃新数据并计数。读取端只加载索引，
+音频按需从 mmap 切片，不会整文件读入。
+
+运行方式:
+    python archive.py 归档目录 [--turn 轮次 --out 输出前缀]
+"""
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+import wave
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"OAAI\x01"
+_INDEX_HEADER = struct.Struct("<IIId")
+_RECORD = struct.Struct("<qBBHIII")
+_RECORD_DTYPE = np.dtype([
+    ("t", "<i8"), ("stream", "u1"), ("marker", "u1"), ("segment", "<u2"),
+    ("offset", "<u4"), ("length", "<u4"), ("turn", "<u4"),
+])
+
+INDEX_FILE = "index.bin"
+SEGMENT_FILE = "seg_{:05d}.pcm"
+
+STREAM_INPUT = 0
+STREAM_OUTPUT = 1
+STREAM_EVENT = 2
+
+# 服务端事件类型 -> 边界标记
+MARKERS = {
+    "turn_start": 1,
+    "input_audio_buffer.speech_started": 2,
+    "input_audio_buffer.speech_stopped": 3,
+    "input_audio_buffer.committed": 4,
+    "response.created": 5,
+    "response.audio.done": 6,
+    "response.done": 7,
+}
+MARKER_NAMES = {code: name for name, code in MARKERS.items()}
+
+
+class AudioArchive:
+    """
+    只追加的会话音频归档写入端。写入方法须在同一线程（通常是事件循环线程）中调用。
+
+    属性说明:
+        directory (str): 归档目录，不能已包含归档。
+        input_rate (int): 上行音频采样率。
+        output_rate (int): 下行音频采样率。
+        segment_bytes (int): 每个分段文件预分配的字节数。
+        max_pending_bytes (int): 后台线程尚未写出的最大积压，超出时丢弃新数据。
+        turn (int): 当前轮次。
+        written_bytes (int): 已写入分段的音频字节数。
+        dropped_bytes (int): 因积压过高而丢弃的音频字节数。
+        segments (int): 已创建的分段数。
+    """
+    def __init__(
+        self,
+        directory: str,
+        input_rate: int = 16000,
+        output_rate: int = 24000,
+        segment_bytes: int = 32 * 1024 * 1024,
+        max_pending_bytes: int = 8 * 1024 * 1024,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            raise FileExistsError(f"Archive already exists: {directory}")
+        self.directory = directory
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.segment_bytes = segment_bytes
+        self.max_pending_bytes = max_pending_bytes
+        self.turn = 0
+        self.written_bytes = 0
+        self.dropped_bytes = 0
+        self.segments = 0
+
+        self._index = open(index_path, "wb")
+        self._index.write(MAGIC + _INDEX_HEADER.pack(input_rate, output_rate, segment_bytes, time.time()))
+        self._start_ns = time.monotonic_ns()
+        # 轮次划分状态，只在调用线程中读写
+        self._responded = False
+        self._open_responses = 0
+
+        # 后台写入状态，只在写入线程中读写
+        self._segment_file = None
+        self._segment_map: Optional[mmap.mmap] = None
+        self._segment_used = 0
+
+        self._queue: Deque[Optional[Tuple[int, int, int, int, bytes]]] = deque()
+        self._pending_bytes = 0
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="audio-archive", daemon=True)
+        self._thread.start()
+
+    def write_input(self, pcm: bytes) -> None:
+        """追加一块上行音频。上一轮回复已结束时，这一块开始新的一轮。"""
+        if self._responded and self._open_responses == 0:
+            self._next_turn()
+        self._put(STREAM_INPUT, 0, pcm)
+
+    def write_output(self, pcm: bytes) -> None:
+        """追加一块下行音频（解码后的 response.audio.delta）。"""
+        self._put(STREAM_OUTPUT, 0, pcm)
+
+    def mark(self, event_type: str) -> None:
+        """记录一个服务端事件边界；不在 MARKERS 中的事件类型直接忽略。"""
+        marker = MARKERS.get(event_type)
+        if marker is None:
+            return
+        if event_type == "input_audio_buffer.speech_started" and self._responded:
+            # 打断：本轮已有回复，用户再次开口即开始新的一轮
+            self._next_turn()
+        elif event_type == "response.created":
+            self._responded = True
+            self._open_responses += 1
+        elif event_type == "response.done":
+            self._open_responses = max(0, self._open_responses - 1)
+        self._put(STREAM_EVENT, marker, b"")
+
+    def _next_turn(self) -> None:
+        self.turn += 1
+        self._responded = False
+        self._put(STREAM_EVENT, MARKERS["turn_start"], b"")
+
+    def _put(self, stream: int, marker: int, data: bytes) -> None:
+        if self._closed:
+            return
+        size = len(data)
+        if size:
+            with self._pending_lock:
+                if self._pending_bytes + size > self.max_pending_bytes:
+                    self.dropped_bytes += size
+                    return
+                self._pending_bytes += size
+        self._queue.append((time.monotonic_ns() - self._start_ns, stream, marker, self.turn, bytes(data)))
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                item = self._queue.popleft()
+                if item is None:
+                    self._finish()
+                    return
+                try:
+                    self._write(*item)
+                except Exception as e:
+                    print(f"音频归档写入失败: {e}")
+                if item[4]:
+                    with self._pending_lock:
+                        self._pending_bytes -= len(item[4])
+            self._index.flush()
+
+    def _write(self, timestamp_ns: int, stream: int, marker: int, turn: int, data: bytes) -> None:
+        if not data:
+            self._index.write(_RECORD.pack(timestamp_ns, stream, marker, 0, 0, 0, turn))
+            return
+        view = memoryview(data)
+        while view:
+            if self._segment_map is None or self._segment_used == self.segment_bytes:
+                self._open_segment()
+            size = min(len(view), self.segment_bytes - self._segment_used)
+            offset = self._segment_used
+            self._segment_map[offset:offset + size] = view[:size]
+            self._segment_used += size
+            self.written_bytes += size
+            self._index.write(_RECORD.pack(timestamp_ns, stream, marker, self.segments - 1, offset, size, turn))
+            view = view[size:]
+
+    def _open_segment(self) -> None:
+        self._close_segment()
+        path = os.path.join(self.directory, SEGMENT_FILE.format(self.segments))
+        self._segment_file = open(path, "w+b")
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(self._segment_file.fileno(), 0, self.segment_bytes)
+        else:
+            self._segment_file.truncate(self.segment_bytes)
+        self._segment_map = mmap.mmap(self._segment_file.fileno(), self.segment_bytes)
+        self._segment_used = 0
+        self.segments += 1
+
+    def _close_segment(self) -> None:
+        """关闭当前分段，并把预分配的空间截断到实际写入的长度。"""
+        if self._segment_map is None:
+            return
+        self._segment_map.close()
+        self._segment_file.truncate(self._segment_used)
+        self._segment_file.close()
+        self._segment_map = None
+        self._segment_file = None
+
+    def _finish(self) -> None:
+        self._close_segment()
+        self._index.close()
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """写完已入队的数据后关闭分段与索引。"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.append(None)
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "turns": self.turn + 1,
+            "segments": self.segments,
+            "written_bytes": self.written_bytes,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+
+class TurnInfo(NamedTuple):
+    """归档中一轮对话的概要。时间为相对归档开始的纳秒数。"""
+    turn: int
+    start_ns: int
+    end_ns: int
+    input_ms: float
+    output_ms: float
+    markers: Dict[str, int]
+
+
+class ArchiveReader:
+    """
+    归档读取端：索引整体载入为 NumPy 结构化数组，音频按需从只读 mmap 中切片。
+
+    属性说明:
+        directory (str): 归档目录。
+        input_rate (int) / output_rate (int): 上行与下行采样率。
+        started_at (float): 归档开始时的墙钟时间（time.time）。
+        records (np.ndarray): 索引记录，字段为 t / stream / marker / segment / offset / length / turn。
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE), "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not an audio archive: {directory}")
+            self.input_rate, self.output_rate, self.segment_bytes, self.started_at = \
+                _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+            data = f.read()
+        # 写入进程被中断时最后一条记录可能不完整
+        usable = len(data) - len(data) % _RECORD.size
+        self.records = np.frombuffer(data[:usable], dtype=_RECORD_DTYPE)
+        self._maps: Dict[int, Tuple[object, mmap.mmap]] = {}
+
+    def _segment(self, number: int) -> mmap.mmap:
+        if number not in self._maps:
+            f = open(os.path.join(self.directory, SEGMENT_FILE.format(number)), "rb")
+            self._maps[number] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._maps[number][1]
+
+    def turns(self) -> List[TurnInfo]:
+        """按轮次汇总时间范围、音频时长与各事件边界首次出现的时间。"""
+        result = []
+        for turn in np.unique(self.records["turn"]):
+            rows = self.records[self.records["turn"] == turn]
+            input_bytes = int(rows["length"][rows["stream"] == STREAM_INPUT].sum())
+            output_bytes = int(rows["length"][rows["stream"] == STREAM_OUTPUT].sum())
+            markers: Dict[str, int] = {}
+            for row in rows[rows["stream"] == STREAM_EVENT]:
+                markers.setdefault(MARKER_NAMES.get(int(row["marker"]), str(row["marker"])), int(row["t"]))
+            result.append(TurnInfo(
+                int(turn),
+                int(rows["t"].min()),
+                int(rows["t"].max()),
+                input_bytes * 500 / self.input_rate,
+                output_bytes * 500 / self.output_rate,
+                markers,
+            ))
+        return result
+
+    def read(
+        self,
+        stream: int,
+        turn: Optional[int] = None,
+        start_ns: Optional[int] = None,
+        end_ns: Optional[int] = None,
+    ) -> bytes:
+        """取出某一路音频，可按轮次和/或时间范围 [start_ns, end_ns) 过滤。"""
+        mask = self.records["stream"] == stream
+        if turn is not None:
+            mask &= self.records["turn"] == turn
+        if start_ns is not None:
+            mask &= self.records["t"] >= start_ns
+        if end_ns is not None:
+            mask &= self.records["t"] < end_ns
+        out = bytearray()
+        for row in self.records[mask]:
+            offset = int(row["offset"])
+            out += self._segment(int(row["segment"]))[offset:offset + int(row["length"])]
+        return bytes(out)
+
+    def read_turn(self, turn: int) -> Tuple[bytes, bytes]:
+        """返回某一轮的 (上行音频, 下行音频)。"""
+        return self.read(STREAM_INPUT, turn), self.read(STREAM_OUTPUT, turn)
+
+    def close(self) -> None:
+        for f, segment_map in self._maps.values():
+            segment_map.close()
+            f.close()
+        self._maps.clear()
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _write_wav(path: str, pcm: bytes, rate: int) -> None:
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+
+
+def _main(args) -> None:
+    with ArchiveReader(args.directory) as reader:
+        if args.turn is None:
+            print(f"{'轮次':>4} {'开始(s)':>8} {'结束(s)':>8} {'上行(ms)':>9} {'下行(ms)':>9}  事件")
+            for info in reader.turns():
+                print(f"{info.turn:>4} {info.start_ns / 1e9:>8.2f} {info.end_ns / 1e9:>8.2f} "
+                      f"{info.input_ms:>9.0f} {info.output_ms:>9.0f}  {', '.join(info.markers)}")
+            return
+        input_pcm, output_pcm = reader.read_turn(args.turn)
+        prefix = args.out or os.path.join(args.directory, f"turn_{args.turn:04d}")
+        _write_wav(prefix + "_in.wav", input_pcm, reader.input_rate)
+        _write_wav(prefix + "_out.wav", output_pcm, reader.output_rate)
+        print(f"已导出 {prefix}_in.wav 与 {prefix}_out.wav")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查看或导出会话音频归档")
+    parser.add_argument("directory")
+    parser.add_argument("--turn", type=int, default=None, help="导出该轮的上行与下行音频为 WAV")
+    parser.add_argument("--out", default=None, help="输出文件前缀")
+    _main(parser.parse_args())
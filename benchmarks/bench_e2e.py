@@ -0,0 +1,151 @@
+# -- coding: utf-8 --
+"""
+端到端延迟基准：在本地模拟服务器上并发运行 1..N 路会话，统计
+会话建立耗时（connect 开始到收到 session.updated）、首个音频增量延迟
+（发出 response.create 到收到第一个 response.audio.delta）以及打断到取消确认耗时
+（发出 response.cancel 到收到 response.done）的 p50/p95/p99。
+
+运行方式:
+    python benchmarks/bench_e2e.py [--sessions 1 10 50] [--turns 3] [--jitter-ms 20]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_server import MockRealtimeServer, MockScript  # noqa: E402
+from omni import OmniRealtimeClient, TurnDetectionMode  # noqa: E402
+from recorder import RecordingSocket  # noqa: E402
+
+RATE = 16000
+CHUNK = RATE // 10  # 100ms 上行块
+_TYPE_RE = re.compile(r'"type"\s*:\s*"([^"]+)"')
+
+
+class TimingProbe:
+    """
+    以 recorder 接口接入客户端，记录关心的事件首次出现的单调时间。
+    wrap() 在客户端建立连接时被调用。
+    """
+    def __init__(self):
+        self.marks: Dict[str, float] = {}
+        self._waiters: Dict[str, asyncio.Event] = {}
+
+    def reset(self, *event_types: str) -> None:
+        for event_type in event_types:
+            self.marks.pop(event_type, None)
+            self._waiters.setdefault(event_type, asyncio.Event()).clear()
+
+    async def wait(self, event_type: str) -> float:
+        await self._waiters.setdefault(event_type, asyncio.Event()).wait()
+        return self.marks[event_type]
+
+    def record(self, message, received: bool) -> None:
+        head = message[:96] if isinstance(message, str) else bytes(message[:96]).decode(errors="ignore")
+        match = _TYPE_RE.search(head)
+        if not match:
+            return
+        key = ("recv:" if received else "send:") + match.group(1)
+        if key not in self.marks:
+            self.marks[key] = time.perf_counter()
+            waiter = self._waiters.get(key)
+            if waiter:
+                waiter.set()
+
+    def wrap(self, ws):
+        return RecordingSocket(ws, self)
+
+    def flush(self) -> None:
+        pass
+
+
+async def run_session(server_url: str, turns: int, interrupt_after_ms: float) -> Dict[str, List[float]]:
+    probe = TimingProbe()
+    client = OmniRealtimeClient(
+        base_url=server_url,
+        turn_detection_mode=TurnDetectionMode.MANUAL,
+        input_sample_rate=RATE,
+        recorder=probe,
+        auto_reconnect=False,
+    )
+    results: Dict[str, List[float]] = {"setup": [], "first_delta": [], "interrupt_cancel": []}
+
+    probe.reset("recv:session.updated")
+    start = time.perf_counter()
+    await client.connect()
+    receiver = asyncio.create_task(client.handle_messages())
+    results["setup"].append(await probe.wait("recv:session.updated") - start)
+
+    silence = b"\x00\x00" * CHUNK
+    try:
+        for _ in range(turns):
+            for _ in range(5):
+                await client.stream_audio(silence)
+            await client.commit_audio_buffer()
+
+            probe.reset("send:response.create", "recv:response.audio.delta", "send:response.cancel", "recv:response.done")
+            await client.create_response()
+            first_delta = await probe.wait("recv:response.audio.delta")
+            results["first_delta"].append(first_delta - probe.marks["send:response.create"])
+
+            await asyncio.sleep(interrupt_after_ms / 1000)
+            await client.handle_interruption()
+            done = await probe.wait("recv:response.done")
+            cancel_sent = probe.marks.get("send:response.cancel")
+            if cancel_sent is not None:
+                results["interrupt_cancel"].append(done - cancel_sent)
+    finally:
+        receiver.cancel()
+        await client.close()
+    return results
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def main(args) -> None:
+    script = MockScript(
+        first_delta_ms=args.first_delta_ms,
+        jitter_ms=args.jitter_ms,
+        input_sample_rate=RATE,
+    )
+    async with MockRealtimeServer(script) as server:
+        print(f"{'会话数':>6} {'指标':<18} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'样本':>6}")
+        for sessions in args.sessions:
+            merged: Dict[str, List[float]] = {"setup": [], "first_delta": [], "interrupt_cancel": []}
+            # 客户端的控制事件日志会淹没结果，这里丢弃
+            with contextlib.redirect_stdout(io.StringIO()):
+                all_results = await asyncio.gather(*(
+                    run_session(server.url, args.turns, args.interrupt_after_ms) for _ in range(sessions)
+                ))
+            for result in all_results:
+                for key, values in result.items():
+                    merged[key].extend(values)
+            for key, values in merged.items():
+                # 没有样本的指标（如全部连接失败）以 - 占位
+                cells = [f"{p * 1000:>9.1f}" if p is not None else f"{'-':>9}"
+                         for p in (percentile(values, q) for q in (50, 95, 99))]
+                print(f"{sessions:>6} {key:<18} {' '.join(cells)} {len(values):>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地端到端延迟基准")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--first-delta-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--interrupt-after-ms", type=float, default=200)
+    asyncio.run(main(parser.parse_args()))
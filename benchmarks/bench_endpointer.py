@@ -0,0 +1,141 @@
+# -- coding: utf-8 --
+"""
+客户端端点检测基准：合成一段含短指令与带句中停顿长句的采集音频，逐块送入 Endpointer，
+统计每句从真实说完到提交（commit + response.create）的等待时长，以及在句中停顿处提前提交的次数。
+固定窗口 900ms 对应服务端 VAD 的 silence_duration_ms，与自适应窗口对比。
+
+合成语音为带谐波与音节包络的浊音信号，能被 webrtcvad 判为语音；句间为低电平噪声。
+
+运行方式:
+    python benchmarks/bench_endpointer.py [--utterances 60] [--chunk-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from endpointer import Endpointer  # noqa: E402
+
+RATE = 16000
+
+
+def voiced(ms: int, rng: np.random.Generator) -> np.ndarray:
+    t = np.arange(RATE * ms // 1000) / RATE
+    f0 = rng.uniform(110, 220) + 15 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / RATE
+    signal = sum(np.sin(k * phase) / k for k in range(1, 15))
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * rng.uniform(3, 5) * t)
+    # 句尾 200ms 音量回落
+    fade = np.minimum(1.0, (len(t) - np.arange(len(t))) / (RATE * 0.2)) * 0.7 + 0.3
+    return signal * envelope * fade * 4000
+
+
+def noise(ms: int, rng: np.random.Generator) -> np.ndarray:
+    return rng.standard_normal(RATE * ms // 1000) * 30
+
+
+def build_session(count: int, seed: int = 0) -> Tuple[np.ndarray, List[Tuple[float, float, List[Tuple[float, float]]]]]:
+    """返回 (音频, [(开始ms, 结束ms, [句中停顿区间])])；短指令与带停顿的长句交替出现。"""
+    rng = np.random.default_rng(seed)
+    parts = [noise(1000, rng)]
+    cursor = 1000.0
+    truth = []
+    for i in range(count):
+        start = cursor
+        pauses = []
+        if i % 2 == 0:
+            ms = int(rng.uniform(600, 1100))
+            parts.append(voiced(ms, rng))
+            cursor += ms
+        else:
+            for j in range(int(rng.integers(2, 4))):
+                if j:
+                    pause = int(rng.uniform(150, 400))
+                    parts.append(noise(pause, rng))
+                    pauses.append((cursor, cursor + pause))
+                    cursor += pause
+                ms = int(rng.uniform(700, 1500))
+                parts.append(voiced(ms, rng))
+                cursor += ms
+        truth.append((start, cursor, pauses))
+        gap = int(rng.uniform(2500, 4000))
+        parts.append(noise(gap, rng))
+        cursor += gap
+    return np.concatenate(parts).astype(np.int16), truth
+
+
+class RecordingClient:
+    """记录提交时刻（按已送入的音频时长计）的客户端替身。"""
+    def __init__(self):
+        self.fed_ms = 0.0
+        self.commits: List[float] = []
+
+    async def user_speech_started(self) -> None:
+        pass
+
+    async def commit_audio_buffer(self) -> None:
+        self.commits.append(self.fed_ms)
+
+    async def create_response(self) -> None:
+        pass
+
+    async def clear_audio_buffer(self) -> None:
+        pass
+
+
+async def run(audio: np.ndarray, truth, chunk_ms: int, **kwargs) -> Dict[str, float]:
+    client = RecordingClient()
+    endpointer = Endpointer(client, rate=RATE, **kwargs)
+    step = RATE * chunk_ms // 1000
+    for i in range(0, len(audio), step):
+        client.fed_ms += chunk_ms
+        await endpointer.process(audio[i:i + step].tobytes())
+
+    waits, short_waits, long_waits, early, missed = [], [], [], 0, 0
+    commits = list(client.commits)
+    for start, end, pauses in truth:
+        inside = [c for c in commits if start < c <= end]
+        early += len(inside)
+        after = [c for c in commits if end < c <= end + 2000]
+        if after:
+            waits.append(after[0] - end)
+            (long_waits if pauses else short_waits).append(after[0] - end)
+        else:
+            missed += 1
+    return {
+        "mean": statistics.mean(waits) if waits else float("nan"),
+        "p90": float(np.percentile(waits, 90)) if waits else float("nan"),
+        "short": statistics.mean(short_waits) if short_waits else float("nan"),
+        "long": statistics.mean(long_waits) if long_waits else float("nan"),
+        "early": early,
+        "missed": missed,
+    }
+
+
+async def main(args) -> None:
+    audio, truth = build_session(args.utterances)
+    configs = (
+        ("固定 900ms（服务端 VAD）", dict(min_silence_ms=900, max_silence_ms=900)),
+        ("固定 500ms", dict(min_silence_ms=500, max_silence_ms=500)),
+        ("自适应", {}),
+    )
+    print(f"{len(truth)} 句（短指令与带句中停顿的长句各半），采集块 {args.chunk_ms} ms")
+    print(f"{'窗口':<22} {'平均等待(ms)':>12} {'p90(ms)':>8} {'短指令(ms)':>10} {'长句(ms)':>8} "
+          f"{'句中提前提交':>12} {'漏提交':>6}")
+    for name, kwargs in configs:
+        result = await run(audio, truth, args.chunk_ms, **kwargs)
+        print(f"{name:<22} {result['mean']:>12.0f} {result['p90']:>8.0f} {result['short']:>10.0f} "
+              f"{result['long']:>8.0f} {result['early']:>12} {result['missed']:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="客户端端点检测的等待时长与误切")
+    parser.add_argument("--utterances", type=int, default=60)
+    parser.add_argument("--chunk-ms", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+# -- coding: utf-8 --
+"""
+弱网模态自适应基准：模拟服务器的下行带宽按 好 -> 差 -> 好 三个阶段变化，每阶段若干轮手动模式对话，
+对比启用与不启用 LinkQualityMonitor 时每个阶段的下行字节数与回复下发完成耗时，
+并把 LinkQualityMonitor 估算的节省量与两次运行的实测差值对照。
+
+运行方式:
+    python benchmarks/bench_link_quality.py [--turns 8] [--bad-kbps 300] [--response-ms 2000]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from link_monitor import LinkQualityMonitor  # noqa: E402
+from mock_server import MockRealtimeServer, MockScript  # noqa: E402
+from omni import OmniRealtimeClient  # noqa: E402
+
+
+async def run(args, adaptive: bool) -> Tuple[Dict[str, Dict[str, float]], Optional[LinkQualityMonitor]]:
+    script = MockScript(setup_delay_ms=10, first_delta_ms=100, response_ms=args.response_ms)
+    done = asyncio.Event()
+    phases = (("好", 0), ("差", args.bad_kbps), ("恢复", 0))
+    results: Dict[str, Dict[str, float]] = {}
+    async with MockRealtimeServer(script) as server:
+        client = OmniRealtimeClient(
+            base_url=server.url,
+            auto_reconnect=False,
+            extra_event_handlers={
+                "response.audio.done": lambda event: done.set(),
+                "response.text.done": lambda event: done.set(),
+            },
+        )
+        monitor = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            await client.connect()
+            receiver = asyncio.create_task(client.handle_messages())
+            await client.session_updated.wait()
+            if adaptive:
+                monitor = LinkQualityMonitor(client, interval=0.5, recover_after=3.0)
+                monitor.start()
+            for name, kbps in phases:
+                script.downlink_kbps = kbps
+                start_bytes = client.downlink_bytes
+                durations: List[float] = []
+                for _ in range(args.turns):
+                    done.clear()
+                    start = time.perf_counter()
+                    await client.stream_audio(bytes(3200))
+                    await client.commit_audio_buffer()
+                    await client.create_response()
+                    await done.wait()
+                    durations.append(time.perf_counter() - start)
+                    await asyncio.sleep(0.3)
+                results[name] = {
+                    "kbytes": (client.downlink_bytes - start_bytes) / 1000,
+                    "seconds": statistics.mean(durations),
+                }
+            if monitor:
+                await monitor.stop()
+            receiver.cancel()
+            await client.close()
+    return results, monitor
+
+
+async def main(args) -> None:
+    baseline, _ = await run(args, adaptive=False)
+    adaptive, monitor = await run(args, adaptive=True)
+
+    print(f"每阶段 {args.turns} 轮，每次回复 {args.response_ms} ms 音频，差链路下行 {args.bad_kbps:.0f} kbps")
+    print(f"{'阶段':<4} {'固定模态 下行(KB)':>16} {'下发耗时(s)':>10} {'自适应 下行(KB)':>15} {'下发耗时(s)':>10}")
+    for name in baseline:
+        a, b = baseline[name], adaptive[name]
+        print(f"{name:<4} {a['kbytes']:>16.1f} {a['seconds']:>10.2f} {b['kbytes']:>15.1f} {b['seconds']:>10.2f}")
+    measured = sum(v["kbytes"] for v in baseline.values()) - sum(v["kbytes"] for v in adaptive.values())
+    stats = monitor.stats()
+    print(f"模态切换 {stats['switches']} 次；下行实测节省 {measured:.1f} KB，"
+          f"监测器估算节省 {stats['estimated_saved_bytes'] / 1000:.1f} KB"
+          f"（每字音频 {monitor.audio_bytes_per_char:.0f} B）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="弱网下输出模态自适应的下行字节与耗时")
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--bad-kbps", type=float, default=300)
+    parser.add_argument("--response-ms", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,135 @@
+# -- coding: utf-8 --
+"""
+接收侧事件分发基准：回放一段合成的长回复（音频增量 + 转录增量），对比旧的
+json.loads + 打印 + if/elif 链与 OmniRealtimeClient.handle_messages 的
+每秒输出音频所消耗的 CPU 时间。
+
+运行方式:
+    python benchmarks/bench_receive.py [回复秒数]
+"""
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from omni import OmniRealtimeClient  # noqa: E402
+
+RATE = 24000
+DELTA_SAMPLES = 2400  # 每个音频增量 100ms
+
+
+class ReplaySocket:
+    """按顺序吐出预先生成的服务端消息。"""
+    def __init__(self, messages):
+        self._messages = messages
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for message in self._messages:
+            yield message
+
+
+def build_messages(seconds: int):
+    """生成一段 seconds 秒的回复：每个音频增量后跟一个转录增量。"""
+    audio_b64 = base64.b64encode(os.urandom(DELTA_SAMPLES * 2)).decode()
+    messages = [json.dumps({"type": "response.created", "event_id": "event_0", "response": {"id": "resp_1"}})]
+    for i in range(seconds * RATE // DELTA_SAMPLES):
+        messages.append(json.dumps({
+            "type": "response.audio.delta",
+            "event_id": f"event_{2 * i + 1}",
+            "response_id": "resp_1",
+            "item_id": "item_1",
+            "output_index": 0,
+            "content_index": 0,
+            "delta": audio_b64,
+        }))
+        messages.append(json.dumps({
+            "type": "response.audio_transcript.delta",
+            "event_id": f"event_{2 * i + 2}",
+            "response_id": "resp_1",
+            "item_id": "item_1",
+            "output_index": 0,
+            "content_index": 0,
+            "delta": "好",
+        }))
+    messages.append(json.dumps({"type": "response.done", "event_id": "event_end", "response": {"id": "resp_1"}}))
+    return messages
+
+
+async def legacy_handle_messages(client: OmniRealtimeClient) -> None:
+    """基线 handle_messages 中与本基准相关的分支。"""
+    async for message in client.ws:
+        event = json.loads(message)
+        event_type = event.get("type")
+
+        if event_type != "response.audio.delta":
+            print(" event: ", event)
+        else:
+            print(" event_type: ", event_type)
+
+        if event_type == "error":
+            continue
+        elif event_type == "response.created":
+            client._current_response_id = event.get("response", {}).get("id")
+            client._is_responding = True
+        elif event_type == "response.output_item.added":
+            client._current_item_id = event.get("item", {}).get("id")
+        elif event_type == "response.done":
+            client._is_responding = False
+        elif event_type == "input_audio_buffer.speech_started":
+            pass
+        elif event_type == "input_audio_buffer.speech_stopped":
+            pass
+        elif event_type == "response.text.delta":
+            pass
+        elif event_type == "response.audio.delta":
+            if client.on_audio_delta:
+                client.on_audio_delta(base64.b64decode(event["delta"]))
+        elif event_type == "conversation.item.input_audio_transcription.completed":
+            pass
+        elif event_type == "response.audio_transcript.delta":
+            pass
+        elif event_type == "response.audio_transcript.done":
+            pass
+
+
+def make_client(messages):
+    received = []
+    client = OmniRealtimeClient(base_url="ws://localhost", on_audio_delta=received.append, auto_reconnect=False)
+    client.ws = ReplaySocket(messages)
+    return client, received
+
+
+async def run(name: str, handler, messages, seconds: int):
+    client, received = make_client(messages)
+    cpu_start = time.process_time()
+    await handler(client)
+    cpu = time.process_time() - cpu_start
+    audio_seconds = sum(len(chunk) for chunk in received) / 2 / RATE
+    assert abs(audio_seconds - seconds) < 0.2, audio_seconds
+    return name, cpu * 1000 / audio_seconds
+
+
+async def main(seconds: int) -> None:
+    messages = build_messages(seconds)
+    results = []
+    # 旧路径每个事件都会打印，这里把输出丢弃，只保留格式化开销
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results.append(await run("legacy if/elif", legacy_handle_messages, messages, seconds))
+    results.append(await run("handle_messages", OmniRealtimeClient.handle_messages, messages, seconds))
+
+    print(f"{len(messages)} 条消息，{seconds} 秒输出音频，增量 {DELTA_SAMPLES * 1000 // RATE} ms")
+    print(f"{'路径':<20} {'CPU(ms/秒音频)':>14}")
+    for name, cpu_ms in results:
+        print(f"{name:<20} {cpu_ms:>14.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300))
@@ -0,0 +1,68 @@
+# -- coding: utf-8 --
+"""
+流式重采样吞吐基准：对常见的设备/服务商采样率组合，按实时采集的块大小逐块处理，
+统计每块耗时与相对实时的倍数，并与逐块 np.interp 线性插值（无抗混叠滤波）对比。
+
+运行方式:
+    python benchmarks/bench_resample.py [--seconds 60] [--chunk-ms 20 100]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resampler import StreamingResampler  # noqa: E402
+
+PAIRS = (
+    (24000, 16000),  # VAD.py 设备采样率 -> Realtime API 上行
+    (48000, 16000),  # 车机常见原生采样率 -> 识别服务
+    (16000, 24000),
+    (22050, 24000),  # cosyvoice 输出 -> 播放设备
+    (24000, 48000),
+)
+
+
+def interp_chunk(chunk: np.ndarray, in_rate: int, out_rate: int) -> bytes:
+    n_out = len(chunk) * out_rate // in_rate
+    positions = np.arange(n_out) * (in_rate / out_rate)
+    return np.interp(positions, np.arange(len(chunk)), chunk).astype(np.int16).tobytes()
+
+
+def run(in_rate: int, out_rate: int, seconds: float, chunk_ms: int):
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(int(in_rate * seconds)) * 3000).astype(np.int16)
+    step = in_rate * chunk_ms // 1000
+    chunks = [audio[i:i + step] for i in range(0, len(audio), step)]
+    pcm_chunks = [chunk.tobytes() for chunk in chunks]
+
+    resampler = StreamingResampler(in_rate, out_rate)
+    start = time.perf_counter()
+    for pcm in pcm_chunks:
+        resampler.process(pcm)
+    polyphase = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for chunk in chunks:
+        interp_chunk(chunk, in_rate, out_rate)
+    linear = time.perf_counter() - start
+    return len(chunks), polyphase, linear
+
+
+def main(args) -> None:
+    print(f"{'转换':<14} {'块(ms)':>6} {'多相 µs/块':>11} {'实时倍数':>10} {'插值 µs/块':>11}")
+    for chunk_ms in args.chunk_ms:
+        for in_rate, out_rate in PAIRS:
+            count, polyphase, linear = run(in_rate, out_rate, args.seconds, chunk_ms)
+            print(f"{in_rate:>5}->{out_rate:<7} {chunk_ms:>6} {polyphase / count * 1e6:>11.1f} "
+                  f"{args.seconds / polyphase:>9.0f}x {linear / count * 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式重采样吞吐基准")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--chunk-ms", type=int, nargs="+", default=[20, 100])
+    main(parser.parse_args())
@@ -0,0 +1,90 @@
+# -- coding: utf-8 --
+"""
+冷启动基准：在全新的解释器进程中测量各入口模块的导入耗时，以及从进程启动到
+会话就绪（本地模拟服务器回复 session.updated）的耗时，取多次运行的中位数。
+
+运行方式:
+    python benchmarks/bench_startup.py [--runs 5] [--modules omni VAD aliyun session_manager]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_server import MockRealtimeServer, MockScript  # noqa: E402
+
+# 子进程脚本：导入模块后可选地连接到 argv[2] 并等待 session.updated
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import importlib
+module = importlib.import_module(sys.argv[1])
+t_import = time.perf_counter()
+result = {"import_ms": (t_import - t0) * 1000}
+if len(sys.argv) > 2:
+    import asyncio
+    from omni import OmniRealtimeClient
+
+    async def ready():
+        updated = asyncio.Event()
+        client = OmniRealtimeClient(
+            base_url=sys.argv[2],
+            extra_event_handlers={"session.updated": lambda event: updated.set()},
+            auto_reconnect=False,
+        )
+        await client.connect()
+        receiver = asyncio.create_task(client.handle_messages())
+        await updated.wait()
+        result["ready_ms"] = (time.perf_counter() - t0) * 1000
+        receiver.cancel()
+        await client.close()
+
+    import contextlib, io
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(ready())
+print(json.dumps(result))
+"""
+
+
+async def probe(module: str, server_url: Optional[str]) -> Dict[str, float]:
+    args = [sys.executable, "-c", _PROBE, module] + ([server_url] if server_url else [])
+    process = await asyncio.create_subprocess_exec(
+        *args, cwd=ROOT, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode(errors="ignore").strip().splitlines()[-1])
+    return json.loads(stdout.decode().strip().splitlines()[-1])
+
+
+async def main(args) -> None:
+    # 建立连接本身不是这里关心的，服务器立即回复 session.updated
+    async with MockRealtimeServer(MockScript(setup_delay_ms=0)) as server:
+        print(f"{'模块':<18} {'导入(ms)':>10} {'就绪(ms)':>10}")
+        for module in args.modules:
+            imports: List[float] = []
+            readies: List[float] = []
+            try:
+                for _ in range(args.runs):
+                    result = await probe(module, server.url if module == "omni" else None)
+                    imports.append(result["import_ms"])
+                    if "ready_ms" in result:
+                        readies.append(result["ready_ms"])
+            except RuntimeError as e:
+                print(f"{module:<18} 导入失败: {e}")
+                continue
+            ready = f"{statistics.median(readies):>10.1f}" if readies else f"{'-':>10}"
+            print(f"{module:<18} {statistics.median(imports):>10.1f} {ready}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="冷启动导入与就绪耗时基准")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=["omni", "VAD", "aliyun", "session_manager"])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+# -- coding: utf-8 --
+"""
+打断截断基准：在本地模拟服务器上以 server_vad 模式跑一段长会话，用户不断开口，
+其中一部分回复在播放途中被打断，对比打断时发送与不发送 conversation.item.truncate 时
+服务端对话上下文（音频时长与文本字数）随轮次的增长。
+
+分两种情形：服务端以 4 倍实时下发，打断时回复多半仍在下发；以 --fast-stream 倍实时下发，
+打断前已收到 response.done，回复只是还在播放。
+
+播放端为按墙钟推进的模拟播放器，不需要声卡。整个会话按 --time-scale 倍速运行：
+上行音频、播放与服务端回复节奏同比例加快，各事件的相对时序不变。
+
+运行方式:
+    python benchmarks/bench_truncate.py [--turns 40] [--barge-in-every 3] [--time-scale 5]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_server import MockRealtimeServer, MockScript  # noqa: E402
+from omni import OmniRealtimeClient, TurnDetectionMode  # noqa: E402
+
+OUTPUT_RATE = 24000
+CHUNK_MS = 100
+
+
+class SimulatedPlayer:
+    """按墙钟以 speed 倍速消耗已写入音频的播放器替身，接口与 RingBufferPlayer 的相应部分一致。"""
+    def __init__(self, speed: float):
+        self.speed = speed
+        self.written_ms = 0.0
+        self.played_ms = 0.0
+        self._last = time.perf_counter()
+
+    def _advance(self) -> None:
+        now = time.perf_counter()
+        self.played_ms = min(self.written_ms, self.played_ms + (now - self._last) * 1000 * self.speed)
+        self._last = now
+
+    def write(self, audio_data: bytes) -> None:
+        self._advance()
+        self.written_ms += len(audio_data) * 500 / OUTPUT_RATE
+
+    def interrupt(self) -> None:
+        self._advance()
+        self.played_ms = self.written_ms
+
+    def playback_position_ms(self) -> Tuple[float, float]:
+        self._advance()
+        return self.written_ms, self.played_ms
+
+
+async def run_session(args, truncate: bool, stream_speed: float) -> Tuple[List[Dict[str, float]], OmniRealtimeClient]:
+    scale = args.time_scale
+    script = MockScript(
+        setup_delay_ms=10,
+        first_delta_ms=300 / scale,
+        speed=stream_speed * scale,
+        response_ms=args.response_ms,
+        speech_start_ms=1000,
+        speech_ms=1500,
+    )
+    player = SimulatedPlayer(scale)
+
+    async with MockRealtimeServer(script) as server:
+        client = OmniRealtimeClient(
+            base_url=server.url,
+            turn_detection_mode=TurnDetectionMode.SERVER_VAD,
+            on_audio_delta=player.write,
+            on_interrupt=player.interrupt,
+            auto_reconnect=False,
+            playback_position=player.playback_position_ms if truncate else None,
+        )
+        samples: List[Dict[str, float]] = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            await client.connect()
+            receiver = asyncio.create_task(client.handle_messages())
+            chunk = bytes(16000 * CHUNK_MS // 1000 * 2)
+            turn = 0
+            while turn < args.turns:
+                # 说一句话：speech_start_ms + speech_ms 的上行音频触发一次回复
+                for _ in range(2500 // CHUNK_MS):
+                    await client.stream_audio(chunk)
+                    await asyncio.sleep(CHUNK_MS / 1000 / scale)
+                turn += 1
+                if turn % args.barge_in_every == 0:
+                    # 等回复完整播完再开口
+                    await asyncio.sleep((args.response_ms + 600) / 1000 / scale)
+                samples.append(dict(server.connections[-1].context_size(), turn=turn))
+            await asyncio.sleep(0.2)
+            receiver.cancel()
+            await client.close()
+    return samples, client
+
+
+async def main(args) -> None:
+    print(f"{args.turns} 轮，每 {args.barge_in_every} 轮中 1 轮不打断，每次回复 {args.response_ms} ms 音频")
+    for label, stream_speed in (("下发中打断（4x 实时下发）", 4.0),
+                                (f"下发完毕后打断（{args.fast_stream:g}x 实时下发）", args.fast_stream)):
+        without, _ = await run_session(args, truncate=False, stream_speed=stream_speed)
+        with_truncate, client = await run_session(args, truncate=True, stream_speed=stream_speed)
+
+        print(f"\n{label}")
+        print(f"{'轮次':>4} {'不截断 音频(s)':>14} {'文本(字)':>8} {'截断 音频(s)':>12} {'文本(字)':>8}")
+        step = max(1, args.turns // 8)
+        for a, b in zip(without, with_truncate):
+            if a["turn"] % step == 0 or a["turn"] == args.turns:
+                print(f"{a['turn']:>4} {a['audio_ms'] / 1000:>14.1f} {a['text_chars']:>8.0f} "
+                      f"{b['audio_ms'] / 1000:>12.1f} {b['text_chars']:>8.0f}")
+        rtt = client.correlator.summary().get("conversation.item.truncate", {})
+        print(f"截断 {client.truncations} 次，移出上下文的未播放音频 {client.truncated_ms / 1000:.1f} s，"
+              f"truncate 往返 p50 {rtt.get('p50_ms') or 0:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="打断截断对上下文大小的影响")
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--barge-in-every", type=int, default=3, help="每 N 轮中有 N-1 轮在播放途中被打断")
+    parser.add_argument("--response-ms", type=int, default=3000)
+    parser.add_argument("--time-scale", type=float, default=5.0)
+    parser.add_argument("--fast-stream", type=float, default=20.0, help="第二种情形的下发速度（相对实时的倍数）")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,123 @@
+# -- coding: utf-8 --
+"""
+TTS 流式播放基准：用按 cosyvoice 节奏下发数据块的模拟合成线程驱动 aliyun.TTSCallback，
+输出到按实时速度消耗数据的模拟设备，统计首个音频延迟（创建回调到开始写设备）、
+播放结束时刻与欠载次数，并与合成完成后才开始播放的旧流程（首个音频延迟即合成总耗时）对比。
+
+合成模型：首包延迟 --first-packet-ms，之后以 --rtf（合成耗时/音频时长）的速度逐块下发；
+回复音频时长按每字 --ms-per-char 估算。整个过程按 --time-scale 倍速运行，结果换算回实际时长。
+
+运行方式:
+    python benchmarks/bench_tts_playback.py [--chars 50] [--rtf 0.3] [--first-packet-ms 400]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aliyun  # noqa: E402
+
+CHUNK_MS = 100  # cosyvoice 每个数据块约 100ms 音频
+
+
+class SimulatedOutput:
+    """按 scale 倍实时速度阻塞写入的输出流替身，记录欠载（设备空转）次数。"""
+    def __init__(self, rate: int, scale: float):
+        self.rate = rate
+        self.scale = scale
+        self.underruns = 0
+        self.end_time = None
+
+    def write(self, data: bytes) -> None:
+        now = time.perf_counter()
+        if self.end_time is not None and now > self.end_time + 0.005 / self.scale:
+            self.underruns += 1
+        start = max(now, self.end_time or now)
+        self.end_time = start + len(data) / 2 / self.rate / self.scale
+        # 设备缓冲只有一个周期，写入阻塞到上一块基本播完
+        time.sleep(max(0.0, start - now))
+
+    def stop_stream(self) -> None:
+        if self.end_time is not None:
+            time.sleep(max(0.0, self.end_time - time.perf_counter()))
+
+    def close(self) -> None:
+        pass
+
+
+def synthesize(callback: aliyun.TTSCallback, args, audio_ms: float) -> float:
+    """模拟合成线程，返回从开始到 on_complete 的耗时（秒，已按倍速缩放）。"""
+    scale = args.time_scale
+    start = time.perf_counter()
+    callback.on_open()
+    time.sleep(args.first_packet_ms / 1000 / scale)
+    chunk = bytes(aliyun.TTS_SAMPLE_RATE * 2 * CHUNK_MS // 1000)
+    for _ in range(int(audio_ms // CHUNK_MS)):
+        callback.on_data(chunk)
+        time.sleep(CHUNK_MS * args.rtf / 1000 / scale)
+    elapsed = time.perf_counter() - start
+    callback.on_complete()
+    callback.on_close()
+    return elapsed
+
+
+def run(args, startup_ms: int) -> Dict[str, float]:
+    scale = args.time_scale
+    audio_ms = args.chars * args.ms_per_char
+    output = SimulatedOutput(aliyun.TTS_SAMPLE_RATE, scale)
+    callback = aliyun.TTSCallback(startup_ms=startup_ms, output=output)
+    result: Dict[str, float] = {}
+    thread = threading.Thread(target=lambda: result.update(synthesis=synthesize(callback, args, audio_ms)))
+    start = time.perf_counter()
+    thread.start()
+    ok = callback.wait(timeout=60)
+    finished = time.perf_counter() - start
+    thread.join()
+    return {
+        "ok": ok,
+        "audio_ms": audio_ms,
+        "synthesis_ms": result["synthesis"] * 1000 * scale,
+        "first_audio_ms": callback.first_audio_delay * 1000 * scale,
+        "finished_ms": finished * 1000 * scale,
+        "underruns": output.underruns,
+    }
+
+
+def main(args) -> None:
+    devnull = open(os.devnull, "w")
+    print(f"{args.chars} 字回复（约 {args.chars * args.ms_per_char / 1000:.1f} s 音频），"
+          f"首包 {args.first_packet_ms} ms，RTF {args.rtf}，重复 {args.runs} 次")
+    print(f"{'起播门限(ms)':>12} {'首个音频(ms)':>12} {'播放结束(ms)':>12} {'欠载':>4} "
+          f"{'旧流程首个音频(ms)':>18} {'旧流程播放结束(ms)':>18}")
+    for startup_ms in args.startup_ms:
+        runs: List[Dict[str, float]] = []
+        for _ in range(args.runs):
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                runs.append(run(args, startup_ms))
+            finally:
+                sys.stdout = stdout
+        assert all(r["ok"] for r in runs)
+        first = statistics.median(r["first_audio_ms"] for r in runs)
+        finished = statistics.median(r["finished_ms"] for r in runs)
+        synthesis = statistics.median(r["synthesis_ms"] for r in runs)
+        # 旧流程：on_complete 之后才把全部数据写入设备
+        print(f"{startup_ms:>12} {first:>12.0f} {finished:>12.0f} {max(r['underruns'] for r in runs):>4} "
+              f"{synthesis:>18.0f} {synthesis + runs[0]['audio_ms']:>18.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TTS 流式播放的首个音频延迟")
+    parser.add_argument("--chars", type=int, default=50)
+    parser.add_argument("--ms-per-char", type=float, default=220)
+    parser.add_argument("--rtf", type=float, default=0.3)
+    parser.add_argument("--first-packet-ms", type=float, default=400)
+    parser.add_argument("--startup-ms", type=int, nargs="+", default=[60, 120, 240])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--time-scale", type=float, default=10.0)
+    main(parser.parse_args())
@@ -0,0 +1,104 @@
+# -- coding: utf-8 --
+"""
+上行音频序列化微基准：对比旧的 dict + json.dumps + send_event 路径与
+OmniRealtimeClient.stream_audio 快速路径的每帧 CPU 耗时与临时内存分配。
+
+运行方式:
+    python benchmarks/bench_uplink.py [帧数]
+"""
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from omni import OmniRealtimeClient  # noqa: E402
+
+RATE = 24000
+CHUNK = 3200  # 与 VAD.py 的采集周期一致
+FRAME = os.urandom(CHUNK * 2)
+
+
+class NullSocket:
+    """丢弃数据的 WebSocket 替身，str 消息按 websockets 的行为编码为 UTF-8。"""
+    def __init__(self):
+        self.frames = 0
+
+    async def send(self, message, text=None):
+        if isinstance(message, str):
+            message.encode()
+        self.frames += 1
+
+
+async def legacy_append(ws, audio_data: bytes) -> None:
+    """基线 start_microphone_streaming + send_event 的序列化路径。"""
+    encoded_data = base64.b64encode(audio_data).decode("utf-8")
+    event = {
+        "event_id": "event_" + str(int(time.time() * 1000)),
+        "type": "input_audio_buffer.append",
+        "audio": encoded_data,
+    }
+    event['event_id'] = "event_" + str(int(time.time() * 1000))
+    print(f" Send event: type={event['type']}, event_id={event['event_id']}")
+    await ws.send(json.dumps(event))
+
+
+def make_client(coalesce_ms: int) -> OmniRealtimeClient:
+    client = OmniRealtimeClient(
+        base_url="ws://localhost",
+        input_sample_rate=RATE,
+        audio_coalesce_ms=coalesce_ms,
+    )
+    client.ws = NullSocket()
+    return client
+
+
+async def measure(name: str, send, ws, frames: int):
+    # 预热，避免首帧的缓冲区分配计入
+    for _ in range(10):
+        await send(FRAME)
+    sent_before = ws.frames
+
+    cpu_start = time.process_time()
+    for _ in range(frames):
+        await send(FRAME)
+    cpu_us = (time.process_time() - cpu_start) * 1e6 / frames
+
+    tracemalloc.start()
+    peak_total = 0
+    for _ in range(min(frames, 200)):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        await send(FRAME)
+        peak_total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    alloc_bytes = peak_total / min(frames, 200)
+
+    ws_frames = (ws.frames - sent_before) / (frames + min(frames, 200))
+    return name, cpu_us, alloc_bytes, ws_frames
+
+
+async def main(frames: int) -> None:
+    results = []
+    legacy_ws = NullSocket()
+    # 旧路径每帧都会打印，这里把输出丢弃，只保留格式化开销
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results.append(await measure("legacy send_event", lambda d: legacy_append(legacy_ws, d), legacy_ws, frames))
+
+    for coalesce_ms in (0, 300, 600):
+        client = make_client(coalesce_ms)
+        results.append(await measure(f"stream_audio coalesce={coalesce_ms}ms", client.stream_audio, client.ws, frames))
+
+    print(f"每帧 {CHUNK} 采样 / {CHUNK * 1000 // RATE} ms，共 {frames} 帧")
+    print(f"{'路径':<28} {'CPU(us/帧)':>10} {'临时分配(B/帧)':>14} {'WS帧/采集帧':>12}")
+    for name, cpu_us, alloc_bytes, ws_frames in results:
+        print(f"{name:<28} {cpu_us:>10.1f} {alloc_bytes:>14.0f} {ws_frames:>12.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
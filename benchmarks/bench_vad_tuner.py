@@ -0,0 +1,170 @@
+# -- coding: utf-8 --
+"""
+server_vad 自调基准：模拟服务器按帧能量与会话中的 threshold / prefix_padding_ms / silence_duration_ms
+判定说话起止（MockScript.energy_vad），输入转录按合成音频的真实话语区间给出，噪声触发的片段转录为空。
+分别在安静车厢与高速路两种场景下，对比固定默认参数（0.1 / 500 / 900）与 ServerVadTuner 自调时的
+误打断、切早、起音截断次数与尾部等待（真实说完到服务端判定说完的上行音频时长）。
+
+上行音频按 --speed 倍速送入，服务端判定只依赖音频时间轴，结果与倍速无关。
+
+运行方式:
+    python benchmarks/bench_vad_tuner.py [--utterances 80] [--speed 50]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_bus import SPEECH_EVENT, DeliveryMode  # noqa: E402
+from mock_server import MockRealtimeServer, MockScript  # noqa: E402
+from omni import OmniRealtimeClient, TurnDetectionMode  # noqa: E402
+from vad_tuner import ServerVadTuner  # noqa: E402
+
+RATE = 16000
+CHUNK_MS = 100
+# 场景：背景噪声 RMS、句间噪声突发（概率与 RMS 范围）、语音峰值、起音渐强时长
+SCENARIOS = {
+    "安静车厢": dict(noise=60, burst_prob=0.0, burst_rms=(0, 0), speech=2400, onset_ms=250),
+    "高速路": dict(noise=350, burst_prob=0.6, burst_rms=(1000, 2200), speech=4000, onset_ms=500),
+}
+
+
+def voiced(ms: int, peak: float, onset_ms: int, rng: np.random.Generator) -> np.ndarray:
+    t = np.arange(RATE * ms // 1000) / RATE
+    f0 = rng.uniform(110, 220) + 15 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / RATE
+    signal = sum(np.sin(k * phase) / k for k in range(1, 15))
+    signal = signal / np.sqrt(np.mean(signal ** 2))
+    envelope = 0.75 + 0.25 * np.sin(2 * np.pi * rng.uniform(3, 5) * t)
+    ramp = np.minimum(1.0, t / (onset_ms / 1000)) if onset_ms else 1.0
+    return signal * envelope * ramp * peak
+
+
+def build_session(count: int, scenario: Dict[str, Any], seed: int = 0) -> Tuple[np.ndarray, List[Tuple[float, float]]]:
+    """返回 (音频, [(开始ms, 结束ms)])；长句带 150~450ms 的句中停顿，句间可能有噪声突发。"""
+    rng = np.random.default_rng(seed)
+    parts = [rng.standard_normal(RATE) * scenario["noise"]]
+    cursor = 1000.0
+    truth = []
+    for i in range(count):
+        start = cursor
+        for j in range(1 if i % 2 == 0 else int(rng.integers(2, 4))):
+            if j:
+                pause = int(rng.uniform(150, 450))
+                parts.append(rng.standard_normal(RATE * pause // 1000) * scenario["noise"])
+                cursor += pause
+            ms = int(rng.uniform(600, 1400))
+            # 只有一句的开头有渐强，句中停顿后直接接上
+            parts.append(voiced(ms, scenario["speech"], scenario["onset_ms"] if j == 0 else 0, rng))
+            cursor += ms
+        truth.append((start, cursor))
+        gap = int(rng.uniform(2000, 3000))
+        gap_audio = rng.standard_normal(RATE * gap // 1000) * scenario["noise"]
+        if rng.random() < scenario["burst_prob"]:
+            # 颠簸、鸣笛等短促的噪声突发
+            burst = int(rng.uniform(150, 300)) * RATE // 1000
+            at = int(rng.uniform(0.4, 0.8) * len(gap_audio))
+            gap_audio[at:at + burst] = rng.standard_normal(burst) * rng.uniform(*scenario["burst_rms"])
+        parts.append(gap_audio)
+        cursor += gap
+    return np.clip(np.concatenate(parts), -32768, 32767).astype(np.int16), truth
+
+
+def transcriber(truth: List[Tuple[float, float]]):
+    """与真实话语重叠 100ms 以上的提交给出非空转录。"""
+    def transcribe(start_ms: float, end_ms: float) -> str:
+        overlap = sum(max(0.0, min(end_ms, b) - max(start_ms, a)) for a, b in truth)
+        return "好" * int(overlap // 250) if overlap >= 100 else ""
+    return transcribe
+
+
+async def run(audio: np.ndarray, truth, speed: float, tune: bool) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    script = MockScript(setup_delay_ms=1, first_delta_ms=10, speed=20, response_ms=500,
+                        energy_vad=True, transcribe=transcriber(truth))
+    stops: List[Tuple[float, float]] = []
+    starts: List[float] = []
+    onsets: List[float] = []
+    async with MockRealtimeServer(script) as server:
+        client = OmniRealtimeClient(base_url=server.url, turn_detection_mode=TurnDetectionMode.SERVER_VAD,
+                                    auto_reconnect=False)
+
+        def on_speech(topic: str, event: Dict[str, Any]) -> None:
+            session = server.connections[-1].session["turn_detection"]
+            if event["type"] == "input_audio_buffer.speech_started":
+                starts.append(event["audio_start_ms"] - session["prefix_padding_ms"])
+                onsets.append(event["audio_start_ms"])
+            elif event["type"] == "input_audio_buffer.speech_stopped":
+                stops.append((event["audio_end_ms"], event["audio_end_ms"] + session["silence_duration_ms"]))
+
+        client.events.subscribe((SPEECH_EVENT,), on_speech, DeliveryMode.INLINE)
+        tuner = ServerVadTuner(client, rate=RATE) if tune else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            await client.connect()
+            receiver = asyncio.create_task(client.handle_messages())
+            await client.session_updated.wait()
+            if tuner:
+                tuner.start()
+            step = RATE * CHUNK_MS // 1000
+            for i in range(0, len(audio), step):
+                chunk = audio[i:i + step].tobytes()
+                await client.stream_audio(chunk)
+                if tuner:
+                    tuner.observe_audio(chunk)
+                await asyncio.sleep(CHUNK_MS / 1000 / speed)
+            await asyncio.sleep(0.3)
+            if tuner:
+                await tuner.stop()
+            receiver.cancel()
+            await client.close()
+        params = server.connections[-1].session["turn_detection"]
+
+    half = truth[len(truth) // 2][0]
+    result: Dict[str, Any] = {}
+    for name, since in (("all", 0.0), ("late", half)):
+        false_starts = sum(1 for s in starts if s >= since and not any(a - 500 <= s <= b for a, b in truth))
+        # 切早：判定说完之后同一句话里又判定开始说话；句尾几十毫秒的弱音被提前判定说完不算
+        splits = sum(1 for end, _ in stops if end >= since
+                     and any(a < end < b and any(end < s < b for s in onsets) for a, b in truth))
+        clipped = 0
+        waits = []
+        for a, b in truth:
+            if a < since:
+                continue
+            covering = [s for s in starts if a - 1000 <= s <= b]
+            if covering and covering[0] > a + 40:
+                clipped += 1
+            decided = [d for end, d in stops if b - 20 <= end <= b + 100]
+            if decided:
+                waits.append(decided[0] - b)
+        result[name] = dict(false_starts=false_starts, splits=splits, clipped=clipped,
+                            wait=statistics.mean(waits) if waits else float("nan"))
+    return result, dict(params, updates=tuner.updates if tuner else 0)
+
+
+async def main(args) -> None:
+    print(f"每个场景 {args.utterances} 句（短句与带句中停顿的长句交替），统计为 全程 / 后半程")
+    print(f"{'场景':<6} {'参数':<4} {'误打断':>9} {'切早':>9} {'起音截断':>9} {'尾部等待(ms)':>15}  最终参数")
+    for name, scenario in SCENARIOS.items():
+        audio, truth = build_session(args.utterances, scenario)
+        for label, tune in (("固定", False), ("自调", True)):
+            result, params = await run(audio, truth, args.speed, tune)
+            a, b = result["all"], result["late"]
+            print(f"{name:<6} {label:<4} {a['false_starts']:>4}/{b['false_starts']:<4} {a['splits']:>4}/{b['splits']:<4} "
+                  f"{a['clipped']:>4}/{b['clipped']:<4} {a['wait']:>7.0f}/{b['wait']:<7.0f}  "
+                  f"threshold={params['threshold']} prefix={params['prefix_padding_ms']} "
+                  f"silence={params['silence_duration_ms']}（调整 {params['updates']} 次）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="server_vad 参数自调的误打断、切早与尾部等待")
+    parser.add_argument("--utterances", type=int, default=80)
+    parser.add_argument("--speed", type=float, default=50.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,84 @@
+# -- coding: utf-8 --
+"""
+预热会话池基准：在本地模拟服务器上对比现场建连（connect + session.update + 人设设定，
+直到收到 session.updated）与从 WarmSessionPool 取用就绪会话的耗时。
+两次对话之间留出 --gap-ms 的间隔，相当于对话之间池子在后台补充的时间。
+
+运行方式:
+    python benchmarks/bench_warm_pool.py [--rounds 20] [--setup-delay-ms 150] [--gap-ms 500]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_server import MockRealtimeServer, MockScript  # noqa: E402
+from omni import OmniRealtimeClient  # noqa: E402
+from session_pool import WarmSessionPool  # noqa: E402
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+async def cold_round(url: str) -> float:
+    start = time.perf_counter()
+    client = OmniRealtimeClient(base_url=url, auto_reconnect=False)
+    await client.connect()
+    receiver = asyncio.create_task(client.handle_messages())
+    await client.session_updated.wait()
+    elapsed = time.perf_counter() - start
+    receiver.cancel()
+    await client.close()
+    return elapsed
+
+
+async def warm_round(pool: WarmSessionPool) -> float:
+    start = time.perf_counter()
+    client = await pool.acquire()
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return elapsed
+
+
+async def main(args) -> None:
+    script = MockScript(setup_delay_ms=args.setup_delay_ms)
+    async with MockRealtimeServer(script) as server:
+        cold: List[float] = []
+        warm: List[float] = []
+        # 客户端的控制事件日志会淹没结果，这里丢弃
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(args.rounds):
+                cold.append(await cold_round(server.url))
+                await asyncio.sleep(args.gap_ms / 1000)
+
+            pool = WarmSessionPool(size=args.pool_size, base_url=server.url, auto_reconnect=False)
+            pool.fill()
+            await pool.wait_ready()
+            for _ in range(args.rounds):
+                warm.append(await warm_round(pool))
+                await asyncio.sleep(args.gap_ms / 1000)
+            await pool.close()
+
+        print(f"{'方式':<8} {'p50(ms)':>9} {'p95(ms)':>9} {'最大(ms)':>9}")
+        for name, values in (("现场建连", cold), ("预热池", warm)):
+            print(f"{name:<8} {percentile(values, 50) * 1000:>9.2f} "
+                  f"{percentile(values, 95) * 1000:>9.2f} {max(values) * 1000:>9.2f}")
+        print(f"预热池命中 {pool.warm_acquires}/{args.rounds}，现场建连 {pool.cold_acquires} 次")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="预热会话池取用耗时基准")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=1)
+    parser.add_argument("--setup-delay-ms", type=float, default=150)
+    parser.add_argument("--gap-ms", type=float, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,254 @@
+# -- coding: utf-8 --
+"""
+手动轮次模式（TurnDetectionMode.MANUAL）下的客户端端点检测。
+
+在采集流上逐帧运行 webrtcvad：连续语音达到 start_ms 即判定开始说话（打断当前回复），
+说话后静音达到本句的静音窗口即判定说完，随即调用 commit_audio_buffer 与 create_response。
+服务端 VAD 固定等待 silence_duration_ms，而这里的静音窗口按句预测:
+    - 用户句中停顿的 p90 加余量作为基础窗口（样本不足时用 base_silence_ms），避免在句中停顿处切断；
+    - 短指令（语音短于 short_utterance_ms）乘以 short_factor；
+    - 句尾音量明显回落（说完时通常如此）乘以 fade_factor；
+    - 提交后很快又开口说明切早了，这次停顿计入停顿统计，之后的窗口随之变长。
+结果限制在 [min_silence_ms, max_silence_ms] 之内。窗口每缩短 100ms，感知延迟就少 100ms。
+
+webrtcvad 为可选依赖，只有创建 Endpointer 时才导入。
+"""
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+
+
+class Endpointer:
+    """
+    面向单个客户端的端点检测器。process() 须在客户端所在的事件循环中、对应音频块发送之后调用。
+
+    属性说明:
+        client (OmniRealtimeClient): 以手动轮次模式连接的客户端。
+        rate (int): 输入音频采样率；webrtcvad 不支持的 8kHz 整数倍采样率先做均值降采样。
+        start_ms (int): 连续语音达到该时长判定开始说话。
+        min_utterance_ms (int): 语音总时长短于该值的片段视为噪声，不提交。
+        min_silence_ms / max_silence_ms (int): 静音窗口的范围。
+        base_silence_ms (int): 停顿样本不足时的基础窗口。
+        short_utterance_ms (int) / short_factor (float): 短指令的判定阈值与窗口系数。
+        fade_factor (float): 句尾音量回落时的窗口系数。
+        resume_ms (int): 提交后在该时长内又开口，视为切早了。
+        resume_frames (int): 静音中连续多少个语音帧才算重新开口。
+        noise_ratio (float): 帧能量须高于噪声底的倍数才可能判为语音，webrtcvad 在安静环境中容易把底噪判为语音。
+        idle_clear_ms (int): 持续静音超过该时长时清空服务端的上行缓冲，0 表示不清空。
+        timeline (TurnTimeline): 可选的每轮时间线，记录说完（local_speech_end）与提交（speech_stopped）时刻。
+        on_speech_start (Callable[[], None]): 判定开始说话时调用。
+        endpoints (int): 已提交的话语数。
+        early_endpoints (int): 其中被判定为切早了的次数。
+        waits_ms (List[float]): 每次提交前等待的静音时长。
+    """
+    VAD_RATES = (8000, 16000, 32000, 48000)
+
+    def __init__(
+        self,
+        client,
+        rate: int = 16000,
+        aggressiveness: int = 2,
+        frame_ms: int = 20,
+        start_ms: int = 120,
+        min_utterance_ms: int = 250,
+        min_silence_ms: int = 250,
+        base_silence_ms: int = 600,
+        max_silence_ms: int = 900,
+        pause_margin_ms: int = 100,
+        short_utterance_ms: int = 1200,
+        short_factor: float = 0.6,
+        fade_factor: float = 0.85,
+        resume_ms: int = 700,
+        resume_frames: int = 3,
+        noise_ratio: float = 3.0,
+        idle_clear_ms: int = 5000,
+        timeline=None,
+        on_speech_start: Optional[Callable[[], None]] = None,
+    ):
+        import webrtcvad
+
+        if rate in self.VAD_RATES:
+            self._decimation = 1
+        elif rate % 8000 == 0:
+            self._decimation = rate // 8000
+        else:
+            raise ValueError(f"Unsupported sample rate for webrtcvad: {rate}")
+        self._vad = webrtcvad.Vad(aggressiveness)
+        self.client = client
+        self.rate = rate
+        self.vad_rate = rate // self._decimation
+        self.frame_ms = frame_ms
+        self.frame_samples = self.vad_rate * frame_ms // 1000
+        self.start_ms = start_ms
+        self.min_utterance_ms = min_utterance_ms
+        self.min_silence_ms = min_silence_ms
+        self.base_silence_ms = base_silence_ms
+        self.max_silence_ms = max_silence_ms
+        self.pause_margin_ms = pause_margin_ms
+        self.short_utterance_ms = short_utterance_ms
+        self.short_factor = short_factor
+        self.fade_factor = fade_factor
+        self.resume_ms = resume_ms
+        self.resume_frames = resume_frames
+        self.noise_ratio = noise_ratio
+        self.idle_clear_ms = idle_clear_ms
+        self.timeline = timeline
+        self.on_speech_start = on_speech_start
+
+        self.endpoints = 0
+        self.early_endpoints = 0
+        self.waits_ms: List[float] = []
+
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._noise_rms: Optional[float] = None
+        self._frame_rest = np.zeros(0, dtype=np.int16)
+        self._clock_ms = 0.0  # 已处理的音频时长
+        self._in_speech = False
+        self._voiced_run_ms = 0.0
+        self._speech_ms = 0.0
+        self._silence_ms = 0.0
+        self._resume_run = 0
+        self._window_ms = float(max_silence_ms)
+        self._idle_ms = 0.0
+        self._buffer_cleared = True
+        # 句中停顿（毫秒）与音量统计
+        self._pauses: Deque[float] = deque(maxlen=50)
+        self._recent_rms: Deque[float] = deque(maxlen=10)
+        self._rms_sum = 0.0
+        self._rms_count = 0
+        self._last_endpoint_ms: Optional[float] = None
+        self._last_speech_end_ms = 0.0
+
+    def predict_window(self) -> float:
+        """按本句已有的语音时长、句尾音量与历史停顿预测静音窗口（毫秒）。"""
+        window = float(self.base_silence_ms)
+        if self._speech_ms < self.short_utterance_ms:
+            window *= self.short_factor
+        if self._recent_rms and self._rms_count and \
+                np.mean(self._recent_rms) < 0.5 * self._rms_sum / self._rms_count:
+            window *= self.fade_factor
+        if len(self._pauses) >= 5:
+            # 不短于用户句中停顿的 p90 加余量，避免在句中停顿处切断
+            window = max(window, float(np.percentile(self._pauses, 90)) + self.pause_margin_ms)
+        return min(self.max_silence_ms, max(self.min_silence_ms, window))
+
+    def _frames(self, chunk: bytes) -> List[np.ndarray]:
+        samples = np.frombuffer(chunk, dtype=np.int16)
+        if self._decimation > 1:
+            samples = np.concatenate((self._pending, samples))
+            usable = len(samples) - len(samples) % self._decimation
+            self._pending = samples[usable:]
+            samples = samples[:usable].reshape(-1, self._decimation).mean(axis=1).astype(np.int16)
+        # 不足一帧的尾部留到下一块
+        samples = np.concatenate((self._frame_rest, samples))
+        frames = len(samples) // self.frame_samples
+        self._frame_rest = samples[frames * self.frame_samples:]
+        return [samples[i * self.frame_samples:(i + 1) * self.frame_samples] for i in range(frames)]
+
+    def _is_voiced(self, frame: np.ndarray) -> bool:
+        """webrtcvad 判为语音且能量明显高于噪声底。"""
+        rms = float(np.sqrt(np.mean(frame.astype(np.float32) ** 2)))
+        # 噪声底快降慢升，说话期间只会缓慢抬高
+        if self._noise_rms is None or rms < self._noise_rms:
+            self._noise_rms = rms if self._noise_rms is None else 0.8 * self._noise_rms + 0.2 * rms
+        else:
+            self._noise_rms += (rms - self._noise_rms) * 0.002
+        if rms < self.noise_ratio * self._noise_rms + 1:
+            return False
+        return self._vad.is_speech(frame.tobytes(), self.vad_rate)
+
+    async def process(self, chunk: bytes) -> None:
+        """输入一个已发送的采集块，必要时打断回复或提交本句。"""
+        frames = self._frames(chunk)
+        chunk_end = time.perf_counter()
+        for index, frame in enumerate(frames):
+            self._clock_ms += self.frame_ms
+            voiced = self._is_voiced(frame)
+            if not self._in_speech:
+                await self._idle_frame(voiced)
+            else:
+                # 本帧结束时刻：块到达时间减去其后剩余帧的时长
+                frame_end = chunk_end - (len(frames) - 1 - index) * self.frame_ms / 1000
+                await self._speech_frame(voiced, frame, frame_end)
+
+    async def _idle_frame(self, voiced: bool) -> None:
+        if not voiced:
+            self._voiced_run_ms = 0.0
+            self._idle_ms += self.frame_ms
+            if self.idle_clear_ms and not self._buffer_cleared and self._idle_ms >= self.idle_clear_ms:
+                self._buffer_cleared = True
+                await self.client.clear_audio_buffer()
+            return
+        self._voiced_run_ms += self.frame_ms
+        if self._voiced_run_ms < self.start_ms:
+            return
+
+        self._in_speech = True
+        self._buffer_cleared = False
+        self._idle_ms = 0.0
+        self._speech_ms = self._voiced_run_ms
+        self._silence_ms = 0.0
+        self._resume_run = 0
+        self._recent_rms.clear()
+        self._rms_sum = 0.0
+        self._rms_count = 0
+        speech_start_ms = self._clock_ms - self._voiced_run_ms
+        if self._last_endpoint_ms is not None and speech_start_ms - self._last_endpoint_ms < self.resume_ms:
+            # 提交后很快又开口：上一次切早了，把整段停顿计入统计
+            self.early_endpoints += 1
+            self._pauses.append(speech_start_ms - self._last_speech_end_ms)
+        self._last_endpoint_ms = None
+        await self.client.user_speech_started()
+        if self.on_speech_start:
+            self.on_speech_start()
+
+    async def _speech_frame(self, voiced: bool, frame: np.ndarray, frame_end: float) -> None:
+        self._resume_run = self._resume_run + 1 if voiced else 0
+        if voiced and (self._silence_ms == 0 or self._resume_run >= self.resume_frames):
+            if self._silence_ms:
+                # 重新开口：扣除已计入静音的语音帧
+                pause = self._silence_ms - (self._resume_run - 1) * self.frame_ms
+                if pause >= 100:
+                    # 更短的间隙多是 VAD 帧判决的抖动，不算停顿
+                    self._pauses.append(pause)
+                self._speech_ms += (self._resume_run - 1) * self.frame_ms
+            self._silence_ms = 0.0
+            self._speech_ms += self.frame_ms
+            rms = float(np.sqrt(np.mean(frame.astype(np.float32) ** 2)))
+            self._recent_rms.append(rms)
+            self._rms_sum += rms
+            self._rms_count += 1
+            return
+
+        # 静音中零星的语音帧多是噪声，连续 resume_frames 帧才算重新开口，此前照常计入静音
+        if self._silence_ms == 0:
+            # 静音开始：按本句到目前为止的特征预测窗口，并记下说完的时刻
+            self._window_ms = self.predict_window()
+            self._last_speech_end_ms = self._clock_ms - self.frame_ms
+        self._silence_ms += self.frame_ms
+        if self._silence_ms < self._window_ms:
+            return
+
+        self._in_speech = False
+        self._voiced_run_ms = 0.0
+        if self._speech_ms < self.min_utterance_ms:
+            return
+        self.endpoints += 1
+        self.waits_ms.append(self._silence_ms)
+        self._last_endpoint_ms = self._clock_ms
+        if self.timeline:
+            self.timeline.mark("local_speech_end", frame_end - self._silence_ms / 1000)
+            self.timeline.mark("speech_stopped", frame_end)
+        await self.client.commit_audio_buffer()
+        await self.client.create_response()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = self.waits_ms
+        return {
+            "endpoints": self.endpoints,
+            "early_endpoints": self.early_endpoints,
+            "mean_wait_ms": round(sum(waits) / len(waits)) if waits else None,
+            "window_ms": round(self._window_ms),
+        }
@@ -0,0 +1,220 @@
+# -- coding: utf-8 --
+"""
+实时会话的发布/订阅事件总线。
+
+OmniRealtimeClient 在接收循环中把音频增量、文本增量、转录、打断与服务端 VAD 事件发布到总线上，
+每个订阅者有自己的投递方式:
+    INLINE   在发布时直接调用，只适合不阻塞的消费者（例如写入播放环形缓冲区）；
+    BATCHED  放入订阅者自己的有界队列，由其专属工作线程成批取出，连续的同主题增量合并为一次回调；
+             队列满时先合并相邻的同主题增量，仍满则丢弃最旧的可丢弃事件，文本、转录与打断从不丢弃；
+    DROP     同 BATCHED，但队列满时直接丢弃新事件，适合日志、遥测等允许丢失的消费者。
+发布方只做一次入队与唤醒，慢的界面或日志消费者不会拖慢接收循环与音频播放。
+"""
+import threading
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+AUDIO_DELTA = "audio_delta"
+TEXT_DELTA = "text_delta"
+INPUT_TRANSCRIPT = "input_transcript"
+OUTPUT_TRANSCRIPT = "output_transcript"
+INTERRUPT = "interrupt"
+# 服务端 VAD 与输入转录的原始事件（speech_started / speech_stopped / 转录完成），载荷为事件字典
+SPEECH_EVENT = "speech_event"
+
+# 载荷是完整消息而非增量的主题（每个用户条目一条输入转录），从不与相邻的同主题事件合并
+WHOLE_MESSAGE_TOPICS = frozenset((INPUT_TRANSCRIPT,))
+
+# BATCHED 队列满时也不丢弃的主题：文本与转录丢失后无法补回，打断丢失会让播放无法停止
+LOSSLESS_TOPICS = frozenset((TEXT_DELTA, INPUT_TRANSCRIPT, OUTPUT_TRANSCRIPT, INTERRUPT))
+
+
+class DeliveryMode(Enum):
+    INLINE = "inline"
+    BATCHED = "batched"
+    DROP = "drop"
+
+
+class Subscription:
+    """
+    一个订阅者及其投递队列。
+
+    属性说明:
+        topics (Tuple[str, ...]): 订阅的主题。
+        callback (Callable[[str, Any], None]): 以 (主题, 载荷) 调用的回调。
+        mode (DeliveryMode): 投递方式。
+        maxsize (int): 队列最多保存的事件数（合并前）；BATCHED 下 LOSSLESS_TOPICS 的事件可以超出。
+        delivered (int): 已投递的回调次数（合并后）。
+        coalesced (int): 被合并进其他事件的增量数。
+        dropped (int): 因队列已满而丢弃的事件数。
+        max_depth (int): 观察到的最大队列深度。
+    """
+    def __init__(
+        self,
+        topics: Tuple[str, ...],
+        callback: Callable[[str, Any], None],
+        mode: DeliveryMode = DeliveryMode.BATCHED,
+        maxsize: int = 256,
+    ):
+        self.topics = topics
+        self.callback = callback
+        self.mode = mode
+        self.maxsize = maxsize
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+        self._queue: Deque[Tuple[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def offer(self, topic: str, payload: Any) -> None:
+        """发布方调用：投递或入队，从不阻塞。"""
+        if self.mode is DeliveryMode.INLINE:
+            self._invoke(topic, payload)
+            return
+        with self._cond:
+            if self._closed:
+                return
+            queue = self._queue
+            if len(queue) >= self.maxsize:
+                if self.mode is DeliveryMode.DROP:
+                    self.dropped += 1
+                    return
+                queue.append((topic, payload))
+                # BATCHED：先按主题合并增量腾出空间，仍满时丢弃最旧的可丢弃事件；
+                # 文本、转录与打断从不丢弃，全是这类事件时队列暂时超出 maxsize
+                merged = self._merge(queue)
+                queue.clear()
+                queue.extend(merged)
+                if len(queue) > self.maxsize:
+                    self._drop_oldest()
+            else:
+                queue.append((topic, payload))
+            if len(queue) > self.max_depth:
+                self.max_depth = len(queue)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _merge(self, items: Iterable[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+        """
+        连续的同主题文本或音频增量合并为一项。
+
+        只合并相邻的事件，任何事件都不会越过其他主题的事件，整体顺序不变；
+        完整消息（WHOLE_MESSAGE_TOPICS）与非文本/音频载荷的事件从不合并。
+        """
+        merged: List[Tuple[str, Any]] = []
+        for topic, payload in items:
+            if merged and merged[-1][0] == topic and topic not in WHOLE_MESSAGE_TOPICS \
+                    and isinstance(payload, (str, bytes)) and type(merged[-1][1]) is type(payload):
+                merged[-1] = (topic, merged[-1][1] + payload)
+                self.coalesced += 1
+            else:
+                merged.append((topic, payload))
+        return merged
+
+    def _drop_oldest(self) -> None:
+        for i, (topic, _) in enumerate(self._queue):
+            if topic not in LOSSLESS_TOPICS:
+                del self._queue[i]
+                self.dropped += 1
+                return
+
+    def _invoke(self, topic: str, payload: Any) -> None:
+        try:
+            self.callback(topic, payload)
+        except Exception as e:
+            print(f"事件订阅者处理 {topic} 出错: {e}")
+        self.delivered += 1
+
+    def _take_batch(self) -> Optional[List[Tuple[str, Any]]]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            items = list(self._queue)
+            self._queue.clear()
+        return self._merge(items)
+
+    def _worker(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            for topic, payload in batch:
+                self._invoke(topic, payload)
+
+    def close(self, timeout: Optional[float] = 1.0) -> None:
+        """停止工作线程，已入队的事件投递完后退出；最多等待 timeout 秒，会阻塞调用线程。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "max_depth": self.max_depth,
+        }
+
+
+class EventBus:
+    """
+    按主题分发事件的总线。publish 须在事件循环线程中调用。
+
+    属性说明:
+        subscriptions (List[Subscription]): 当前所有订阅。
+    """
+    def __init__(self):
+        self.subscriptions: List[Subscription] = []
+        self._by_topic: Dict[str, Tuple[Subscription, ...]] = {}
+
+    def subscribe(
+        self,
+        topics: Union[str, Tuple[str, ...]],
+        callback: Callable[[str, Any], None],
+        mode: DeliveryMode = DeliveryMode.BATCHED,
+        maxsize: int = 256,
+    ) -> Subscription:
+        """订阅一个或多个主题，callback 以 (主题, 载荷) 调用。"""
+        if isinstance(topics, str):
+            topics = (topics,)
+        subscription = Subscription(tuple(topics), callback, mode, maxsize)
+        self.subscriptions.append(subscription)
+        self._rebuild()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+            self._rebuild()
+        subscription.close()
+
+    def _rebuild(self) -> None:
+        by_topic: Dict[str, List[Subscription]] = {}
+        for subscription in self.subscriptions:
+            for topic in subscription.topics:
+                by_topic.setdefault(topic, []).append(subscription)
+        # 发布路径只读这个不可变映射
+        self._by_topic = {topic: tuple(subs) for topic, subs in by_topic.items()}
+
+    def has_subscribers(self, topic: str) -> bool:
+        return topic in self._by_topic
+
+    def publish(self, topic: str, payload: Any = None) -> None:
+        for subscription in self._by_topic.get(topic, ()):
+            subscription.offer(topic, payload)
+
+    def close(self) -> None:
+        """关闭所有订阅的工作线程。"""
+        for subscription in self.subscriptions:
+            subscription.close()
@@ -0,0 +1,193 @@
+# -- coding: utf-8 --
+"""
+WAV / 裸 PCM 文件音频源，可替代麦克风向 OmniRealtimeClient 送音频。
+
+每个文件视为一段话语：按目标采样率重采样、切成固定时长的块，按 1 倍速、N 倍速或不限速产出，
+每段话语之后补一段静音，使服务端 VAD 能判定说话结束，并通过 on_utterance_end 与 utterances
+标出话语边界。与 CaptureBridge、session_manager.QueueSource 一样是产出 16bit PCM 块的异步可迭代对象。
+
+运行方式（不指定 --url 时在进程内启动 mock_server 作为服务端）:
+    python file_source.py 录音1.wav 录音2.pcm [--speed 0] [--rate 16000] [--url ws://...]
+"""
+import argparse
+import asyncio
+import os
+import time
+import wave
+from typing import Callable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from resampler import StreamingResampler
+
+RAW_EXTENSIONS = (".pcm", ".raw")
+
+
+class Utterance(NamedTuple):
+    """一段话语在输出音频流中的位置（样本数，按输出采样率计）。"""
+    index: int
+    path: str
+    start_sample: int
+    end_sample: int
+
+
+def read_pcm(path: str, raw_rate: int = 16000) -> Tuple[np.ndarray, int]:
+    """读取 16bit WAV 或裸 PCM，多声道取平均，返回 (int16 单声道样本, 采样率)。"""
+    if path.lower().endswith(RAW_EXTENSIONS):
+        return np.fromfile(path, dtype="<i2"), raw_rate
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"Only 16-bit PCM WAV is supported: {path}")
+        rate = wf.getframerate()
+        channels = wf.getnchannels()
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+class FileAudioSource:
+    """
+    按节奏产出文件音频的异步音频源。
+
+    属性说明:
+        paths (List[str]): 依次播放的音频文件。
+        rate (int): 输出采样率，文件采样率不同时流式重采样。
+        speed (float): 相对实时的倍数，0 表示不限速。
+        chunk_ms (int): 每块音频时长。
+        gap_ms (int): 每段话语之后补的静音时长。
+        raw_rate (int): 裸 PCM 文件的采样率。
+        on_utterance_end (Callable[[Utterance], None]): 每段话语（不含补的静音）最后一块产出后调用。
+        utterances (List[Utterance]): 已产出的话语边界。
+        samples_out (int): 已产出的样本数。
+    """
+    def __init__(
+        self,
+        paths: Sequence[str],
+        rate: int = 16000,
+        speed: float = 1.0,
+        chunk_ms: int = 100,
+        gap_ms: int = 1200,
+        raw_rate: int = 16000,
+        on_utterance_end: Optional[Callable[[Utterance], None]] = None,
+    ):
+        self.paths = list(paths)
+        self.rate = rate
+        self.speed = speed
+        self.chunk_ms = chunk_ms
+        self.gap_ms = gap_ms
+        self.raw_rate = raw_rate
+        self.on_utterance_end = on_utterance_end
+        self.utterances: List[Utterance] = []
+        self.samples_out = 0
+
+    @property
+    def seconds_out(self) -> float:
+        return self.samples_out / self.rate
+
+    def _chunks(self, samples: np.ndarray) -> Iterator[bytes]:
+        step = self.rate * self.chunk_ms // 1000
+        for i in range(0, len(samples), step):
+            yield samples[i:i + step].tobytes()
+
+    def _load(self, path: str) -> np.ndarray:
+        samples, file_rate = read_pcm(path, self.raw_rate)
+        if file_rate == self.rate:
+            return samples
+        resampler = StreamingResampler(file_rate, self.rate)
+        pcm = resampler.process(samples.tobytes()) + resampler.flush()
+        return np.frombuffer(pcm, dtype=np.int16)
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        start = time.monotonic()
+        silence = np.zeros(self.rate * self.gap_ms // 1000, dtype=np.int16)
+        for index, path in enumerate(self.paths):
+            samples = await asyncio.to_thread(self._load, path)
+            start_sample = self.samples_out
+            for chunk in self._chunks(samples):
+                await self._pace(start)
+                self.samples_out += len(chunk) // 2
+                yield chunk
+            utterance = Utterance(index, path, start_sample, self.samples_out)
+            self.utterances.append(utterance)
+            if self.on_utterance_end:
+                self.on_utterance_end(utterance)
+            for chunk in self._chunks(silence):
+                await self._pace(start)
+                self.samples_out += len(chunk) // 2
+                yield chunk
+
+    async def _pace(self, start: float) -> None:
+        if self.speed <= 0:
+            # 不限速时也让出事件循环，接收任务才能及时处理服务端事件
+            await asyncio.sleep(0)
+            return
+        delay = start + self.samples_out / self.rate / self.speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def _main(args) -> None:
+    from omni import OmniRealtimeClient, TurnDetectionMode
+
+    responses = 0
+
+    def on_audio_done(event) -> None:
+        nonlocal responses
+        responses += 1
+
+    source = FileAudioSource(args.paths, rate=args.rate, speed=args.speed, gap_ms=args.gap_ms)
+
+    async def run(url: str) -> None:
+        client = OmniRealtimeClient(
+            base_url=url,
+            model=args.model,
+            turn_detection_mode=TurnDetectionMode.SERVER_VAD,
+            input_sample_rate=args.rate,
+            extra_event_handlers={"response.audio.done": on_audio_done},
+        )
+        await client.connect()
+        receiver = asyncio.create_task(client.handle_messages())
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            async for chunk in source:
+                await client.stream_audio(chunk)
+            await client.flush_audio()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            # 给最后一段话语的回复留出时间
+            await asyncio.sleep(args.tail_seconds)
+        finally:
+            receiver.cancel()
+            await client.close()
+        print(f"\n{len(source.utterances)} 段话语，{source.seconds_out:.1f}s 音频，墙钟 {wall:.2f}s"
+              f"（{source.seconds_out / wall:.1f}x 实时），CPU {cpu * 1000:.0f}ms，完整音频回复 {responses} 次")
+
+    if args.url:
+        await run(args.url)
+    else:
+        from mock_server import MockRealtimeServer, MockScript
+
+        # 模拟服务器按上行音频能量判定说话起止，轮次由文件中真实的话语边界驱动
+        async with MockRealtimeServer(MockScript(input_sample_rate=args.rate, energy_vad=True)) as server:
+            await run(server.url)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以文件音频驱动实时会话")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--url", default=None, help="Realtime 服务地址，默认使用进程内模拟服务器")
+    parser.add_argument("--model", default="qwen-omni-turbo-realtime")
+    parser.add_argument("--rate", type=int, default=16000, help="上行采样率")
+    parser.add_argument("--speed", type=float, default=1.0, help="相对实时的倍数，0 表示不限速")
+    parser.add_argument("--gap-ms", type=int, default=1200)
+    parser.add_argument("--tail-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    for path in args.paths:
+        if not os.path.exists(path):
+            parser.error(f"文件不存在: {path}")
+    asyncio.run(_main(args))
@@ -0,0 +1,193 @@
+# -- coding: utf-8 --
+"""
+摄像头帧上行管线，位于 OmniRealtimeClient.append_image 之前。
+
+- 按目标帧率发送，摄像头送来的帧只保留最新一帧；
+- 缩放并重新编码为 JPEG，使每帧不超过字节预算；
+- 用差值哈希（dHash）跳过与上一次发送几乎相同的帧；
+- 根据 WebSocket 发送缓冲的积压调整字节预算（加性增、乘性减），积压过高时整帧跳过，
+  保证蜂窝网络下上行音频不被图像挤占。
+
+Pillow 为可选依赖，只有编码帧时才导入。
+"""
+import asyncio
+import io
+import time
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+class FramePipelineStats:
+    """帧管线的运行指标。"""
+    def __init__(self):
+        self.frames_in = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.superseded = 0  # 发送前被更新的帧覆盖
+        self.duplicates = 0  # 与上一次发送的帧近似相同
+        self.backlogged = 0  # 发送缓冲积压过高而跳过
+        self.encode_seconds = 0.0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """差值哈希：灰度缩放到 (hash_size+1)×hash_size 后比较相邻像素的亮度。"""
+    from PIL import Image
+
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class FramePipeline:
+    """
+    面向单个客户端的帧上行管线。调用 submit() 送入帧，后台任务按帧率处理并调用 client.append_image。
+
+    属性说明:
+        client (OmniRealtimeClient): 目标客户端。
+        fps (float): 目标发送帧率。
+        max_side (int): 缩放后长边的最大像素数。
+        max_bytes (int): 每帧 JPEG 的字节预算上限；min_bytes 为积压时可降到的下限。
+        budget_bytes (int): 当前字节预算，随发送积压自适应调整。
+        dedupe_distance (int): dHash 汉明距离不超过该值的帧视为重复。
+        backlog_high (int): 发送缓冲积压超过该字节数时跳过本帧并降低预算。
+        backlog_low (int): 积压低于该字节数时逐步恢复预算。
+        stats (FramePipelineStats): 运行指标。
+    """
+    def __init__(
+        self,
+        client,
+        fps: float = 1.0,
+        max_side: int = 640,
+        max_bytes: int = 48_000,
+        min_bytes: int = 8_000,
+        quality: int = 80,
+        min_quality: int = 35,
+        dedupe_distance: int = 4,
+        backlog_high: int = 64_000,
+        backlog_low: int = 16_000,
+    ):
+        self.client = client
+        self.fps = fps
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes
+        self.budget_bytes = max_bytes
+        self.min_quality = min_quality
+        self.dedupe_distance = dedupe_distance
+        self.backlog_high = backlog_high
+        self.backlog_low = backlog_low
+        self.stats = FramePipelineStats()
+
+        self._quality = quality
+        self._max_quality = quality
+        self._latest = None
+        self._frame_ready = asyncio.Event()
+        self._last_hash: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """在当前事件循环中启动发送任务。"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def submit(self, frame: Union[bytes, "Image.Image"]) -> None:
+        """送入一帧（已编码的图像字节或 PIL Image），未发送的旧帧被覆盖。须在事件循环线程中调用。"""
+        self.stats.frames_in += 1
+        if self._latest is not None:
+            self.stats.superseded += 1
+        self._latest = frame
+        self._frame_ready.set()
+
+    def send_backlog(self) -> int:
+        """客户端发送队列与 WebSocket 传输层中尚未写出的字节数。"""
+        return self.client.send_backlog()
+
+    def _adapt(self, backlog: int) -> bool:
+        """按积压调整字节预算，返回本帧是否应当发送。"""
+        if backlog > self.backlog_high:
+            self.budget_bytes = max(self.min_bytes, int(self.budget_bytes * 0.7))
+            return False
+        if backlog < self.backlog_low:
+            self.budget_bytes = min(self.max_bytes, self.budget_bytes + self.max_bytes // 10)
+        return True
+
+    def _encode(self, frame) -> Tuple[Optional[bytes], int]:
+        """缩放、去重并编码到预算内，返回 (JPEG 字节, dHash)；与上一帧重复时字节为 None。"""
+        from PIL import Image
+
+        image = Image.open(io.BytesIO(frame)) if isinstance(frame, (bytes, bytearray)) else frame
+        image = image.convert("RGB")
+        frame_hash = dhash(image)
+        if self._last_hash is not None and bin(frame_hash ^ self._last_hash).count("1") <= self.dedupe_distance:
+            return None, frame_hash
+
+        if max(image.size) > self.max_side:
+            image.thumbnail((self.max_side, self.max_side), Image.BILINEAR)
+
+        # 从上一帧的质量开始，先降质量，到下限后再缩小尺寸
+        quality = self._quality
+        while True:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=False)
+            data = buffer.getvalue()
+            if len(data) <= self.budget_bytes:
+                break
+            if quality > self.min_quality:
+                quality = max(self.min_quality, quality - 10)
+            elif min(image.size) > 64:
+                image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.BILINEAR)
+            else:
+                break
+        # 预算宽裕时下一帧尝试提高质量
+        if len(data) < self.budget_bytes // 2:
+            quality = min(self._max_quality, quality + 5)
+        self._quality = quality
+        return data, frame_hash
+
+    async def _run(self) -> None:
+        interval = 1.0 / self.fps
+        next_send = time.monotonic()
+        while True:
+            await self._frame_ready.wait()
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            frame, self._latest = self._latest, None
+            self._frame_ready.clear()
+            if frame is None:
+                continue
+            next_send = time.monotonic() + interval
+
+            if not self._adapt(self.send_backlog()):
+                self.stats.backlogged += 1
+                continue
+
+            start = time.perf_counter()
+            try:
+                data, frame_hash = await asyncio.to_thread(self._encode, frame)
+            except Exception as e:
+                print(f"图像帧处理失败: {e}")
+                continue
+            self.stats.encode_seconds += time.perf_counter() - start
+            if data is None:
+                self.stats.duplicates += 1
+                continue
+
+            await self.client.append_image(data)
+            self._last_hash = frame_hash
+            self.stats.frames_sent += 1
+            self.stats.bytes_sent += len(data)
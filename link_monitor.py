@@ -0,0 +1,239 @@
+# -- coding: utf-8 --
+"""
+弱网下的输出模态自适应。
+
+LinkQualityMonitor 周期性评估链路质量，取以下三项中最差的一项（1 表示恰好达到阈值，越大越好）:
+    下行到达速度   回复音频增量的到达速度相对实时的倍数，低于 min_arrival_ratio 时播放会断续；
+    上行积压       发送队列与 WebSocket 传输层中尚未写出的字节数；
+    往返时间       session.update、commit 等几乎不含服务端处理的请求的确认往返时间。
+质量连续 degrade_after 次低于 1 时通过 update_session 把输出模态切换为纯文本（音频增量占下行字节的绝大部分），
+回复以文本显示。降级期间没有音频增量，下行到达速度无从测量，仅凭上行积压与往返时间不能说明下行已经好转，
+因此质量持续 recover_after 秒不低于 recover_margin 后只是试探性地恢复文本+音频：恢复后第一次测到的下行到达速度
+即试探结果，不足时立即重新降级，而不是再等 degrade_after 次评估。刚恢复就再次降级时，
+下一次恢复所需的时长加倍，避免在临界链路上来回切换。
+
+节省的下行字节按完整模式下实测的“每个转录字对应的音频字节”乘以降级期间收到的文本字数估算。
+"""
+import asyncio
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+from event_bus import AUDIO_DELTA, OUTPUT_TRANSCRIPT, TEXT_DELTA, DeliveryMode
+
+FULL_MODALITIES = ("text", "audio")
+OUTPUT_RATE = 24000  # 服务端 pcm16 输出采样率
+# 这些请求的确认几乎不含服务端处理，往返时间接近网络 RTT
+NETWORK_REQUESTS = ("session.update", "input_audio_buffer.commit", "conversation.item.create",
+                    "conversation.item.truncate")
+# 完整模式下还没有实测值时使用的估计：24kHz pcm16 经 base64 约 64KB/s，中文语速约 4 字/秒
+DEFAULT_AUDIO_BYTES_PER_CHAR = 16_000
+
+
+class LinkQualityMonitor:
+    """
+    面向单个客户端的链路质量监测与模态切换。须在客户端所在的事件循环中 start()。
+
+    属性说明:
+        client (OmniRealtimeClient): 被监测的客户端。
+        interval (float): 评估周期（秒）。
+        min_arrival_ratio (float): 回复音频到达速度相对实时的最低倍数。
+        max_backlog_bytes (int): 上行积压字节数上限。
+        max_rtt_ms (float): 往返时间上限（毫秒），超过 rtt_max_age 秒的样本不参与评估。
+        recover_margin (float): 恢复音频所需的最低质量。
+        degrade_after (int): 连续多少次评估质量不足后降级。
+        recover_after (float): 质量持续达标多少秒后恢复，反复降级时加倍，最多 max_recover_after。
+        degraded_modalities (Sequence[str]): 降级后的输出模态。
+        on_mode_change (Callable[[bool], None]): 切换后调用，参数为是否处于降级模式。
+        quality (float): 最近一次评估的链路质量。
+        degraded (bool): 当前是否处于降级模式。
+        probing (bool): 已试探性恢复音频、尚未测到下行到达速度。
+        switches (int): 累计切换次数。
+        failed_probes (int): 试探恢复后因下行到达速度不足而重新降级的次数。
+        downlink_bytes (Dict[str, int]): 完整模式与降级模式下分别收到的下行字节数。
+    """
+    def __init__(
+        self,
+        client,
+        interval: float = 1.0,
+        min_arrival_ratio: float = 1.2,
+        max_backlog_bytes: int = 64_000,
+        max_rtt_ms: float = 800.0,
+        rtt_max_age: float = 30.0,
+        recover_margin: float = 1.5,
+        degrade_after: int = 2,
+        recover_after: float = 10.0,
+        max_recover_after: float = 120.0,
+        degraded_modalities: Sequence[str] = ("text",),
+        on_mode_change: Optional[Callable[[bool], None]] = None,
+    ):
+        self.client = client
+        self.interval = interval
+        self.min_arrival_ratio = min_arrival_ratio
+        self.max_backlog_bytes = max_backlog_bytes
+        self.max_rtt_ms = max_rtt_ms
+        self.rtt_max_age = rtt_max_age
+        self.recover_margin = recover_margin
+        self.degrade_after = degrade_after
+        self.recover_after = recover_after
+        self.max_recover_after = max_recover_after
+        self.degraded_modalities = list(degraded_modalities)
+        self.on_mode_change = on_mode_change
+        self.quality = float("inf")
+        self.degraded = False
+        self.probing = False
+        self.switches = 0
+        self.failed_probes = 0
+        self.downlink_bytes: Dict[str, int] = {"full": 0, "degraded": 0}
+
+        self._base_recover_after = recover_after
+        self._poor_count = 0
+        self._good_since: Optional[float] = None
+        self._recovered_at: Optional[float] = None
+        self._downlink_seen = 0
+        self._arrival: Optional[float] = None
+        # 下行到达速度窗口：音频时长与有数据到达的时间（毫秒）
+        self._last_delta: Optional[float] = None
+        self._window_audio_ms = 0.0
+        self._window_active_ms = 0.0
+        self._idle_gap = 1.0
+        # 节省量估算
+        self._full_audio_bytes = 0.0
+        self._full_chars = 0
+        self._degraded_chars = 0
+        self._subscription = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """订阅客户端事件并启动评估任务。"""
+        if self._task is not None:
+            return
+        self._subscription = self.client.events.subscribe(
+            (AUDIO_DELTA, TEXT_DELTA, OUTPUT_TRANSCRIPT), self._on_event, DeliveryMode.INLINE
+        )
+        self._downlink_seen = self.client.downlink_bytes
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._subscription is not None:
+            self.client.events.unsubscribe(self._subscription)
+            self._subscription = None
+
+    def _on_event(self, topic: str, payload) -> None:
+        # 在接收循环中直接调用，只做计数
+        if topic == AUDIO_DELTA:
+            now = time.perf_counter()
+            if self._last_delta is not None and now - self._last_delta < self._idle_gap:
+                # 回复的第一个增量前是空闲时间，不计入到达速度
+                self._window_active_ms += (now - self._last_delta) * 1000
+                self._window_audio_ms += len(payload) * 500 / OUTPUT_RATE
+            self._last_delta = now
+            if not self.degraded:
+                self._full_audio_bytes += len(payload) * 4 / 3
+        elif topic == OUTPUT_TRANSCRIPT:
+            if not self.degraded:
+                self._full_chars += len(payload)
+        elif self.degraded:
+            self._degraded_chars += len(payload)
+
+    @property
+    def audio_bytes_per_char(self) -> float:
+        """完整模式下每个转录字对应的下行音频字节数（base64 后）。"""
+        if self._full_chars < 20:
+            return DEFAULT_AUDIO_BYTES_PER_CHAR
+        return self._full_audio_bytes / self._full_chars
+
+    @property
+    def saved_bytes(self) -> float:
+        """降级期间估计节省的下行字节数。"""
+        return self._degraded_chars * self.audio_bytes_per_char
+
+    def _arrival_ratio(self) -> Optional[float]:
+        if self._window_active_ms < 100:
+            return None
+        ratio = self._window_audio_ms / self._window_active_ms
+        self._window_audio_ms = 0.0
+        self._window_active_ms = 0.0
+        return ratio
+
+    def _rtt_ms(self) -> Optional[float]:
+        now = time.perf_counter()
+        samples = [
+            rtt for rtt, at in (self.client.correlator.last_rtt.get(request) for request in NETWORK_REQUESTS
+                                if request in self.client.correlator.last_rtt)
+            if now - at <= self.rtt_max_age
+        ]
+        return max(samples) * 1000 if samples else None
+
+    def evaluate(self) -> float:
+        """计算当前链路质量：各项指标相对阈值的余量取最小值。"""
+        scores = [self.max_backlog_bytes / max(1, self.client.send_backlog())]
+        arrival = self._arrival = self._arrival_ratio()
+        if arrival is not None:
+            scores.append(arrival / self.min_arrival_ratio)
+        rtt_ms = self._rtt_ms()
+        if rtt_ms is not None:
+            scores.append(self.max_rtt_ms / max(1.0, rtt_ms))
+        return min(scores)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            received = self.client.downlink_bytes
+            self.downlink_bytes["degraded" if self.degraded else "full"] += received - self._downlink_seen
+            self._downlink_seen = received
+
+            self.quality = self.evaluate()
+            now = time.monotonic()
+            if not self.degraded:
+                self._poor_count = self._poor_count + 1 if self.quality < 1.0 else 0
+                if self.probing and self._arrival is not None:
+                    # 试探恢复后首次测到下行到达速度：达标则确认恢复，否则立即重新降级
+                    self.probing = False
+                    if self.quality < 1.0:
+                        self.failed_probes += 1
+                        self._poor_count = self.degrade_after
+                if self._poor_count >= self.degrade_after:
+                    if self._recovered_at is not None and now - self._recovered_at < 2 * self.recover_after:
+                        self.recover_after = min(self.max_recover_after, self.recover_after * 2)
+                    else:
+                        self.recover_after = self._base_recover_after
+                    await self._switch(True)
+            elif self.quality >= self.recover_margin:
+                if self._good_since is None:
+                    self._good_since = now
+                elif now - self._good_since >= self.recover_after:
+                    self._recovered_at = now
+                    self.probing = True
+                    await self._switch(False)
+            else:
+                self._good_since = None
+
+    async def _switch(self, degraded: bool) -> None:
+        self.degraded = degraded
+        if degraded:
+            self.probing = False
+        self.switches += 1
+        self._poor_count = 0
+        self._good_since = None
+        self._last_delta = None
+        self._window_audio_ms = 0.0
+        self._window_active_ms = 0.0
+        print(f" 链路质量 {self.quality:.2f}，切换输出模态为 "
+              f"{self.degraded_modalities if degraded else list(FULL_MODALITIES)}")
+        await self.client.set_modalities(self.degraded_modalities if degraded else list(FULL_MODALITIES))
+        if self.on_mode_change:
+            self.on_mode_change(degraded)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "switches": self.switches,
+            "degraded": self.degraded,
+            "failed_probes": self.failed_probes,
+            "downlink_full_bytes": self.downlink_bytes["full"],
+            "downlink_degraded_bytes": self.downlink_bytes["degraded"],
+            "estimated_saved_bytes": round(self.saved_bytes),
+        }
@@ -0,0 +1,272 @@
+# -- coding: utf-8 --
+"""
+实时语音助手的每轮延迟时间线与 Prometheus 导出。
+
+一轮对话记录以下时间点（均为 time.perf_counter 时间）:
+    local_speech_end     本地 VAD 判定用户说完
+    speech_stopped       收到 input_audio_buffer.speech_stopped
+    response_created     收到 response.created
+    first_audio_delta    收到第一个 response.audio.delta
+    first_sample_played  第一个样本交给输出设备（含设备输出延迟）
+    response_done        收到 response.done
+
+prometheus-client 为可选依赖，只有调用 start_metrics_server 或 export=True 时才导入。
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+POINTS = (
+    "local_speech_end",
+    "speech_stopped",
+    "response_created",
+    "first_audio_delta",
+    "first_sample_played",
+    "response_done",
+)
+
+# 阶段名 -> (起点, 终点)；起点缺失时该阶段不统计
+STAGES = {
+    "vad_tail": ("local_speech_end", "speech_stopped"),
+    "response_start": ("speech_stopped", "response_created"),
+    "first_delta": ("response_created", "first_audio_delta"),
+    "playback_start": ("first_audio_delta", "first_sample_played"),
+    "perceived": ("local_speech_end", "first_sample_played"),
+    "perceived_from_server_vad": ("speech_stopped", "first_sample_played"),
+    "response_total": ("response_created", "response_done"),
+}
+
+# 可被后续记录覆盖的时间点 -> 锁定它的时间点：本地 VAD 在句中停顿时也会判定一次说完，
+# 服务端判定说完之前以最后一次为准
+REVISABLE = {
+    "local_speech_end": "speech_stopped",
+}
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+# 客户端请求事件 -> 服务端对应的确认事件
+REQUEST_ACKS = {
+    "session.update": "session.updated",
+    "input_audio_buffer.commit": "input_audio_buffer.committed",
+    "input_audio_buffer.clear": "input_audio_buffer.cleared",
+    "conversation.item.create": "conversation.item.created",
+    "conversation.item.truncate": "conversation.item.truncated",
+    "response.create": "response.created",
+    "response.cancel": "response.done",
+}
+
+# 上行发送队列积压的分桶（毫秒）
+QUEUE_DEPTH_BUCKETS = (0, 20, 50, 100, 200, 400, 800, 1600, 3200)
+
+_histogram = None
+_uplink_metrics = None
+_rtt_histogram = None
+_histogram_lock = threading.Lock()
+
+
+def turn_latency_histogram():
+    """进程内共享的每轮阶段延迟直方图，多路会话共用以控制标签基数。"""
+    global _histogram
+    with _histogram_lock:
+        if _histogram is None:
+            from prometheus_client import Histogram
+            _histogram = Histogram(
+                "omni_turn_latency_seconds",
+                "Per-turn latency of the realtime assistant by stage",
+                ["stage"],
+                buckets=LATENCY_BUCKETS,
+            )
+        return _histogram
+
+
+def uplink_queue_metrics():
+    """进程内共享的上行发送队列指标：入队时的积压深度与因积压丢弃的音频。"""
+    global _uplink_metrics
+    with _histogram_lock:
+        if _uplink_metrics is None:
+            from prometheus_client import Counter, Histogram
+            _uplink_metrics = {
+                "depth_ms": Histogram(
+                    "omni_uplink_queue_depth_ms",
+                    "Queued uplink audio in milliseconds, observed on every enqueue",
+                    buckets=QUEUE_DEPTH_BUCKETS,
+                ),
+                "dropped_frames": Counter(
+                    "omni_uplink_dropped_frames",
+                    "Uplink audio frames dropped because the send queue was backlogged",
+                ),
+                "dropped_ms": Counter(
+                    "omni_uplink_dropped_audio_ms",
+                    "Milliseconds of uplink audio dropped because the send queue was backlogged",
+                ),
+            }
+        return _uplink_metrics
+
+
+def request_rtt_histogram():
+    """进程内共享的请求/确认往返时间直方图。"""
+    global _rtt_histogram
+    with _histogram_lock:
+        if _rtt_histogram is None:
+            from prometheus_client import Histogram
+            _rtt_histogram = Histogram(
+                "omni_request_rtt_seconds",
+                "Time from a client request leaving the socket to the matching server acknowledgement",
+                ["request"],
+                buckets=LATENCY_BUCKETS,
+            )
+        return _rtt_histogram
+
+
+def start_metrics_server(port: int, addr: str = "0.0.0.0") -> None:
+    """在后台线程启动 Prometheus HTTP 端点。"""
+    from prometheus_client import start_http_server
+    turn_latency_histogram()
+    start_http_server(port, addr)
+
+
+class TurnTimeline:
+    """
+    记录每轮对话的关键时间点，轮次结束时计算各阶段耗时并导出。
+
+    mark 可以在 PortAudio 回调线程中调用；同一轮内每个时间点只记录第一次，
+    REVISABLE 中的时间点在其锁定时间点到来前取最后一次。
+
+    属性说明:
+        turns (Deque[Dict[str, float]]): 最近若干轮的阶段耗时（秒）。
+        export (bool): 是否写入 Prometheus 直方图。
+    """
+    def __init__(self, export: bool = False, history: int = 100):
+        self.export = export
+        self.turns: Deque[Dict[str, float]] = deque(maxlen=history)
+        self._marks: Optional[Dict[str, float]] = None
+        self._lock = threading.Lock()
+        if export:
+            turn_latency_histogram()
+
+    def begin_turn(self) -> None:
+        """开始新的一轮；上一轮若未结束（例如被打断）则按已有时间点结算。"""
+        with self._lock:
+            previous, self._marks = self._marks, {}
+        if previous:
+            self._finish(previous)
+
+    def mark(self, point: str, timestamp: Optional[float] = None) -> None:
+        """记录时间点，本轮已记录过则忽略（可覆盖且尚未锁定的时间点除外）。"""
+        marks = self._marks
+        if marks is not None and point in marks and REVISABLE.get(point, point) in marks:
+            return
+        with self._lock:
+            if self._marks is None:
+                self._marks = {}
+            if point not in self._marks or REVISABLE.get(point, point) not in self._marks:
+                self._marks[point] = timestamp if timestamp is not None else time.perf_counter()
+
+    def finish_turn(self) -> Optional[Dict[str, float]]:
+        """结束本轮并返回各阶段耗时。"""
+        self.mark("response_done")
+        with self._lock:
+            marks, self._marks = self._marks, None
+        return self._finish(marks) if marks else None
+
+    def _finish(self, marks: Dict[str, float]) -> Dict[str, float]:
+        stages = {}
+        for stage, (start, end) in STAGES.items():
+            if start in marks and end in marks and marks[end] >= marks[start]:
+                stages[stage] = marks[end] - marks[start]
+        if stages:
+            self.turns.append(stages)
+        if self.export:
+            histogram = turn_latency_histogram()
+            for stage, seconds in stages.items():
+                histogram.labels(stage=stage).observe(seconds)
+        return stages
+
+
+class RequestCorrelator:
+    """
+    把客户端请求与服务端确认配对，记录每对的往返时间。
+
+    服务端确认不回传请求的 event_id，同一类请求按发送顺序（FIFO）与确认配对；
+    服务端自行产生的确认（例如 server_vad 自动提交）没有待配对的请求，直接忽略。
+    error 事件携带 event_id 时把对应请求记为失败。
+
+    session.update、commit 这类确认几乎不含服务端处理，其往返时间接近网络 RTT；
+    与 response.create -> response.created 的差值即服务端排队与处理耗时。
+
+    属性说明:
+        rtt (Dict[str, Deque[float]]): 按请求类型记录的最近若干次往返时间（秒）。
+        last_rtt (Dict[str, Tuple[float, float]]): 按请求类型记录的最近一次 (往返秒数, 确认到达时间)。
+        failed (Dict[str, int]): 按请求类型统计的失败次数。
+        export (bool): 是否写入 Prometheus 直方图。
+    """
+    def __init__(self, export: bool = False, history: int = 200):
+        self.export = export
+        self.rtt: Dict[str, Deque[float]] = {request: deque(maxlen=history) for request in REQUEST_ACKS}
+        self.failed: Dict[str, int] = {request: 0 for request in REQUEST_ACKS}
+        self.last_rtt: Dict[str, Tuple[float, float]] = {}
+        # 确认事件类型 -> 待确认的 (请求类型, event_id, 发送时间)
+        self._pending: Dict[str, Deque[Tuple[str, str, float]]] = {ack: deque() for ack in REQUEST_ACKS.values()}
+        if export:
+            request_rtt_histogram()
+
+    def sent(self, request_type: str, event_id: str, timestamp: Optional[float] = None) -> None:
+        """请求已写入连接。"""
+        ack = REQUEST_ACKS.get(request_type)
+        if ack is not None:
+            self._pending[ack].append(
+                (request_type, event_id, timestamp if timestamp is not None else time.perf_counter())
+            )
+
+    def acknowledged(self, ack_type: str, timestamp: Optional[float] = None) -> Optional[Tuple[str, str, float]]:
+        """收到服务端事件；是待配对的确认时返回 (请求类型, event_id, 往返秒数)。"""
+        pending = self._pending.get(ack_type)
+        if not pending:
+            return None
+        request_type, event_id, sent_at = pending.popleft()
+        now = timestamp if timestamp is not None else time.perf_counter()
+        rtt = now - sent_at
+        self.rtt[request_type].append(rtt)
+        self.last_rtt[request_type] = (rtt, now)
+        if self.export:
+            request_rtt_histogram().labels(request=request_type).observe(rtt)
+        return request_type, event_id, rtt
+
+    def error(self, event_id: Optional[str]) -> Optional[str]:
+        """服务端报告 event_id 对应的请求出错，返回该请求的类型。"""
+        request_type = self.forget(event_id)
+        if request_type is not None:
+            self.failed[request_type] += 1
+        return request_type
+
+    def forget(self, event_id: Optional[str]) -> Optional[str]:
+        """撤销一个待确认的请求（例如发送失败），返回该请求的类型。"""
+        if not event_id:
+            return None
+        for pending in self._pending.values():
+            for entry in pending:
+                if entry[1] == event_id:
+                    pending.remove(entry)
+                    return entry[0]
+        return None
+
+    def reset(self) -> None:
+        """连接断开，旧连接上的请求不会再有确认。"""
+        for pending in self._pending.values():
+            pending.clear()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """各请求类型的样本数与往返时间中位数/p95（毫秒）。"""
+        result = {}
+        for request_type, samples in self.rtt.items():
+            if not samples and not self.failed[request_type]:
+                continue
+            ordered = sorted(samples)
+            result[request_type] = {
+                "count": len(ordered),
+                "failed": self.failed[request_type],
+                "p50_ms": ordered[len(ordered) // 2] * 1000 if ordered else None,
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000 if ordered else None,
+            }
+        return result
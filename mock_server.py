@@ -0,0 +1,415 @@
+# -- coding: utf-8 --
+"""
+本地 Realtime API 模拟服务器。
+
+实现 OmniRealtimeClient 用到的事件协议（session.update、conversation.item.create/truncate、
+input_audio_buffer.append/commit/clear、response.create/cancel，以及服务端的
+response.created、response.audio.delta、input_audio_buffer.speech_started 等），
+回复延迟、增量大小、发送节奏与抖动均可配置，用于在无网络环境下测量客户端实时路径的性能。
+每路连接记录对话上下文中的条目（音频时长与文本字数），可用 context_size() 观察上下文的增长。
+server_vad 模式默认按收到的音频时长判定说话起止；设置 energy_vad 后改为按上行音频的帧能量
+与会话中的 threshold / prefix_padding_ms / silence_duration_ms 判定，用于观察这些参数的效果。
+
+运行方式:
+    python mock_server.py [--port 8765] [--first-delta-ms 300] [--jitter-ms 20]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import websockets
+
+
+class MockScript:
+    """
+    模拟服务器的行为脚本。
+
+    属性说明:
+        setup_delay_ms (float): 收到 session.update 到回复 session.updated 的延迟。
+        first_delta_ms (float): 回复开始到第一个音频增量的延迟。
+        delta_ms (int): 每个音频增量包含的音频时长。
+        speed (float): 增量发送速度相对实时的倍数，服务端通常快于实时下发。
+        jitter_ms (float): 每个增量发送间隔叠加的随机抖动上限。
+        response_ms (int): 每次回复的音频总时长。
+        cancel_delay_ms (float): 收到 response.cancel 到回复 response.done 的延迟。
+        speech_start_ms (int): server_vad 模式下累计收到多少毫秒音频后判定开始说话。
+        speech_ms (int): server_vad 模式下开始说话后再收到多少毫秒音频判定说话结束。
+        sample_rate (int): 输出音频采样率。
+        input_sample_rate (int): 客户端上行音频采样率，用于换算收到的音频时长。
+        seed (int): 抖动随机数种子，保证可复现。
+        downlink_kbps (float): 大于 0 时按该带宽限制下行发送速率，模拟弱网；运行中可修改。
+        energy_vad (bool): server_vad 模式下按帧能量判定说话起止：帧 RMS 不低于 threshold × VAD_FULL_SCALE
+            为语音帧，连续 VAD_MIN_SPEECH_MS 语音判定开始说话，静音达到 silence_duration_ms 判定说完，
+            提交的音频从开始说话前 prefix_padding_ms 算起（不早于上一次提交的结尾）。
+        transcribe (Callable[[float, float], str]): 给定提交的音频在上行时间轴上的 (开始ms, 结束ms)
+            返回输入转录；设置后每次提交都下发 conversation.item.input_audio_transcription.completed。
+    """
+    VAD_FULL_SCALE = 8000
+    VAD_FRAME_MS = 20
+    VAD_MIN_SPEECH_MS = 60
+
+    def __init__(
+        self,
+        setup_delay_ms: float = 20,
+        first_delta_ms: float = 300,
+        delta_ms: int = 100,
+        speed: float = 4.0,
+        jitter_ms: float = 0,
+        response_ms: int = 3000,
+        cancel_delay_ms: float = 20,
+        speech_start_ms: int = 1000,
+        speech_ms: int = 1500,
+        sample_rate: int = 24000,
+        input_sample_rate: int = 16000,
+        seed: int = 0,
+        downlink_kbps: float = 0,
+        energy_vad: bool = False,
+        transcribe: Optional[Callable[[float, float], str]] = None,
+    ):
+        self.setup_delay_ms = setup_delay_ms
+        self.first_delta_ms = first_delta_ms
+        self.delta_ms = delta_ms
+        self.speed = speed
+        self.jitter_ms = jitter_ms
+        self.response_ms = response_ms
+        self.cancel_delay_ms = cancel_delay_ms
+        self.speech_start_ms = speech_start_ms
+        self.speech_ms = speech_ms
+        self.sample_rate = sample_rate
+        self.input_sample_rate = input_sample_rate
+        self.seed = seed
+        self.downlink_kbps = downlink_kbps
+        self.energy_vad = energy_vad
+        self.transcribe = transcribe
+
+
+class MockSession:
+    """
+    模拟服务器上的一路连接。
+
+    属性说明:
+        conversation (List[Dict[str, Any]]): 对话上下文中的条目，含 id、role、audio_ms 与 text。
+    """
+    def __init__(self, ws, script: MockScript, session_index: int):
+        self.ws = ws
+        self.script = script
+        self.random = random.Random(script.seed + session_index)
+        self.session: Dict[str, Any] = {}
+        self.conversation: List[Dict[str, Any]] = []
+        self._event_counter = 0
+        self._response_counter = 0
+        self._response_task: Optional[asyncio.Task] = None
+        self._response_id: Optional[str] = None
+        self._appended_ms = 0.0
+        self._speaking = False
+        self._link_free_at = 0.0
+        # 能量 VAD 状态，时间均为上行音频时间轴上的毫秒
+        self._input_clock_ms = 0.0
+        self._vad_rest = np.zeros(0, dtype=np.int16)
+        self._voiced_run_ms = 0.0
+        self._silence_run_ms = 0.0
+        self._speech_start_ms = 0.0
+        self._committed_until_ms = 0.0
+        self._speech_item_id: Optional[str] = None
+        delta_samples = script.sample_rate * script.delta_ms // 1000
+        self._delta_b64 = base64.b64encode(b"\x00\x00" * delta_samples).decode()
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        self._event_counter += 1
+        event["event_id"] = f"event_mock_{self._event_counter}"
+        message = json.dumps(event)
+        if self.script.downlink_kbps > 0:
+            # 每条消息按顺序占用链路，发送前等到它在限速链路上传完为止
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            self._link_free_at = max(now, self._link_free_at) + len(message) * 8 / (self.script.downlink_kbps * 1000)
+            await asyncio.sleep(self._link_free_at - now)
+        await self.ws.send(message)
+
+    async def run(self) -> None:
+        try:
+            async for message in self.ws:
+                event = json.loads(message)
+                handler = getattr(self, "on_" + event.get("type", "").replace(".", "_"), None)
+                if handler:
+                    await handler(event)
+                else:
+                    await self.send({"type": "error", "error": {"message": f"Unsupported event: {event.get('type')}"}})
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            if self._response_task:
+                self._response_task.cancel()
+
+    @property
+    def server_vad(self) -> bool:
+        turn_detection = self.session.get("turn_detection")
+        return bool(turn_detection) and turn_detection.get("type") == "server_vad"
+
+    async def on_session_update(self, event: Dict[str, Any]) -> None:
+        await asyncio.sleep(self.script.setup_delay_ms / 1000)
+        self.session.update(event.get("session", {}))
+        await self.send({"type": "session.updated", "session": self.session})
+
+    def add_item(self, item_id: str, role: str, audio_ms: float = 0.0, text: str = "") -> Dict[str, Any]:
+        item = {"id": item_id, "role": role, "audio_ms": audio_ms, "text": text}
+        self.conversation.append(item)
+        return item
+
+    def context_size(self) -> Dict[str, float]:
+        """当前对话上下文的条目数、音频总时长（毫秒）与文本总字数。"""
+        return {
+            "items": len(self.conversation),
+            "audio_ms": sum(item["audio_ms"] for item in self.conversation),
+            "text_chars": sum(len(item["text"]) for item in self.conversation),
+        }
+
+    async def on_conversation_item_create(self, event: Dict[str, Any]) -> None:
+        self._event_counter += 1
+        item = dict(event.get("item", {}), id=f"item_mock_{self._event_counter}")
+        text = "".join(part.get("text", "") for part in item.get("content", []))
+        self.add_item(item["id"], item.get("role", "user"), text=text)
+        await self.send({"type": "conversation.item.created", "item": item})
+
+    async def on_conversation_item_truncate(self, event: Dict[str, Any]) -> None:
+        item_id = event.get("item_id")
+        item = next((item for item in self.conversation if item["id"] == item_id), None)
+        audio_end_ms = event.get("audio_end_ms", 0)
+        if item is None or item["role"] != "assistant" or audio_end_ms > item["audio_ms"]:
+            await self.send({"type": "error", "error": {
+                "message": f"Cannot truncate item {item_id} at {audio_end_ms} ms",
+                "event_id": event.get("event_id"),
+            }})
+            return
+        # 音频之后的转录一并移除，按音频比例保留文本
+        if item["audio_ms"]:
+            item["text"] = item["text"][:round(len(item["text"]) * audio_end_ms / item["audio_ms"])]
+        item["audio_ms"] = audio_end_ms
+        await self.send({
+            "type": "conversation.item.truncated",
+            "item_id": item_id,
+            "content_index": event.get("content_index", 0),
+            "audio_end_ms": audio_end_ms,
+        })
+
+    async def on_input_audio_buffer_append(self, event: Dict[str, Any]) -> None:
+        if self.script.energy_vad and self.server_vad:
+            await self._energy_vad(base64.b64decode(event.get("audio", "")))
+            return
+        # base64 长度换算 16bit 样本数，不必解码
+        samples = len(event.get("audio", "")) * 3 // 8
+        self._appended_ms += samples * 1000 / self.script.input_sample_rate
+        self._input_clock_ms += samples * 1000 / self.script.input_sample_rate
+        if not self.server_vad:
+            return
+        if not self._speaking and self._appended_ms >= self.script.speech_start_ms:
+            self._speaking = True
+            self._appended_ms = 0.0
+            await self.send({"type": "input_audio_buffer.speech_started", "audio_start_ms": 0})
+        elif self._speaking and self._appended_ms >= self.script.speech_ms:
+            self._speaking = False
+            self._appended_ms = 0.0
+            await self.send({"type": "input_audio_buffer.speech_stopped", "audio_end_ms": self.script.speech_ms})
+            await self.commit_input(self.script.speech_ms)
+            self.start_response()
+
+    async def _energy_vad(self, pcm: bytes) -> None:
+        script = self.script
+        params = self.session.get("turn_detection") or {}
+        level = params.get("threshold", 0.5) * script.VAD_FULL_SCALE
+        frame = script.input_sample_rate * script.VAD_FRAME_MS // 1000
+        samples = np.concatenate((self._vad_rest, np.frombuffer(pcm, dtype=np.int16)))
+        frames = len(samples) // frame
+        self._vad_rest = samples[frames * frame:]
+        for i in range(frames):
+            chunk = samples[i * frame:(i + 1) * frame].astype(np.float32)
+            voiced = float(np.sqrt(np.mean(chunk ** 2))) >= level
+            self._input_clock_ms += script.VAD_FRAME_MS
+            self._appended_ms += script.VAD_FRAME_MS
+            if not self._speaking:
+                self._voiced_run_ms = self._voiced_run_ms + script.VAD_FRAME_MS if voiced else 0.0
+                if self._voiced_run_ms >= script.VAD_MIN_SPEECH_MS:
+                    self._speaking = True
+                    self._silence_run_ms = 0.0
+                    self._speech_start_ms = self._input_clock_ms - self._voiced_run_ms
+                    self._event_counter += 1
+                    self._speech_item_id = f"item_mock_{self._event_counter}"
+                    await self.send({"type": "input_audio_buffer.speech_started",
+                                     "audio_start_ms": round(self._speech_start_ms),
+                                     "item_id": self._speech_item_id})
+                continue
+            self._silence_run_ms = 0.0 if voiced else self._silence_run_ms + script.VAD_FRAME_MS
+            if self._silence_run_ms < params.get("silence_duration_ms", 500):
+                continue
+            self._speaking = False
+            self._voiced_run_ms = 0.0
+            end_ms = self._input_clock_ms - self._silence_run_ms
+            # 前置填充取自上行缓冲区，不会早于上一次提交
+            start_ms = max(self._committed_until_ms, self._speech_start_ms - params.get("prefix_padding_ms", 300))
+            self._committed_until_ms = end_ms
+            await self.send({"type": "input_audio_buffer.speech_stopped", "audio_end_ms": round(end_ms),
+                             "item_id": self._speech_item_id})
+            self._appended_ms = 0.0
+            await self.commit_input(end_ms - start_ms, self._speech_item_id, start_ms)
+            self.start_response()
+
+    async def commit_input(self, audio_ms: float, item_id: Optional[str] = None,
+                           start_ms: Optional[float] = None) -> None:
+        if item_id is None:
+            self._event_counter += 1
+            item_id = f"item_mock_{self._event_counter}"
+        item = self.add_item(item_id, "user", audio_ms=audio_ms)
+        await self.send({"type": "input_audio_buffer.committed", "item_id": item_id})
+        if self.script.transcribe:
+            if start_ms is None:
+                start_ms = self._input_clock_ms - audio_ms
+            item["text"] = self.script.transcribe(start_ms, start_ms + audio_ms)
+            await self.send({"type": "conversation.item.input_audio_transcription.completed",
+                             "item_id": item_id, "content_index": 0, "transcript": item["text"]})
+
+    async def on_input_audio_buffer_commit(self, event: Dict[str, Any]) -> None:
+        audio_ms, self._appended_ms = self._appended_ms, 0.0
+        await self.commit_input(audio_ms)
+
+    async def on_input_audio_buffer_clear(self, event: Dict[str, Any]) -> None:
+        self._appended_ms = 0.0
+        await self.send({"type": "input_audio_buffer.cleared"})
+
+    async def on_input_image_buffer_append(self, event: Dict[str, Any]) -> None:
+        pass
+
+    async def on_response_create(self, event: Dict[str, Any]) -> None:
+        self.start_response(event.get("response", {}).get("modalities"))
+
+    async def on_response_cancel(self, event: Dict[str, Any]) -> None:
+        if not self._response_task or self._response_task.done():
+            await self.send({"type": "error", "error": {"message": "No active response to cancel"}})
+            return
+        self._response_task.cancel()
+        await asyncio.sleep(self.script.cancel_delay_ms / 1000)
+        await self.send({"type": "response.done", "response": {"id": self._response_id, "status": "cancelled"}})
+
+    def start_response(self, modalities: Optional[List[str]] = None) -> None:
+        if self._response_task and not self._response_task.done():
+            self._response_task.cancel()
+        self._response_counter += 1
+        self._response_id = f"resp_mock_{self._response_counter}"
+        audio = "audio" in (modalities or self.session.get("modalities", ["text", "audio"]))
+        self._response_task = asyncio.create_task(self._stream_response(self._response_id, audio))
+
+    async def _stream_response(self, response_id: str, audio: bool = True) -> None:
+        script = self.script
+        item_id = f"item_{response_id}"
+        item = self.add_item(item_id, "assistant")
+        await self.send({"type": "response.created", "response": {"id": response_id, "status": "in_progress"}})
+        await self.send({"type": "response.output_item.added", "response_id": response_id, "item": {"id": item_id}})
+        await asyncio.sleep(script.first_delta_ms / 1000)
+
+        interval = script.delta_ms / 1000 / script.speed
+        for _ in range(max(1, script.response_ms // script.delta_ms)):
+            if not audio:
+                # 纯文本回复：只下发文本增量
+                await self.send({"type": "response.text.delta", "response_id": response_id, "delta": "好"})
+                item["text"] += "好"
+                await asyncio.sleep(interval + self.random.uniform(0, script.jitter_ms) / 1000)
+                continue
+            await self.send({
+                "type": "response.audio.delta",
+                "response_id": response_id,
+                "item_id": item_id,
+                "output_index": 0,
+                "content_index": 0,
+                "delta": self._delta_b64,
+            })
+            await self.send({"type": "response.audio_transcript.delta", "response_id": response_id, "delta": "好"})
+            # 已下发的部分即进入上下文，取消的回复同样保留
+            item["audio_ms"] += script.delta_ms
+            item["text"] += "好"
+            await asyncio.sleep(interval + self.random.uniform(0, script.jitter_ms) / 1000)
+
+        if audio:
+            await self.send({"type": "response.audio.done", "response_id": response_id, "item_id": item_id})
+            await self.send({"type": "response.audio_transcript.done", "response_id": response_id, "item_id": item_id})
+        else:
+            await self.send({"type": "response.text.done", "response_id": response_id, "item_id": item_id})
+        await self.send({"type": "response.done", "response": {"id": response_id, "status": "completed"}})
+
+
+class MockRealtimeServer:
+    """
+    本地模拟 Realtime 服务器，可用作异步上下文管理器。
+
+    属性说明:
+        script (MockScript): 行为脚本，对之后建立的连接生效。
+        url (str): 供 OmniRealtimeClient 使用的 base_url。
+        sessions (int): 累计接受的连接数。
+        connections (List[MockSession]): 已接受的连接，按建立顺序排列。
+    """
+    def __init__(self, script: Optional[MockScript] = None, host: str = "localhost", port: int = 0):
+        self.script = script or MockScript()
+        self.host = host
+        self.port = port
+        self.sessions = 0
+        self.connections: List[MockSession] = []
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def _handler(self, ws) -> None:
+        self.sessions += 1
+        session = MockSession(ws, self.script, self.sessions)
+        self.connections.append(session)
+        await session.run()
+
+    async def start(self) -> None:
+        self._server = await websockets.serve(self._handler, self.host, self.port, max_size=None)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "MockRealtimeServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
+
+async def _main(args) -> None:
+    script = MockScript(
+        first_delta_ms=args.first_delta_ms,
+        delta_ms=args.delta_ms,
+        speed=args.speed,
+        jitter_ms=args.jitter_ms,
+        response_ms=args.response_ms,
+        downlink_kbps=args.downlink_kbps,
+    )
+    async with MockRealtimeServer(script, port=args.port) as server:
+        print(f"模拟 Realtime 服务器已启动: {server.url}")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 Realtime API 模拟服务器")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-delta-ms", type=float, default=300)
+    parser.add_argument("--delta-ms", type=int, default=100)
+    parser.add_argument("--speed", type=float, default=4.0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--response-ms", type=int, default=3000)
+    parser.add_argument("--downlink-kbps", type=float, default=0, help="下行限速，0 表示不限速")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
@@ -1,20 +1,78 @@
 # -- coding: utf-8 --
 
 import asyncio
+import backoff
+import contextlib
 import websockets
+import websockets.exceptions
 import json
 import base64
+import binascii
+import re
 import time
-from typing import Optional, Callable, List, Dict, Any
+import uuid
+from collections import deque
+from typing import TYPE_CHECKING, Optional, Callable, Awaitable, List, Dict, Any, Tuple
 from enum import Enum
 
+from event_bus import (
+    AUDIO_DELTA, INPUT_TRANSCRIPT, INTERRUPT, OUTPUT_TRANSCRIPT, SPEECH_EVENT, TEXT_DELTA,
+    DeliveryMode, EventBus, Subscription,
+)
+from metrics import RequestCorrelator, TurnTimeline, uplink_queue_metrics
+
+if TYPE_CHECKING:
+    # 仅用于类型标注；archive 会加载 numpy，运行时导入会拖慢 import omni
+    from archive import AudioArchive
+    from recorder import SessionRecorder
+
 # 在这里硬编码API密钥
 API_KEY = " "  
 
+# 用于音频增量快速路径的模式：只在消息中定位 type 与 delta 字段
+_AUDIO_DELTA_TYPE_RE = re.compile(r'"type"\s*:\s*"response\.audio\.delta"')
+_DELTA_VALUE_RE = re.compile(r'"delta"\s*:\s*"')
+# server_vad 的初始参数，运行中可由 set_turn_detection 调整（见 vad_tuner.py）
+SERVER_VAD_DEFAULTS = {
+    "threshold": 0.1,
+    "prefix_padding_ms": 500,
+    "silence_duration_ms": 900,
+}
+
 class TurnDetectionMode(Enum):
     SERVER_VAD = "server_vad"
     MANUAL = "manual"
 
+class AudioAppendEncoder:
+    """
+    input_audio_buffer.append 事件的预序列化编码器。
+
+    JSON 信封的前后缀只生成一次，每帧仅把 base64 写入可复用的帧缓冲区，
+    不再构造字典、调用 json.dumps 或生成 str。返回的视图在下一次 encode 前有效。
+    """
+    PREFIX = b'{"type":"input_audio_buffer.append","audio":"'
+    SUFFIX = b'"}'
+
+    def __init__(self):
+        self._frame = bytearray()
+        self._payload_len = -1
+
+    def encode(self, pcm: bytes) -> memoryview:
+        """把 PCM 数据编码为完整的事件帧（UTF-8 JSON）。"""
+        payload_len = 4 * ((len(pcm) + 2) // 3)
+        start = len(self.PREFIX)
+        if payload_len != self._payload_len:
+            self._frame = bytearray(start + payload_len + len(self.SUFFIX))
+            self._frame[:start] = self.PREFIX
+            self._frame[start + payload_len:] = self.SUFFIX
+            self._payload_len = payload_len
+        self._frame[start:start + payload_len] = binascii.b2a_base64(pcm, newline=False)
+        return memoryview(self._frame)
+
+    def decode(self, frame) -> bytes:
+        """从 encode 生成的帧中还原 PCM 数据，仅用于发送失败时的回收。"""
+        return binascii.a2b_base64(bytes(frame[len(self.PREFIX):-len(self.SUFFIX)]))
+
 class OmniRealtimeClient:
     """
     与 Omni Realtime API 交互的演示客户端。
@@ -30,6 +88,34 @@ class OmniRealtimeClient:
         on_interrupt (Callable[[], None]): 用户打断回调函数。
         on_output_transcript (Callable[[str], None]): 输出转录文本回调函数。
         extra_event_handlers (Dict[str, Callable[[Dict[str, Any]], None]]): 其他事件处理器。
+        input_sample_rate (int): 上行音频采样率，用于换算合并时长。
+        audio_coalesce_ms (int): 上行音频合并预算，多个采集周期合并为一个 WebSocket 帧，0 表示不合并。
+        verbose (bool): 是否打印收到的每个服务端事件。
+        recorder (SessionRecorder): 可选的会话录制器，记录收发的每个事件。
+        auto_reconnect (bool): 连接断开后是否自动重连并恢复会话配置与人设。
+        reconnect_max_time (float): 单次重连的最长尝试时间（秒），超时后放弃。
+        outage_buffer_ms (int): 断线期间最多缓存的上行音频时长，超出时丢弃最旧的音频。
+        reconnect_durations (List[float]): 历次重连从断线到会话恢复的耗时（秒）。
+        failure (ConnectionError): 重连放弃后的终止错误；设置后 send_event 与 stream_audio 直接抛出它，
+            直到再次调用 connect()。
+        api_key (str): DashScope API 密钥，未指定时使用模块中硬编码的密钥。
+        timeline (TurnTimeline): 可选的每轮延迟时间线，记录服务端事件的到达时间。
+        session_updated (asyncio.Event): 最近一次 session.update 已被服务端确认（收到 session.updated）。
+        events (EventBus): 事件总线，发布音频/文本增量、转录与打断；未指定时每个客户端自建一个。
+            on_audio_delta 与 on_interrupt 在接收循环中直接调用；on_text_delta 与两个转录回调
+            经总线的批量订阅在工作线程中调用，连续的增量合并为一次回调。
+        send_queue_ms (int): 大于 0 时启用独立的发送任务与有界发送队列：采集循环只入队不等待网络，
+            排队音频超过该时长时丢弃最旧的音频帧，控制事件从不丢弃，图像只保留最新一帧；
+            为 0 时在调用方直接发送。
+        export_metrics (bool): 是否把发送队列深度与丢弃计数导出到 Prometheus。
+        send_dropped_frames (int) / send_dropped_ms (float): 发送队列因积压丢弃的音频帧数与时长。
+        correlator (RequestCorrelator): 请求与服务端确认的配对表，记录每对的往返时间。
+        downlink_bytes (int): 累计收到的服务端消息字节数（文本帧按字符数计）。
+        archive (AudioArchive): 可选的会话音频归档，写入上行音频、下行音频增量与轮次边界事件。
+        playback_position (Callable[[], Tuple[float, float]]): 返回播放端累计 (已写入, 已交给设备) 的
+            音频时长（毫秒）。设置后打断时把最近一条音频回复截断（conversation.item.truncate）到
+            实际播出的位置，服务端上下文中不再保留用户没有听到的部分。
+        truncations (int) / truncated_ms (float): 已发送的截断次数与截掉的已下发未播放音频时长。
     """
     def __init__(
         self,
@@ -42,10 +128,24 @@ class OmniRealtimeClient:
         on_interrupt: Optional[Callable[[], None]] = None,
         on_input_transcript: Optional[Callable[[str], None]] = None,
         on_output_transcript: Optional[Callable[[str], None]] = None,
-        extra_event_handlers: Optional[Dict[str, Callable[[Dict[str, Any]], None]]] = None
+        extra_event_handlers: Optional[Dict[str, Callable[[Dict[str, Any]], None]]] = None,
+        input_sample_rate: int = 16000,
+        audio_coalesce_ms: int = 0,
+        verbose: bool = False,
+        recorder: Optional["SessionRecorder"] = None,
+        auto_reconnect: bool = True,
+        reconnect_max_time: float = 60.0,
+        outage_buffer_ms: int = 3000,
+        api_key: Optional[str] = None,
+        timeline: Optional[TurnTimeline] = None,
+        event_bus: Optional[EventBus] = None,
+        send_queue_ms: int = 0,
+        export_metrics: bool = False,
+        archive: Optional["AudioArchive"] = None,
+        playback_position: Optional[Callable[[], Tuple[float, float]]] = None
     ):
         self.base_url = base_url
-        self.api_key = API_KEY  # 使用硬编码的API密钥
+        self.api_key = api_key or API_KEY  # 未指定时使用硬编码的API密钥
         self.model = model
         self.voice = voice
         self.ws = None
@@ -56,23 +156,91 @@ class OmniRealtimeClient:
         self.on_output_transcript = on_output_transcript
         self.turn_detection_mode = turn_detection_mode
         self.extra_event_handlers = extra_event_handlers or {}
+        self.input_sample_rate = input_sample_rate
+        self.audio_coalesce_ms = audio_coalesce_ms
+        self.verbose = verbose
+        self.recorder = recorder
+        self.archive = archive
+        self.playback_position = playback_position
+        self.timeline = timeline
+        self.events = event_bus or EventBus()
+        self._owns_events = event_bus is None
+        self._text_subscription: Optional[Subscription] = None
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_max_time = reconnect_max_time
+        self.outage_buffer_ms = outage_buffer_ms
+        self._event_handlers = self._build_event_handlers()
 
         # 当前回复状态
         self._current_response_id = None
         self._current_item_id = None
         self._is_responding = False
+        # 最近一条带音频的输出条目及其首个音频增量写入前播放端的累计写入位置（毫秒），用于打断时截断；
+        # 新条目先记为待定，收到它的音频增量后才需要截断，纯文本条目不截断
+        self._audio_item_id: Optional[str] = None
+        self._audio_item_start_ms = 0.0
+        self._pending_audio_item_id: Optional[str] = None
+        self.truncations = 0
+        self.truncated_ms = 0.0
         # 输入/输出转录打印状态
         self._print_input_transcript = False
         self._output_transcript_buffer = ""
+        # 上行音频快速路径
+        self._audio_encoder = AudioAppendEncoder()
+        self._pending_audio = bytearray()
+        self._pending_audio_ms = 0.0
+        # 连接与重连状态
+        # _session_ready 仅在断线重连期间被清除
+        self._session_ready = asyncio.Event()
+        self._session_ready.set()
+        self._rehydrating = False
+        self._closing = False
+        self.failure: Optional[ConnectionError] = None
+        self._session_config: Optional[Dict[str, Any]] = None
+        self.session_updated = asyncio.Event()
+        self._outage_audio = deque()
+        self._outage_audio_ms = 0.0
+        # 重连指标
+        self.reconnect_count = 0
+        self.reconnect_attempts = 0
+        self.reconnect_durations: List[float] = []
+        self.outage_dropped_ms = 0.0
+        # 发送队列：元素为 [类型, 载荷, 音频时长]，类型为 audio / image / control
+        self.send_queue_ms = send_queue_ms
+        self._send_queue = deque()
+        self._send_wakeup = asyncio.Event()
+        self._sender_task: Optional[asyncio.Task] = None
+        self.queued_audio_ms = 0.0
+        self.send_queue_bytes = 0
+        self.send_dropped_frames = 0
+        self.send_dropped_ms = 0.0
+        self.send_queue_max_ms = 0.0
+        self._queue_metrics = uplink_queue_metrics() if export_metrics else None
+        # event_id 为 会话前缀 + 单调递增序号，同一毫秒内发送的事件也不会重复
+        self._event_id_prefix = uuid.uuid4().hex[:8]
+        self._event_seq = 0
+        self.correlator = RequestCorrelator(export=export_metrics)
+        self.downlink_bytes = 0
 
-    async def connect(self) -> None:
-        """与 Realtime API 建立 WebSocket 连接。"""
+    async def _open_socket(self) -> None:
+        """打开 WebSocket 连接。"""
         url = f"{self.base_url}?model={self.model}"
         headers = {
             "Authorization": f"Bearer {self.api_key}"
         }
 
         self.ws = await websockets.connect(url, additional_headers=headers)
+        if self.recorder:
+            self.ws = self.recorder.wrap(self.ws)
+
+    async def connect(self) -> None:
+        """与 Realtime API 建立 WebSocket 连接。"""
+        self._closing = False
+        self.failure = None
+        await self._open_socket()
+        if self.send_queue_ms > 0 and (self._sender_task is None or self._sender_task.done()):
+            self._sender_task = asyncio.create_task(self._sender())
+            self._sender_task.add_done_callback(self._on_sender_done)
 
         # 设置默认会话配置
         if self.turn_detection_mode == TurnDetectionMode.MANUAL:
@@ -95,12 +263,7 @@ class OmniRealtimeClient:
                 "input_audio_transcription": {
                     "model": "gummy-realtime-v1"
                 },
-                "turn_detection": {
-                    "type": "server_vad",
-                    "threshold": 0.1,
-                    "prefix_padding_ms": 500,
-                    "silence_duration_ms": 900
-                }
+                "turn_detection": dict(type="server_vad", **SERVER_VAD_DEFAULTS)
             })
         else:
             raise ValueError(f"Invalid turn detection mode: {self.turn_detection_mode}")
@@ -145,12 +308,131 @@ class OmniRealtimeClient:
         print("小柚人设设定完成！")
 
     async def send_event(self, event) -> None:
-        event['event_id'] = "event_" + str(int(time.time() * 1000))
+        # 发送队列模式直接入队，由发送任务等待会话恢复，采集循环不等网络；
+        # 直接发送模式下重连期间的控制事件等待会话恢复后再发送；恢复过程本身直接发送
+        queued = self._sender_task is not None and not self._rehydrating
+        if not queued and not self._session_ready.is_set() and not self._rehydrating and self.auto_reconnect:
+            await self._session_ready.wait()
+        if self.failure is not None:
+            raise self.failure
+        self._event_seq += 1
+        event['event_id'] = f"event_{self._event_id_prefix}_{self._event_seq}"
         print(f" Send event: type={event['type']}, event_id={event['event_id']}")
-        await self.ws.send(json.dumps(event))
+        if queued:
+            self._check_sender()
+            kind = "image" if event["type"] == "input_image_buffer.append" else "control"
+            self._enqueue(kind, json.dumps(event), request=(event["type"], event["event_id"]))
+            return
+        message = json.dumps(event)
+        self.correlator.sent(event["type"], event["event_id"])
+        await self.ws.send(message)
+
+    def _check_sender(self) -> None:
+        """发送任务已退出（连接关闭且不自动重连，或发送出错）时抛出其异常，而不是继续入队。"""
+        task = self._sender_task
+        if task is not None and task.done() and not task.cancelled():
+            error = task.exception()
+            raise error if error is not None else ConnectionError("send queue task has exited")
+
+    @staticmethod
+    def _on_sender_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print(f"发送任务退出: {task.exception()!r}")
+
+    def _enqueue(self, kind: str, payload, audio_ms: float = 0.0, request: Optional[tuple] = None) -> None:
+        """放入发送队列并执行丢弃策略，从不阻塞。"""
+        queue = self._send_queue
+        if kind == "image":
+            # 图像只保留最新一帧
+            for item in list(queue):
+                if item[0] == "image":
+                    queue.remove(item)
+                    self._account_dequeued(item)
+        queue.append([kind, payload, audio_ms, request])
+        self.queued_audio_ms += audio_ms
+        self.send_queue_bytes += len(payload)
+        # 积压超过预算时丢弃最旧的音频，控制事件原样保留
+        if self.queued_audio_ms > self.send_queue_ms:
+            for item in list(queue):
+                if self.queued_audio_ms <= self.send_queue_ms:
+                    break
+                if item[0] == "audio" and item is not queue[-1]:
+                    queue.remove(item)
+                    self._account_dequeued(item)
+                    self.send_dropped_frames += 1
+                    self.send_dropped_ms += item[2]
+                    if self._queue_metrics:
+                        self._queue_metrics["dropped_frames"].inc()
+                        self._queue_metrics["dropped_ms"].inc(item[2])
+        if self.queued_audio_ms > self.send_queue_max_ms:
+            self.send_queue_max_ms = self.queued_audio_ms
+        if self._queue_metrics:
+            self._queue_metrics["depth_ms"].observe(self.queued_audio_ms)
+        self._send_wakeup.set()
+
+    def _account_dequeued(self, item) -> None:
+        self.queued_audio_ms -= item[2]
+        self.send_queue_bytes -= len(item[1])
+
+    def _take_send_batch(self):
+        """取出队首的一个控制/图像事件，或连续的若干音频帧（最多 500ms）合并为一帧。"""
+        queue = self._send_queue
+        first = queue.popleft()
+        self._account_dequeued(first)
+        if first[0] != "audio":
+            return [first], first[1]
+        items = [first]
+        audio_ms = first[2]
+        while queue and queue[0][0] == "audio" and audio_ms + queue[0][2] <= 500:
+            item = queue.popleft()
+            self._account_dequeued(item)
+            items.append(item)
+            audio_ms += item[2]
+        pcm = items[0][1] if len(items) == 1 else b"".join(item[1] for item in items)
+        return items, self._audio_encoder.encode(pcm)
+
+    async def _sender(self) -> None:
+        """
+        独立的发送任务：按顺序发送队列中的事件，断线时保留队列等待会话恢复。
+
+        不自动重连时连接关闭、或发送出现其他异常，任务以该异常结束，之后的 stream_audio/send_event 抛出它。
+        """
+        while True:
+            if not self._send_queue:
+                self._send_wakeup.clear()
+                await self._send_wakeup.wait()
+                continue
+            await self._session_ready.wait()
+            if self.failure is not None:
+                raise self.failure
+            items, message = self._take_send_batch()
+            ws = self.ws
+            try:
+                if items[0][0] == "audio":
+                    await self.ws.send(message, text=True)
+                else:
+                    self.correlator.sent(*items[0][3])
+                    await self.ws.send(message)
+            except websockets.exceptions.ConnectionClosed:
+                # 放回队首，会话恢复后重发
+                if items[0][3] is not None:
+                    self.correlator.forget(items[0][3][1])
+                for item in reversed(items):
+                    self._send_queue.appendleft(item)
+                    self.queued_audio_ms += item[2]
+                    self.send_queue_bytes += len(item[1])
+                if self._closing:
+                    return
+                if not self.auto_reconnect:
+                    raise
+                # 若接收循环已经换上新连接，直接在新连接上重发
+                if self.ws is ws:
+                    self._session_ready.clear()
 
     async def update_session(self, config: Dict[str, Any]) -> None:
         """更新会话配置。"""
+        self._session_config = config
+        self.session_updated.clear()
         event = {
             "type": "session.update",
             "session": config
@@ -158,19 +440,171 @@ class OmniRealtimeClient:
         print("update session: ", event)
         await self.send_event(event)
 
+    async def set_modalities(self, modalities: List[str]) -> None:
+        """只切换输出模态（例如弱网时改为纯文本），其余会话配置保持不变。"""
+        await self.update_session(dict(self._session_config or {}, modalities=list(modalities)))
+
+    @property
+    def turn_detection_config(self) -> Optional[Dict[str, Any]]:
+        """当前会话的 turn_detection 配置，手动模式或尚未配置时为 None。"""
+        return (self._session_config or {}).get("turn_detection")
+
+    async def set_turn_detection(self, **params) -> None:
+        """只调整 server_vad 参数（threshold、prefix_padding_ms、silence_duration_ms），其余会话配置保持不变。"""
+        config = dict(self._session_config or {})
+        config["turn_detection"] = dict(config.get("turn_detection") or {}, **params)
+        await self.update_session(config)
+
+    def send_backlog(self) -> int:
+        """发送队列与 WebSocket 传输层中尚未写出的字节数，取不到的部分视为 0。"""
+        backlog = self.send_queue_bytes
+        transport = getattr(self.ws, "transport", None) if self.ws is not None else None
+        if transport is None:
+            return backlog
+        try:
+            return backlog + transport.get_write_buffer_size()
+        except (AttributeError, NotImplementedError):
+            return backlog
+
     async def stream_audio(self, audio_chunk: bytes) -> None:
-        """向 API 流式发送原始音频数据。"""
-        # 仅支持 16bit 16kHz 单声道 PCM
-        audio_b64 = base64.b64encode(audio_chunk).decode()
+        """
+        向 API 流式发送原始音频数据（16bit 单声道 PCM，采样率为 input_sample_rate）。
+
+        热路径不打印、不生成 event_id。若设置了 audio_coalesce_ms，
+        音频先在本地累积，直到再加一个同样长度的采集周期会超出预算时才发送。
+        """
+        if self.failure is not None:
+            raise self.failure
+        chunk_ms = len(audio_chunk) * 500 / self.input_sample_rate
+        if self.archive:
+            self.archive.write_input(audio_chunk)
+        if self._sender_task is not None:
+            # 发送队列模式：断线期间同样入队，由队列的丢弃策略限制积压
+            self._check_sender()
+            self._enqueue("audio", bytes(audio_chunk), chunk_ms)
+            return
+        if not self._session_ready.is_set():
+            self._hold_outage_audio(audio_chunk)
+            return
+
+        if not self._pending_audio and chunk_ms * 2 > self.audio_coalesce_ms:
+            # 不需要合并时直接编码，省去一次拷贝
+            await self._send_audio_frame(self._audio_encoder.encode(audio_chunk))
+            return
+
+        self._pending_audio += audio_chunk
+        self._pending_audio_ms += chunk_ms
+        if self._pending_audio_ms + chunk_ms > self.audio_coalesce_ms:
+            await self.flush_audio()
 
-        append_event = {
-            "type": "input_audio_buffer.append",
-            "audio": audio_b64
+    async def flush_audio(self) -> None:
+        """立即发送本地累积的上行音频。"""
+        if not self._pending_audio:
+            return
+        frame = self._audio_encoder.encode(self._pending_audio)
+        self._pending_audio.clear()
+        self._pending_audio_ms = 0.0
+        await self._send_audio_frame(frame)
+
+    async def _send_audio_frame(self, frame) -> None:
+        """发送音频帧；连接已断开时把音频转入断线缓存，不阻塞采集。"""
+        try:
+            await self.ws.send(frame, text=True)
+        except websockets.exceptions.ConnectionClosed:
+            if not self.auto_reconnect or self._closing:
+                raise
+            self._session_ready.clear()
+            self._hold_outage_audio(self._audio_encoder.decode(frame))
+
+    def _hold_outage_audio(self, audio_chunk: bytes) -> None:
+        """缓存断线期间的上行音频，超出 outage_buffer_ms 时丢弃最旧的部分。"""
+        chunk_ms = len(audio_chunk) * 500 / self.input_sample_rate
+        self._outage_audio.append(audio_chunk)
+        self._outage_audio_ms += chunk_ms
+        while self._outage_audio_ms > self.outage_buffer_ms and len(self._outage_audio) > 1:
+            dropped_ms = len(self._outage_audio.popleft()) * 500 / self.input_sample_rate
+            self._outage_audio_ms -= dropped_ms
+            self.outage_dropped_ms += dropped_ms
+
+    async def _flush_outage_audio(self) -> None:
+        """会话恢复后按原顺序补发断线期间缓存的音频。"""
+        while self._outage_audio:
+            audio_chunk = self._outage_audio.popleft()
+            await self.ws.send(self._audio_encoder.encode(audio_chunk), text=True)
+        self._outage_audio_ms = 0.0
+
+    async def _rehydrate(self) -> None:
+        """重新建立连接，并重放会话配置与人设。"""
+        self.reconnect_attempts += 1
+        await self._open_socket()
+        self._rehydrating = True
+        try:
+            if self._session_config is not None:
+                await self.update_session(self._session_config)
+            await self.setup_character_persona()
+            await self._flush_outage_audio()
+        except BaseException:
+            # 重放中途失败：关闭本次打开的连接再重试，避免遗留半开的 socket
+            with contextlib.suppress(Exception):
+                await self.ws.close()
+            raise
+        finally:
+            self._rehydrating = False
+        self._session_ready.set()
+
+    async def reconnect(self) -> bool:
+        """以带抖动的指数退避重连，成功返回 True；放弃时设置 failure。"""
+        self._session_ready.clear()
+        self._is_responding = False
+        self._current_response_id = None
+        self._current_item_id = None
+        # 新连接上是新的对话，旧条目无需截断
+        self._audio_item_id = None
+        self._pending_audio_item_id = None
+        # 未发出的合并音频同样转入断线缓存
+        if self._pending_audio:
+            self._hold_outage_audio(bytes(self._pending_audio))
+            self._pending_audio.clear()
+            self._pending_audio_ms = 0.0
+
+        self.correlator.reset()
+        print(" Connection lost, reconnecting...")
+        start = time.monotonic()
+        retry = backoff.on_exception(
+            backoff.expo,
+            (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException),
+            max_time=self.reconnect_max_time,
+            max_value=10,
+            jitter=backoff.full_jitter,
+        )(self._rehydrate)
+        try:
+            await retry()
+        except Exception as e:
+            print(" Reconnect failed: ", str(e))
+            # 放弃重连：记下终止错误并唤醒等待会话恢复的发送方，让它们抛出而不是一直等待
+            self.failure = ConnectionError(f"reconnect failed after {time.monotonic() - start:.1f}s: {e}")
+            self._session_ready.set()
+            self._send_wakeup.set()
+            return False
+
+        duration = time.monotonic() - start
+        self.reconnect_count += 1
+        self.reconnect_durations.append(duration)
+        print(f" Reconnected in {duration * 1000:.0f} ms")
+        return True
+
+    async def clear_audio_buffer(self) -> None:
+        """清空服务端尚未提交的上行音频，例如手动模式下长时间只有静音时。"""
+        self._pending_audio.clear()
+        self._pending_audio_ms = 0.0
+        event = {
+            "type": "input_audio_buffer.clear"
         }
-        await self.send_event(append_event)
+        await self.send_event(event)
 
     async def commit_audio_buffer(self) -> None:
         """提交音频缓冲区以触发处理。"""
+        await self.flush_audio()
         event = {
             "type": "input_audio_buffer.commit"
         }
@@ -192,7 +626,8 @@ class OmniRealtimeClient:
             "type": "response.create",
             "response": {
                 "instructions": "You are a helpful assistant.",
-                "modalities": ["text", "audio"]
+                # 与会话当前的输出模态一致，弱网降级为纯文本时不会被单次回复覆盖
+                "modalities": (self._session_config or {}).get("modalities", ["text", "audio"])
             }
         }
         print("create response: ", event)
@@ -205,90 +640,251 @@ class OmniRealtimeClient:
         }
         await self.send_event(event)
 
+    async def truncate_item(self, item_id: str, audio_end_ms: int) -> None:
+        """把服务端对话中的条目音频截断到 audio_end_ms，其后的音频与转录从上下文中移除。"""
+        event = {
+            "type": "conversation.item.truncate",
+            "item_id": item_id,
+            "content_index": 0,
+            "audio_end_ms": audio_end_ms
+        }
+        await self.send_event(event)
+
     async def handle_interruption(self):
-        """处理用户对当前回复的打断。"""
-        if not self._is_responding:
+        """处理用户打断：回复仍在下发时取消它，并把最近一条音频条目截断到已播放的位置。"""
+        cancelled = self._is_responding
+        if cancelled:
+            print(" Handling interruption")
+
+            # 1. 取消当前回复
+            if self._current_response_id:
+                await self.cancel_response()
+
+            self._is_responding = False
+            self._current_response_id = None
+            self._current_item_id = None
+
+        # 2. 服务端下发通常快于实时，回复结束后仍可能在播放，同样需要截断
+        await self._truncate_unplayed(cancelled)
+
+    async def _truncate_unplayed(self, cancelled: bool) -> None:
+        """把最近一条音频条目截断到实际交给播放设备的位置；已完整播出时不发送。"""
+        item_id, self._audio_item_id = self._audio_item_id, None
+        if item_id is None or self.playback_position is None:
+            return
+        written_ms, played_ms = self.playback_position()
+        received_ms = written_ms - self._audio_item_start_ms
+        heard_ms = min(max(0.0, played_ms - self._audio_item_start_ms), received_ms)
+        # 回复被取消时服务端可能已生成了尚未下发的音频，即使已收到的都播完了也要截断
+        if not cancelled and heard_ms >= received_ms:
             return
+        await self.truncate_item(item_id, int(heard_ms))
+        self.truncations += 1
+        self.truncated_ms += received_ms - heard_ms
+
+    def _build_event_handlers(self) -> Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]]:
+        """构建事件类型到处理函数的分发表。"""
+        return {
+            "error": self._on_error,
+            "session.updated": self._on_session_updated,
+            "response.created": self._on_response_created,
+            "response.output_item.added": self._on_output_item_added,
+            "response.done": self._on_response_done,
+            "input_audio_buffer.speech_started": self._on_speech_started,
+            "input_audio_buffer.speech_stopped": self._on_speech_stopped,
+            "response.text.delta": self._on_text_delta_event,
+            "response.audio.delta": self._on_audio_delta_event,
+            "conversation.item.input_audio_transcription.completed": self._on_input_transcript_completed,
+            "response.audio_transcript.delta": self._on_output_transcript_delta,
+            "response.audio_transcript.done": self._on_output_transcript_done,
+        }
+
+    @staticmethod
+    def _extract_audio_delta(message: str) -> Optional[str]:
+        """
+        不解析整条 JSON，直接从 response.audio.delta 消息中取出 base64 载荷。
+
+        非音频增量消息或无法安全截取（例如存在转义字符）时返回 None，由调用方走完整解析。
+        """
+        if not _AUDIO_DELTA_TYPE_RE.search(message):
+            return None
+        match = _DELTA_VALUE_RE.search(message)
+        if not match:
+            return None
+        start = match.end()
+        end = message.find('"', start)
+        if end < 0 or message.find("\\", start, end) >= 0:
+            return None
+        return message[start:end]
+
+    async def _on_error(self, event: Dict[str, Any]) -> None:
+        print(" Error: ", event['error'])
+        self.correlator.error(event['error'].get("event_id"))
+
+    async def _on_session_updated(self, event: Dict[str, Any]) -> None:
+        self.session_updated.set()
+        handler = self.extra_event_handlers.get("session.updated")
+        if handler:
+            handler(event)
 
-        print(" Handling interruption")
+    async def _on_response_created(self, event: Dict[str, Any]) -> None:
+        if self.timeline:
+            self.timeline.mark("response_created")
+        self._current_response_id = event.get("response", {}).get("id")
+        self._is_responding = True
 
-        # 1. 取消当前回复
-        if self._current_response_id:
-            await self.cancel_response()
+    async def _on_output_item_added(self, event: Dict[str, Any]) -> None:
+        self._current_item_id = event.get("item", {}).get("id")
+        if self.playback_position is not None:
+            self._pending_audio_item_id = self._current_item_id
 
+    async def _on_response_done(self, event: Dict[str, Any]) -> None:
+        if self.timeline:
+            self.timeline.finish_turn()
         self._is_responding = False
         self._current_response_id = None
         self._current_item_id = None
 
+    async def _on_speech_started(self, event: Dict[str, Any]) -> None:
+        print(" Speech detected")
+        self.events.publish(SPEECH_EVENT, event)
+        await self.user_speech_started()
+
+    async def user_speech_started(self) -> None:
+        """用户开始说话：开始新的一轮并打断当前回复。服务端 VAD 事件与客户端端点检测共用。"""
+        if self.timeline:
+            self.timeline.begin_turn()
+        # 回复下发完毕（response.done 之后）仍可能在播放，不论是否在回复中都要截断未播放的部分；
+        # 须在 on_interrupt 清空播放缓冲之前读取播放位置
+        await self.handle_interruption()
+
+        if self.on_interrupt:
+            print(" Handling on_interrupt, stop playback")
+            self.on_interrupt()
+        self.events.publish(INTERRUPT)
+
+    async def _on_speech_stopped(self, event: Dict[str, Any]) -> None:
+        if self.timeline:
+            self.timeline.mark("speech_stopped")
+        print(" Speech ended")
+        self.events.publish(SPEECH_EVENT, event)
+
+    def _publish_text(self, topic: str, text: str) -> None:
+        """发布文本类事件；设置了文本回调时首次发布前订阅批量投递。"""
+        if self._text_subscription is None and (
+            self.on_text_delta or self.on_input_transcript or self.on_output_transcript
+        ):
+            self._text_subscription = self.events.subscribe(
+                (TEXT_DELTA, INPUT_TRANSCRIPT, OUTPUT_TRANSCRIPT),
+                self._deliver_text,
+                DeliveryMode.BATCHED,
+            )
+        self.events.publish(topic, text)
+
+    def _deliver_text(self, topic: str, text: str) -> None:
+        # 在订阅的工作线程中运行，回调可以在投递间隙被替换
+        if topic == TEXT_DELTA:
+            callback = self.on_text_delta
+        elif topic == INPUT_TRANSCRIPT:
+            callback = self.on_input_transcript
+        else:
+            callback = self.on_output_transcript
+        if callback:
+            callback(text)
+
+    async def _on_text_delta_event(self, event: Dict[str, Any]) -> None:
+        self._publish_text(TEXT_DELTA, event["delta"])
+
+    async def _on_audio_delta_event(self, event: Dict[str, Any]) -> None:
+        self._deliver_audio(binascii.a2b_base64(event["delta"]))
+
+    def _deliver_audio(self, audio_data: bytes) -> None:
+        """把一个回复音频增量交给存档、播放回调与事件总线。"""
+        if self.timeline:
+            self.timeline.mark("first_audio_delta")
+        if self.archive:
+            self.archive.write_output(audio_data)
+        if self._pending_audio_item_id is not None:
+            # 条目的第一个音频增量：从此刻的写入位置起算它已播出的时长
+            self._audio_item_id, self._pending_audio_item_id = self._pending_audio_item_id, None
+            self._audio_item_start_ms = self.playback_position()[0]
+        if self.on_audio_delta:
+            self.on_audio_delta(audio_data)
+        self.events.publish(AUDIO_DELTA, audio_data)
+
+    async def _on_input_transcript_completed(self, event: Dict[str, Any]) -> None:
+        self.events.publish(SPEECH_EVENT, event)
+        self._publish_text(INPUT_TRANSCRIPT, event.get("transcript", ""))
+        self._print_input_transcript = True
+        if self._output_transcript_buffer:
+            self._publish_text(OUTPUT_TRANSCRIPT, self._output_transcript_buffer)
+            self._output_transcript_buffer = ""
+
+    async def _on_output_transcript_delta(self, event: Dict[str, Any]) -> None:
+        delta = event.get("delta", "")
+        if self.on_input_transcript and not self._print_input_transcript:
+            # 输入转录尚未到达，先缓存，保证先显示用户说的话
+            self._output_transcript_buffer += delta
+            return
+        self._publish_text(OUTPUT_TRANSCRIPT, delta)
+
+    async def _on_output_transcript_done(self, event: Dict[str, Any]) -> None:
+        self._print_input_transcript = False
+
     async def handle_messages(self) -> None:
-        try:
-            async for message in self.ws:
-                event = json.loads(message)
-                event_type = event.get("type")
-                
-                if event_type != "response.audio.delta":
-                    print(" event: ", event)
-                else:
-                    print(" event_type: ", event_type)
+        while True:
+            try:
+                await self._receive_messages()
+            except websockets.exceptions.ConnectionClosed:
+                print(" Connection closed")
+            except Exception as e:
+                print(" Error in message handling: ", str(e))
+                return
 
-                if event_type == "error":
-                    print(" Error: ", event['error'])
+            if self._closing or not self.auto_reconnect:
+                return
+            if not await self.reconnect():
+                return
+
+    async def _receive_messages(self) -> None:
+        """接收并分发消息，直到连接断开。"""
+        async for message in self.ws:
+            self.downlink_bytes += len(message)
+            # 快速路径：音频增量只取 delta 字段，不构造完整字典
+            if isinstance(message, str):
+                audio_b64 = self._extract_audio_delta(message)
+                if audio_b64 is not None:
+                    self._deliver_audio(binascii.a2b_base64(audio_b64))
                     continue
-                elif event_type == "response.created":
-                    self._current_response_id = event.get("response", {}).get("id")
-                    self._is_responding = True
-                elif event_type == "response.output_item.added":
-                    self._current_item_id = event.get("item", {}).get("id")
-                elif event_type == "response.done":
-                    self._is_responding = False
-                    self._current_response_id = None
-                    self._current_item_id = None
-                # Handle interruptions
-                elif event_type == "input_audio_buffer.speech_started":
-                    print(" Speech detected")
-                    if self._is_responding:
-                        print(" Handling interruption")
-                        await self.handle_interruption()
-
-                    if self.on_interrupt:
-                        print(" Handling on_interrupt, stop playback")
-                        self.on_interrupt()
-                elif event_type == "input_audio_buffer.speech_stopped":
-                    print(" Speech ended")
-                # Handle normal response events
-                elif event_type == "response.text.delta":
-                    if self.on_text_delta:
-                        self.on_text_delta(event["delta"])
-                elif event_type == "response.audio.delta":
-                    if self.on_audio_delta:
-                        audio_bytes = base64.b64decode(event["delta"])
-                        self.on_audio_delta(audio_bytes)
-                elif event_type == "conversation.item.input_audio_transcription.completed":
-                    transcript = event.get("transcript", "")
-                    if self.on_input_transcript:
-                        await asyncio.to_thread(self.on_input_transcript,transcript)
-                        self._print_input_transcript = True
-                elif event_type == "response.audio_transcript.delta":
-                    if self.on_output_transcript:
-                        delta = event.get("delta", "")
-                        if not self._print_input_transcript:
-                            self._output_transcript_buffer += delta
-                        else:
-                            if self._output_transcript_buffer:
-                                await asyncio.to_thread(self.on_output_transcript,self._output_transcript_buffer)
-                                self._output_transcript_buffer = ""
-                            await asyncio.to_thread(self.on_output_transcript,delta)
-                elif event_type == "response.audio_transcript.done":
-                    self._print_input_transcript = False
-                elif event_type in self.extra_event_handlers:
-                    self.extra_event_handlers[event_type](event)
 
-        except websockets.exceptions.ConnectionClosed:
-            print(" Connection closed")
-        except Exception as e:
-            print(" Error in message handling: ", str(e))
+            event = json.loads(message)
+            event_type = event.get("type")
+            self.correlator.acknowledged(event_type)
+            if self.archive:
+                self.archive.mark(event_type)
+
+            if self.verbose:
+                print(" event: ", event)
+
+            handler = self._event_handlers.get(event_type)
+            if handler:
+                await handler(event)
+            elif event_type in self.extra_event_handlers:
+                self.extra_event_handlers[event_type](event)
 
     async def close(self) -> None:
         """关闭 WebSocket 连接。"""
+        self._closing = True
         if self.ws:
             await self.ws.close()
+        if self.recorder:
+            self.recorder.flush()
+        if self._sender_task is not None:
+            self._sender_task.cancel()
+            self._sender_task = None
+        # 等待订阅者工作线程投递完剩余事件，放到线程池中进行以免阻塞事件循环
+        if self._owns_events:
+            await asyncio.to_thread(self.events.close)
+        elif self._text_subscription is not None:
+            await asyncio.to_thread(self.events.unsubscribe, self._text_subscription)
+        self._text_subscription = None
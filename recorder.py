@@ -0,0 +1,196 @@
+# -- coding: utf-8 --
+"""
+Realtime WebSocket 会话的录制与回放。
+
+录制文件为只追加的二进制格式：文件头 MAGIC 之后是连续的记录，每条记录为
+    <Q 单调时钟纳秒偏移> <B 标志位> <I 载荷长度> <载荷>
+标志位 bit0 表示方向（1 为服务端下发），bit1 表示二进制帧。
+
+运行方式:
+    python recorder.py 录制文件 [--speed 倍速，0 表示不限速]
+"""
+import argparse
+import asyncio
+import struct
+import time
+from typing import Iterator, List, NamedTuple, Optional, Union
+
+MAGIC = b"ORTR\x01"
+_HEADER = struct.Struct("<QBI")
+
+FLAG_RECEIVED = 0x01
+FLAG_BINARY = 0x02
+
+OUTPUT_RATE = 24000  # 服务端 pcm16 输出采样率
+
+
+class RecordedEvent(NamedTuple):
+    """录制文件中的一条记录。"""
+    timestamp_ns: int
+    received: bool
+    payload: Union[str, bytes]
+
+
+class SessionRecorder:
+    """
+    把收发的每个事件连同单调时间戳追加写入录制文件。
+
+    属性说明:
+        path (str): 录制文件路径。
+        events (int): 已写入的记录数。
+    """
+    def __init__(self, path: str, flush_every: int = 64):
+        self.path = path
+        self.events = 0
+        self._flush_every = flush_every
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._start_ns = time.monotonic_ns()
+
+    def record(self, payload, received: bool) -> None:
+        """追加一条记录，payload 可以是 str 或 bytes-like。"""
+        flags = FLAG_RECEIVED if received else 0
+        if isinstance(payload, str):
+            data = payload.encode()
+        else:
+            data = payload
+            # 上行的预序列化帧以 text=True 发送，只有下行的 bytes 才是二进制帧
+            if received:
+                flags |= FLAG_BINARY
+        self._file.write(_HEADER.pack(time.monotonic_ns() - self._start_ns, flags, len(data)))
+        self._file.write(data)
+        self.events += 1
+        if self.events % self._flush_every == 0:
+            self._file.flush()
+
+    def wrap(self, ws) -> "RecordingSocket":
+        """返回一个会记录收发内容的 WebSocket 代理。"""
+        return RecordingSocket(ws, self)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+class RecordingSocket:
+    """WebSocket 代理：转发 send 与消息迭代，并交给 SessionRecorder 记录。"""
+    def __init__(self, ws, recorder: SessionRecorder):
+        self._ws = ws
+        self._recorder = recorder
+
+    async def send(self, message, text: Optional[bool] = None) -> None:
+        self._recorder.record(message, received=False)
+        if text is None:
+            await self._ws.send(message)
+        else:
+            await self._ws.send(message, text=text)
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        async for message in self._ws:
+            self._recorder.record(message, received=True)
+            yield message
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
+
+
+def read_recording(path: str) -> Iterator[RecordedEvent]:
+    """按顺序读取录制文件中的记录。"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a session recording: {path}")
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            timestamp_ns, flags, length = _HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                # 录制进程被中断时最后一条记录可能不完整
+                return
+            payload = data if flags & FLAG_BINARY else data.decode()
+            yield RecordedEvent(timestamp_ns, bool(flags & FLAG_RECEIVED), payload)
+
+
+class ReplaySocket:
+    """
+    回放用的 WebSocket 替身：按录制时的节奏（除以 speed）吐出服务端消息，
+    客户端发出的消息收集在 sent 中。speed 为 0 时不限速。
+    """
+    def __init__(self, events: List[RecordedEvent], speed: float = 1.0):
+        self._events = [event for event in events if event.received]
+        self.speed = speed
+        self.sent: List[Union[str, bytes]] = []
+
+    async def send(self, message, text: Optional[bool] = None) -> None:
+        self.sent.append(message if isinstance(message, str) else bytes(message))
+
+    async def close(self) -> None:
+        pass
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        if not self._events:
+            return
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first_ns = self._events[0].timestamp_ns
+        for event in self._events:
+            if self.speed > 0:
+                delay = (event.timestamp_ns - first_ns) / 1e9 / self.speed - (loop.time() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield event.payload
+
+
+async def replay_session(client, path: str, speed: float = 1.0) -> ReplaySocket:
+    """把录制文件中的服务端消息送入 client.handle_messages 及其回调。"""
+    socket = ReplaySocket(list(read_recording(path)), speed)
+    client.ws = socket
+    # 录制结束即会话结束，回放时不触发重连
+    auto_reconnect, client.auto_reconnect = client.auto_reconnect, False
+    try:
+        await client.handle_messages()
+    finally:
+        client.auto_reconnect = auto_reconnect
+    return socket
+
+
+async def _main(path: str, speed: float) -> None:
+    from omni import OmniRealtimeClient
+
+    audio_bytes = 0
+
+    def on_audio_delta(data: bytes) -> None:
+        nonlocal audio_bytes
+        audio_bytes += len(data)
+
+    client = OmniRealtimeClient(base_url="", on_audio_delta=on_audio_delta)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    socket = await replay_session(client, path, speed)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    audio_seconds = audio_bytes / 2 / OUTPUT_RATE
+    print(f"回放 {len(socket._events)} 条服务端消息，客户端发出 {len(socket.sent)} 条")
+    print(f"墙钟 {wall:.3f}s，CPU {cpu * 1000:.1f}ms，输出音频 {audio_seconds:.1f}s")
+    if audio_seconds:
+        print(f"接收侧 CPU {cpu * 1000 / audio_seconds:.3f} ms/秒音频")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回放 Realtime 会话录制文件")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(_main(args.path, args.speed))
@@ -0,0 +1,93 @@
+# -- coding: utf-8 --
+"""
+16bit 单声道 PCM 的流式重采样。
+
+按有理数比 L/M（输出率/输入率约分）做多相 FIR 重采样：原型低通滤波器为 Kaiser 窗 sinc，
+拆成 L 个相位，每个输出样本只计算它所在相位的 taps 个乘加；块与块之间保留滤波器历史
+与相位，任意切块得到的输出与整段一次处理一致。整块计算用 NumPy 向量化完成。
+
+设备以自身的原生采样率打开一次，送给各服务商的音频在这里转换到其要求的采样率。
+"""
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class StreamingResampler:
+    """
+    流式多相重采样器。
+
+    属性说明:
+        in_rate (int): 输入采样率。
+        out_rate (int): 输出采样率。
+        taps (int): 每个相位的滤波器阶数，越大过渡带越窄、计算量越大；降采样时按比例加长。
+        cutoff (float): 截止频率相对较低奈奎斯特频率的比例。
+        delay (float): 滤波器引入的群延迟（以输入样本计）。
+    """
+    def __init__(self, in_rate: int, out_rate: int, taps: int = 24, cutoff: float = 0.92, beta: float = 8.0):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.cutoff = cutoff
+        divisor = gcd(in_rate, out_rate)
+        self.up = out_rate // divisor
+        self.down = in_rate // divisor
+        self.passthrough = self.up == self.down
+        # 降采样时截止频率随输出率降低，按比例加长滤波器以保持同样的过渡带陡度
+        taps *= max(1, -(-self.down // self.up))
+        self.taps = taps
+
+        length = taps * self.up
+        # 截止频率按上采样后的采样率归一化
+        fc = 0.5 * cutoff / max(self.up, self.down)
+        n = np.arange(length) - (length - 1) / 2
+        prototype = 2 * fc * np.sinc(2 * fc * n) * np.kaiser(length, beta)
+        prototype *= self.up / prototype.sum()
+        # phases[p, j] 与输入窗口 x[base-taps+1 .. base] 按顺序相乘
+        self._phases = prototype.reshape(taps, self.up).T[:, ::-1].astype(np.float32).copy()
+        self.delay = (length - 1) / 2 / self.up
+
+        self._history = np.zeros(taps - 1, dtype=np.float32)
+        # 下一个输出样本在上采样时间轴上的位置，相对 _history 起点
+        self._t = (taps - 1) * self.up
+
+    def reset(self) -> None:
+        """丢弃滤波器历史，例如打断后开始新的一段音频。"""
+        self._history[:] = 0
+        self._t = (self.taps - 1) * self.up
+
+    def process_array(self, samples: np.ndarray) -> np.ndarray:
+        """重采样一块 float32 样本，返回 float32 输出。"""
+        if self.passthrough:
+            return samples.astype(np.float32, copy=False)
+        buffer = np.concatenate((self._history, samples.astype(np.float32, copy=False)))
+        positions = np.arange(self._t, len(buffer) * self.up, self.down)
+        if len(positions):
+            bases = positions // self.up
+            windows = sliding_window_view(buffer, self.taps)[bases - (self.taps - 1)]
+            out = np.einsum("ij,ij->i", windows, self._phases[positions % self.up])
+            next_t = int(positions[-1]) + self.down
+        else:
+            out = np.zeros(0, dtype=np.float32)
+            next_t = self._t
+        consumed = len(buffer) - (self.taps - 1)
+        self._history = buffer[consumed:].copy()
+        self._t = next_t - consumed * self.up
+        return out
+
+    def process(self, pcm: bytes) -> bytes:
+        """重采样一块 16bit PCM。"""
+        if self.passthrough:
+            return pcm
+        out = self.process_array(np.frombuffer(pcm, dtype=np.int16))
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16).tobytes()
+
+    def flush(self) -> bytes:
+        """送入足够的静音，输出仍在滤波器中的尾部样本。"""
+        if self.passthrough:
+            return b""
+        return self.process(bytes(2 * self.taps))
+
+    def output_samples(self, input_samples: int) -> int:
+        """input_samples 个输入样本大约对应的输出样本数。"""
+        return input_samples * self.up // self.down
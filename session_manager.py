@@ -0,0 +1,266 @@
+# -- coding: utf-8 --
+"""
+在单个 asyncio 事件循环中并发运行多路 OmniRealtimeClient 会话。
+
+每路会话持有自己的客户端、音频源、音频汇、打断状态与指标，不依赖任何模块级全局状态，
+适合云端中继按核心而不是按进程承载大量车辆会话。
+
+音频源是任意产出 16bit PCM 块的异步可迭代对象；音频汇是实现了
+write(bytes) 与 interrupt() 的对象（例如 VAD.RingBufferPlayer 或下面的 NullSink）。
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterable, Dict, Optional
+
+from asyncio_throttle import Throttler
+
+from omni import OmniRealtimeClient, TurnDetectionMode
+from session_pool import WarmSessionPool
+
+
+class NullSink:
+    """丢弃下行音频、只计数的音频汇，用于中继转发或压测。"""
+    def __init__(self):
+        self.bytes_written = 0
+        self.interrupts = 0
+
+    def write(self, audio_data: bytes) -> None:
+        self.bytes_written += len(audio_data)
+
+    def interrupt(self) -> None:
+        self.interrupts += 1
+
+
+class QueueSource:
+    """由外部推入 PCM 块的音频源，close() 后迭代结束。"""
+    def __init__(self, maxsize: int = 64):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    async def push(self, audio_chunk: bytes) -> None:
+        await self._queue.put(audio_chunk)
+
+    def push_nowait(self, audio_chunk: bytes) -> None:
+        self._queue.put_nowait(audio_chunk)
+
+    async def close(self) -> None:
+        await self._queue.put(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        audio_chunk = await self._queue.get()
+        if audio_chunk is None:
+            raise StopAsyncIteration
+        return audio_chunk
+
+
+class SessionMetrics:
+    """单路会话的运行指标。"""
+    def __init__(self):
+        self.connect_seconds: Optional[float] = None
+        self.audio_in_bytes = 0
+        self.audio_out_bytes = 0
+        self.interrupts = 0
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class RealtimeSession:
+    """
+    一路独立的实时会话。
+
+    属性说明:
+        session_id (str): 会话标识。
+        client (OmniRealtimeClient): 本会话专用的客户端。
+        source (AsyncIterable[bytes]): 上行音频源，为 None 时只接收。
+        sink: 下行音频汇，打断时由本会话调用其 interrupt()。
+        metrics (SessionMetrics): 会话指标。
+        pool (WarmSessionPool): 可选的预热会话池，设置时 run() 从池中取用客户端而不是现场建连。
+
+    client_kwargs 中的 on_audio_delta / on_interrupt 不直接交给客户端，而是在写入音频汇之后调用。
+    """
+    def __init__(
+        self,
+        session_id: str,
+        client_kwargs: Dict[str, Any],
+        source: Optional[AsyncIterable[bytes]] = None,
+        sink=None,
+        pool: Optional[WarmSessionPool] = None,
+    ):
+        self.session_id = session_id
+        self.source = source
+        self.sink = sink if sink is not None else NullSink()
+        self.metrics = SessionMetrics()
+        self.pool = pool
+        client_kwargs = dict(client_kwargs)
+        self._extra_audio_delta = client_kwargs.pop("on_audio_delta", None)
+        self._extra_interrupt = client_kwargs.pop("on_interrupt", None)
+
+        self.client: Optional[OmniRealtimeClient] = None
+        if pool is None:
+            self.client = OmniRealtimeClient(
+                on_audio_delta=self._on_audio_delta,
+                on_interrupt=self._on_interrupt,
+                **client_kwargs,
+            )
+        self._task: Optional[asyncio.Task] = None
+
+    def _on_audio_delta(self, audio_data: bytes) -> None:
+        self.metrics.audio_out_bytes += len(audio_data)
+        self.sink.write(audio_data)
+        if self._extra_audio_delta:
+            self._extra_audio_delta(audio_data)
+
+    def _on_interrupt(self) -> None:
+        self.metrics.interrupts += 1
+        self.sink.interrupt()
+        if self._extra_interrupt:
+            self._extra_interrupt()
+
+    async def _feed(self) -> None:
+        async for audio_chunk in self.source:
+            await self.client.stream_audio(audio_chunk)
+            self.metrics.audio_in_bytes += len(audio_chunk)
+        await self.client.flush_audio()
+
+    async def run(self, throttler: Optional[Throttler] = None) -> None:
+        """建立连接并运行会话，直到音频源结束或连接无法恢复。"""
+        start = time.monotonic()
+        try:
+            if self.pool is not None:
+                self.client = await self.pool.acquire(
+                    on_audio_delta=self._on_audio_delta,
+                    on_interrupt=self._on_interrupt,
+                )
+            elif throttler is not None:
+                async with throttler:
+                    await self.client.connect()
+            else:
+                await self.client.connect()
+            self.metrics.connect_seconds = time.monotonic() - start
+
+            receiver = asyncio.create_task(self.client.handle_messages())
+            feeder = asyncio.create_task(self._feed()) if self.source is not None else None
+            try:
+                # 接收循环在重连放弃时结束；音频源空闲时也要及时发现并结束会话
+                await asyncio.wait([task for task in (receiver, feeder) if task], return_when=asyncio.FIRST_COMPLETED)
+                if self.client.failure is not None:
+                    raise self.client.failure
+                if feeder is not None:
+                    await feeder
+            finally:
+                receiver.cancel()
+                if feeder is not None:
+                    feeder.cancel()
+                    await asyncio.gather(feeder, return_exceptions=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.metrics.error = str(e)
+            print(f"[{self.session_id}] 会话异常: {e}")
+        finally:
+            if self.client is not None:
+                await self.client.close()
+
+
+class SessionManager:
+    """
+    在当前事件循环中管理多路 RealtimeSession。
+
+    属性说明:
+        base_url (str): Realtime API 的基础地址。
+        model (str): 模型名称。
+        api_key (str): 所有会话默认使用的 API 密钥，可在 start_session 中覆盖。
+        connect_rate (int): 每秒最多发起的握手数，避免大量会话同时建连。
+        sessions (Dict[str, RealtimeSession]): 运行中的会话。
+        finished (Dict[str, SessionMetrics]): 已结束会话的最终指标（含失败原因），同名会话再次结束时覆盖。
+        pool (WarmSessionPool): warm_sessions > 0 时的预热会话池；未带 overrides 的会话从池中取用，
+            可在启动时调用 pool.fill() 提前预热。
+    """
+    def __init__(
+        self,
+        base_url: str,
+        model: str = "",
+        api_key: Optional[str] = None,
+        connect_rate: int = 20,
+        warm_sessions: int = 0,
+        **client_kwargs,
+    ):
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.connect_rate = connect_rate
+        self.client_kwargs = client_kwargs
+        self.client_kwargs.setdefault("turn_detection_mode", TurnDetectionMode.SERVER_VAD)
+        self.sessions: Dict[str, RealtimeSession] = {}
+        self.finished: Dict[str, SessionMetrics] = {}
+        self._throttler = Throttler(rate_limit=connect_rate, period=1.0)
+        self.pool: Optional[WarmSessionPool] = None
+        if warm_sessions > 0:
+            self.pool = WarmSessionPool(
+                size=warm_sessions,
+                throttler=self._throttler,
+                base_url=base_url,
+                model=model,
+                api_key=api_key,
+                **self.client_kwargs,
+            )
+
+    def start_session(
+        self,
+        session_id: str,
+        source: Optional[AsyncIterable[bytes]] = None,
+        sink=None,
+        **overrides,
+    ) -> RealtimeSession:
+        """创建并启动一路会话，overrides 覆盖该会话的客户端参数。"""
+        if session_id in self.sessions:
+            raise ValueError(f"Session already exists: {session_id}")
+        client_kwargs = {
+            "base_url": self.base_url,
+            "model": self.model,
+            "api_key": self.api_key,
+            **self.client_kwargs,
+            **overrides,
+        }
+        # 预热会话按管理器的默认参数建立，带 overrides 的会话只能现场建连
+        pool = self.pool if not overrides else None
+        session = RealtimeSession(session_id, client_kwargs, source, sink, pool)
+        session._task = asyncio.create_task(session.run(self._throttler))
+        session._task.add_done_callback(lambda _: self._on_session_done(session))
+        self.sessions[session_id] = session
+        return session
+
+    def _on_session_done(self, session: RealtimeSession) -> None:
+        if self.sessions.get(session.session_id) is session:
+            del self.sessions[session.session_id]
+        self.finished[session.session_id] = session.metrics
+
+    async def stop_session(self, session_id: str) -> None:
+        """停止一路会话并等待其资源释放。"""
+        session = self.sessions.get(session_id)
+        if session is None or session._task is None:
+            return
+        session._task.cancel()
+        await asyncio.gather(session._task, return_exceptions=True)
+
+    async def wait(self) -> None:
+        """等待所有会话结束。"""
+        tasks = [session._task for session in list(self.sessions.values()) if session._task]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close(self) -> None:
+        """停止所有会话并关闭预热会话池。"""
+        for session_id in list(self.sessions):
+            await self.stop_session(session_id)
+        if self.pool is not None:
+            await self.pool.close()
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """各会话的指标快照，包括已结束的会话；同名会话以运行中的为准。"""
+        snapshot = {session_id: metrics.as_dict() for session_id, metrics in self.finished.items()}
+        snapshot.update((session_id, session.metrics.as_dict()) for session_id, session in self.sessions.items())
+        return snapshot
@@ -0,0 +1,190 @@
+# -- coding: utf-8 --
+"""
+预热会话池。
+
+在后台保持若干路已连接、已完成 session.update 并设定好小柚人设的 OmniRealtimeClient。
+新对话直接取走一路就绪会话，握手、会话配置与人设设定都不在用户的关键路径上；
+取走之后池子在后台异步补充。池子为空时退化为现场建立连接。
+"""
+import asyncio
+import time
+from typing import List, Optional, Set
+
+from asyncio_throttle import Throttler
+
+from omni import OmniRealtimeClient
+
+# 取走会话时允许替换的客户端属性
+_OVERRIDABLE = (
+    "on_text_delta",
+    "on_audio_delta",
+    "on_interrupt",
+    "on_input_transcript",
+    "on_output_transcript",
+    "extra_event_handlers",
+    "timeline",
+)
+
+
+class _WarmEntry:
+    """池中一路就绪会话及其闲置期间的消息接收任务。"""
+    def __init__(self, client: OmniRealtimeClient, receiver: asyncio.Task):
+        self.client = client
+        self.receiver = receiver
+        self.ready_at = time.monotonic()
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+
+class WarmSessionPool:
+    """
+    保持 size 路预热会话的池子，须在事件循环中使用。
+
+    闲置的会话由池子持续接收消息（服务端确认、心跳等），断线时按客户端自身的策略重连；
+    无法恢复或闲置超过 max_idle_seconds 的会话会被关闭并在后台重建。
+
+    属性说明:
+        size (int): 保持就绪的会话数。
+        client_kwargs (Dict[str, Any]): 构造 OmniRealtimeClient 的参数。
+        max_idle_seconds (float): 就绪会话的最长闲置时间，避免交出已被服务端超时回收的会话。
+        ready_timeout (float): 预热时等待 session.updated 的最长时间（秒）。
+        warm_acquires (int): 直接取到就绪会话的次数。
+        cold_acquires (int): 池子为空、现场建立连接的次数。
+        acquire_seconds (List[float]): 每次 acquire 的耗时（秒）。
+    """
+    def __init__(
+        self,
+        size: int = 1,
+        max_idle_seconds: float = 600.0,
+        ready_timeout: float = 10.0,
+        throttler: Optional[Throttler] = None,
+        **client_kwargs,
+    ):
+        self.size = size
+        self.client_kwargs = client_kwargs
+        self.max_idle_seconds = max_idle_seconds
+        self.ready_timeout = ready_timeout
+        self._throttler = throttler
+        self._ready: List[_WarmEntry] = []
+        self._warming: Set[asyncio.Task] = set()
+        self._closed = False
+
+        self.warm_acquires = 0
+        self.cold_acquires = 0
+        self.acquire_seconds: List[float] = []
+
+    @property
+    def ready_count(self) -> int:
+        return len(self._ready)
+
+    def fill(self) -> None:
+        """在后台补充会话，直到就绪与预热中的会话数达到 size。"""
+        if self._closed:
+            return
+        for _ in range(self.size - len(self._ready) - len(self._warming)):
+            task = asyncio.create_task(self._warm_one())
+            self._warming.add(task)
+            task.add_done_callback(self._warming.discard)
+
+    async def wait_ready(self) -> None:
+        """等待当前所有预热中的会话完成（成功或失败）。"""
+        while self._warming:
+            await asyncio.gather(*self._warming, return_exceptions=True)
+
+    async def _connect(self) -> _WarmEntry:
+        """建立连接、完成会话配置与人设设定，并等待服务端确认配置。"""
+        client = OmniRealtimeClient(**self.client_kwargs)
+        try:
+            if self._throttler is not None:
+                async with self._throttler:
+                    await client.connect()
+            else:
+                await client.connect()
+            receiver = asyncio.create_task(client.handle_messages())
+            confirmed = asyncio.create_task(client.session_updated.wait())
+            done, _ = await asyncio.wait(
+                {receiver, confirmed}, timeout=self.ready_timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if confirmed not in done:
+                confirmed.cancel()
+                receiver.cancel()
+                raise TimeoutError("Session was not confirmed by the server")
+        except BaseException:
+            await client.close()
+            raise
+        return _WarmEntry(client, receiver)
+
+    async def _warm_one(self) -> None:
+        try:
+            entry = await self._connect()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"预热会话失败: {e}")
+            return
+        if self._closed:
+            await self._retire(entry)
+            return
+        loop = asyncio.get_running_loop()
+        entry.expiry = loop.call_later(self.max_idle_seconds, self._drop, entry)
+        entry.receiver.add_done_callback(lambda _: self._drop(entry))
+        self._ready.append(entry)
+
+    def _drop(self, entry: _WarmEntry) -> None:
+        """闲置超时或连接无法恢复：移出池子、关闭并补充。"""
+        if entry not in self._ready:
+            return
+        self._ready.remove(entry)
+        asyncio.create_task(self._retire(entry))
+        self.fill()
+
+    @staticmethod
+    async def _retire(entry: _WarmEntry) -> None:
+        if entry.expiry:
+            entry.expiry.cancel()
+        entry.receiver.cancel()
+        await asyncio.gather(entry.receiver, return_exceptions=True)
+        await entry.client.close()
+
+    async def acquire(self, **overrides) -> OmniRealtimeClient:
+        """
+        取走一路就绪会话。overrides 在交出前设置到客户端上，
+        只适用于回调、timeline 等不影响连接本身的属性。
+        调用方负责运行 client.handle_messages() 并在结束时 close()。
+        """
+        for name in overrides:
+            if name not in _OVERRIDABLE:
+                raise TypeError(f"Unsupported client override: {name}")
+
+        start = time.monotonic()
+        entry = None
+        while entry is None:
+            if self._ready:
+                entry = self._ready.pop(0)
+                self.warm_acquires += 1
+            elif self._warming:
+                # 已有会话在预热，等它完成通常比重新握手更快
+                await asyncio.wait(set(self._warming), return_when=asyncio.FIRST_COMPLETED)
+            else:
+                entry = await self._connect()
+                self.cold_acquires += 1
+        self.fill()
+
+        if entry.expiry:
+            entry.expiry.cancel()
+        entry.receiver.cancel()
+        await asyncio.gather(entry.receiver, return_exceptions=True)
+        client = entry.client
+        for name, value in overrides.items():
+            setattr(client, name, value)
+        self.acquire_seconds.append(time.monotonic() - start)
+        return client
+
+    async def close(self) -> None:
+        """停止预热并关闭池中所有会话。"""
+        self._closed = True
+        for task in list(self._warming):
+            task.cancel()
+        await asyncio.gather(*self._warming, return_exceptions=True)
+        entries, self._ready = self._ready, []
+        for entry in entries:
+            await self._retire(entry)
@@ -0,0 +1,375 @@
+# -- coding: utf-8 --
+"""
+server_vad 参数的在线自调。
+
+ServerVadTuner 按轮统计以下指标，在两轮之间通过 session.update 调整 threshold、prefix_padding_ms
+与 silence_duration_ms（均限制在给定范围内）:
+    误打断     speech_started 之后的输入转录为空，多为车内噪声触发，正在播放的回复被无故打断；
+    切早       上一次 speech_stopped 之后不到 resume_ms 用户又开口（前后两段的转录都不为空），
+               说明静音窗口短于句中停顿，一句话被切成两轮，后半句还会打断刚开始的回复；
+    起音截断   本地能量检测到的开口时刻早于服务端 audio_start_ms 减去 prefix_padding_ms；
+    尾部等待   本地检测到说完到收到 speech_stopped 经过的上行音频时长。
+
+调整规则:
+    - 误打断率超过 max_false_rate 时提高 threshold；
+    - 起音截断率超过 max_clip_rate 时加大 prefix_padding_ms，已到上限且没有误打断时降低 threshold；
+    - 静音窗口每连续 min_turns 个正常轮次缩短一档；出现切早时退回到该次停顿加余量（至少回升一档），
+      并在 hold_turns 轮内不再低于这个值；之后重新试探，每次切早保持的轮数加倍（最多 4 倍）；
+      同一静音窗口下累计切早 settle_splits 次后不再试探这个值，窗口永久不低于它的上一档，调参随之收敛。
+也就是在不增加误打断的前提下找到最短的静音窗口。
+
+起音截断与尾部等待依赖本地能量检测：调用方须把实际发送的上行音频交给 observe_audio()，
+其累计时长即服务端 audio_start_ms / audio_end_ms 所在的时间轴。
+"""
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from event_bus import SPEECH_EVENT, DeliveryMode
+from omni import SERVER_VAD_DEFAULTS
+
+# 只含这些字符的转录视为空
+_FILLER = " \t\n。，、,.!?！？…~-"
+
+
+class ServerVadTuner:
+    """
+    面向单个 server_vad 客户端的参数自调。须在客户端所在的事件循环中 start()，
+    observe_audio() 也须在该事件循环中调用。
+
+    属性说明:
+        client (OmniRealtimeClient): 以 server_vad 模式连接的客户端。
+        rate (int): observe_audio 收到的上行音频采样率。
+        threshold_bounds / prefix_padding_bounds / silence_bounds (Tuple): 各参数的调整范围。
+        threshold_step / prefix_padding_step / silence_step_ms: 每次调整的步长。
+        max_false_rate (float): 误打断率上限。
+        max_clip_rate (float): 起音截断率上限。
+        min_turns (int): 每次调整后至少观察的轮数。
+        hold_turns (int): 切早后多少轮内静音窗口不低于退回值，再次切早时加倍，最多 4 倍。
+        settle_splits (int): 同一静音窗口下切早多少次后永久排除该值。
+        resume_ms (float): speech_stopped 之后在该时长内又开口视为切早。
+        pause_margin_ms (float): 切早后静音窗口比该次停顿多出的余量。
+        clip_tolerance_ms (float): 开口早于提交起点超过该值才算起音截断。
+        on_update (Callable[[Dict[str, Any]], None]): 推送新参数后调用。
+        turns (int): 已有转录的轮数。
+        false_starts / splits / clipped (int): 误打断、切早与起音截断的累计次数。
+        tail_waits_ms (Deque[float]): 最近各轮的尾部等待。
+        updates (int): 推送参数的次数。
+    """
+    def __init__(
+        self,
+        client,
+        rate: int = 16000,
+        threshold_bounds: Tuple[float, float] = (0.05, 0.6),
+        prefix_padding_bounds: Tuple[int, int] = (300, 1000),
+        silence_bounds: Tuple[int, int] = (300, 1200),
+        threshold_step: float = 0.05,
+        prefix_padding_step: int = 100,
+        silence_step_ms: int = 100,
+        max_false_rate: float = 0.1,
+        max_clip_rate: float = 0.1,
+        min_turns: int = 4,
+        hold_turns: int = 30,
+        settle_splits: int = 2,
+        resume_ms: float = 400,
+        pause_margin_ms: float = 150,
+        clip_tolerance_ms: float = 40,
+        noise_ratio: float = 3.0,
+        frame_ms: int = 20,
+        on_update: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.client = client
+        self.rate = rate
+        self.threshold_bounds = threshold_bounds
+        self.prefix_padding_bounds = prefix_padding_bounds
+        self.silence_bounds = silence_bounds
+        self.threshold_step = threshold_step
+        self.prefix_padding_step = prefix_padding_step
+        self.silence_step_ms = silence_step_ms
+        self.max_false_rate = max_false_rate
+        self.max_clip_rate = max_clip_rate
+        self.min_turns = min_turns
+        self.hold_turns = hold_turns
+        self.settle_splits = settle_splits
+        self.resume_ms = resume_ms
+        self.pause_margin_ms = pause_margin_ms
+        self.clip_tolerance_ms = clip_tolerance_ms
+        self.noise_ratio = noise_ratio
+        self.frame_ms = frame_ms
+        self.frame_samples = rate * frame_ms // 1000
+        self.on_update = on_update
+
+        self.turns = 0
+        self.false_starts = 0
+        self.splits = 0
+        self.clipped = 0
+        self.tail_waits_ms: Deque[float] = deque(maxlen=200)
+        self.updates = 0
+
+        # 本地能量检测，时间为上行音频时间轴上的毫秒
+        self._clock_ms = 0.0
+        self._rest = np.zeros(0, dtype=np.int16)
+        self._noise_rms: Optional[float] = None
+        self._frames: Deque[Tuple[float, bool]] = deque(maxlen=10_000 // frame_ms)
+        self._last_voiced_end_ms: Optional[float] = None
+        self._reconnects = client.reconnect_count
+        # 进行中与等待转录的话语
+        self._speaking = False
+        self._segments: Dict[str, Dict[str, Any]] = {}
+        self._unmatched: Deque[Dict[str, Any]] = deque(maxlen=20)
+        self._current: Optional[Dict[str, Any]] = None
+        self._last_stop: Optional[Tuple[float, Optional[float], Dict[str, Any]]] = None
+        # 疑似切早的 (前一段, 后一段, 停顿ms)，两段的转录都到达后再确认
+        self._pending_splits: Deque[Tuple[Dict[str, Any], Dict[str, Any], float]] = deque(maxlen=10)
+        # threshold / prefix_padding_ms 自上次调整以来的轮数与问题计数
+        self._td_turns = 0
+        self._td_false = 0
+        self._td_clipped = 0
+        # 静音窗口的探测状态
+        self._silence_turns = 0
+        self._silence_floor = 0.0
+        self._floor_turns_left = 0
+        self._hold_turns = hold_turns
+        self._silence_target: Optional[int] = None
+        # 各静音窗口下的切早次数，以及由此得到的永久下限
+        self._splits_at: Dict[int, int] = {}
+        self._settled_floor = 0
+
+        self._subscription = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """订阅服务端 VAD 事件并启动调整任务。"""
+        if self._task is not None:
+            return
+        self._subscription = self.client.events.subscribe((SPEECH_EVENT,), self._on_event, DeliveryMode.INLINE)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._subscription is not None:
+            self.client.events.unsubscribe(self._subscription)
+            self._subscription = None
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        """当前生效的 server_vad 参数。"""
+        config = dict(SERVER_VAD_DEFAULTS)
+        config.update(self.client.turn_detection_config or {})
+        return {key: config[key] for key in SERVER_VAD_DEFAULTS}
+
+    def observe_audio(self, chunk: bytes) -> None:
+        """记录一个已发送的上行音频块，更新本地能量检测。"""
+        if self.client.reconnect_count != self._reconnects:
+            # 新连接上服务端的音频时间轴从零开始
+            self._reconnects = self.client.reconnect_count
+            self._clock_ms = 0.0
+            self._frames.clear()
+            self._last_voiced_end_ms = None
+            self._speaking = False
+            self._segments.clear()
+            self._unmatched.clear()
+            self._current = None
+            self._last_stop = None
+            self._pending_splits.clear()
+        samples = np.concatenate((self._rest, np.frombuffer(chunk, dtype=np.int16)))
+        frames = len(samples) // self.frame_samples
+        self._rest = samples[frames * self.frame_samples:]
+        for i in range(frames):
+            frame = samples[i * self.frame_samples:(i + 1) * self.frame_samples].astype(np.float32)
+            rms = float(np.sqrt(np.mean(frame ** 2)))
+            # 噪声底快降慢升
+            if self._noise_rms is None or rms < self._noise_rms:
+                self._noise_rms = rms if self._noise_rms is None else 0.8 * self._noise_rms + 0.2 * rms
+            else:
+                self._noise_rms += (rms - self._noise_rms) * 0.002
+            self._clock_ms += self.frame_ms
+            voiced = rms >= self.noise_ratio * self._noise_rms + 1
+            self._frames.append((self._clock_ms, voiced))
+            if voiced:
+                self._last_voiced_end_ms = self._clock_ms
+
+    def _local_onset(self, at_ms: float) -> Optional[float]:
+        """在 at_ms 附近有本地语音时，返回这段连续语音的开始时刻（允许两帧以内的间隙）。"""
+        onset = None
+        gap = 0
+        for end_ms, voiced in reversed(self._frames):
+            if end_ms > at_ms + 100:
+                continue
+            if voiced:
+                onset = end_ms - self.frame_ms
+                gap = 0
+            elif onset is None:
+                if end_ms < at_ms - 100:
+                    return None
+            else:
+                gap += 1
+                if gap > 2:
+                    break
+        return onset
+
+    def _on_event(self, topic: str, event: Dict[str, Any]) -> None:
+        # 在接收循环中直接调用，只做记录
+        event_type = event.get("type")
+        if event_type == "input_audio_buffer.speech_started":
+            self._on_speech_started(event)
+        elif event_type == "input_audio_buffer.speech_stopped":
+            self._on_speech_stopped(event)
+        elif event_type == "conversation.item.input_audio_transcription.completed":
+            self._on_transcript(event)
+
+    def _on_speech_started(self, event: Dict[str, Any]) -> None:
+        self._speaking = True
+        start_ms = event.get("audio_start_ms", self._clock_ms)
+        segment: Dict[str, Any] = {"clipped": False, "false": None}
+        onset = self._local_onset(start_ms)
+        if onset is not None and start_ms - self.params["prefix_padding_ms"] - onset > self.clip_tolerance_ms:
+            segment["clipped"] = True
+        if self._last_stop is not None:
+            stop_clock, end_ms, previous = self._last_stop
+            if self._clock_ms - stop_clock < self.resume_ms:
+                # 刚提交就又开口，两段都不是噪声时即为切早
+                silence = self.params["silence_duration_ms"]
+                pause = start_ms - end_ms if end_ms is not None else self._clock_ms - stop_clock + silence
+                self._pending_splits.append((previous, segment, pause))
+            self._last_stop = None
+        self._current = segment
+        item_id = event.get("item_id")
+        if item_id:
+            self._segments[item_id] = segment
+        else:
+            self._unmatched.append(segment)
+
+    def _on_speech_stopped(self, event: Dict[str, Any]) -> None:
+        self._speaking = False
+        if self._current is not None:
+            # 记下判定说完时的静音窗口，切早要到两段转录都到达后才确认，届时窗口可能已经变了
+            self._current["silence_ms"] = self.params["silence_duration_ms"]
+            self._last_stop = (self._clock_ms, event.get("audio_end_ms"), self._current)
+            self._current = None
+        if self._last_voiced_end_ms is not None and self._clock_ms - self._last_voiced_end_ms < 5000:
+            self.tail_waits_ms.append(self._clock_ms - self._last_voiced_end_ms)
+        self._wakeup.set()
+
+    def _on_transcript(self, event: Dict[str, Any]) -> None:
+        segment = self._segments.pop(event.get("item_id"), None)
+        if segment is None:
+            if not self._unmatched:
+                return
+            segment = self._unmatched.popleft()
+        self.turns += 1
+        self._td_turns += 1
+        segment["false"] = not event.get("transcript", "").strip(_FILLER)
+        if segment["false"]:
+            self.false_starts += 1
+            self._td_false += 1
+        else:
+            self._silence_turns += 1
+            self._floor_turns_left -= 1
+        if segment["clipped"]:
+            self.clipped += 1
+            self._td_clipped += 1
+        self._resolve_splits()
+        self._wakeup.set()
+
+    def _resolve_splits(self) -> None:
+        for pending in list(self._pending_splits):
+            previous, segment, pause = pending
+            if previous["false"] is None or segment["false"] is None:
+                continue
+            self._pending_splits.remove(pending)
+            if previous["false"] or segment["false"] or pause > self.silence_bounds[1]:
+                # 噪声片段，或停顿长到窗口上限也覆盖不了，多半是新的一句
+                continue
+            # 窗口短于这次停顿：退回到停顿加余量，并在 hold_turns 轮内不再低于它
+            self.splits += 1
+            window = previous["silence_ms"]
+            self._splits_at[window] = self._splits_at.get(window, 0) + 1
+            if self._splits_at[window] >= self.settle_splits:
+                # 反复在同一窗口下切早：不再试探它
+                self._settled_floor = max(self._settled_floor, self._quantize_silence(window + self.silence_step_ms))
+            silence = self.params["silence_duration_ms"]
+            target = max(silence + self.silence_step_ms, pause + self.pause_margin_ms)
+            self._silence_target = self._quantize_silence(target)
+            self._silence_floor = self._silence_target
+            self._floor_turns_left = self._hold_turns
+            self._hold_turns = min(4 * self.hold_turns, 2 * self._hold_turns)
+            self._silence_turns = 0
+
+    def _quantize_silence(self, value: float) -> int:
+        low, high = self.silence_bounds
+        step = self.silence_step_ms
+        return int(min(high, max(low, -(-value // step) * step)))
+
+    def propose(self) -> Dict[str, Any]:
+        """按目前的统计给出需要调整的参数（可能为空），并重置相应的计数。"""
+        current = self.params
+        changes: Dict[str, Any] = {}
+        if self._td_turns >= self.min_turns:
+            threshold = current["threshold"]
+            prefix = current["prefix_padding_ms"]
+            low, high = self.threshold_bounds
+            if self._td_false / self._td_turns > self.max_false_rate and threshold < high:
+                changes["threshold"] = round(min(high, threshold + self.threshold_step), 3)
+            elif self._td_clipped / self._td_turns > self.max_clip_rate:
+                if prefix < self.prefix_padding_bounds[1]:
+                    changes["prefix_padding_ms"] = min(self.prefix_padding_bounds[1], prefix + self.prefix_padding_step)
+                elif self._td_false == 0 and threshold > low:
+                    changes["threshold"] = round(max(low, threshold - self.threshold_step), 3)
+            if changes:
+                self._td_turns = self._td_false = self._td_clipped = 0
+            elif self._td_turns >= 4 * self.min_turns:
+                # 统计按指数衰减，较早的轮次权重逐渐降低
+                self._td_turns //= 2
+                self._td_false //= 2
+                self._td_clipped //= 2
+
+        silence = current["silence_duration_ms"]
+        if self._silence_target is not None:
+            if self._silence_target != silence:
+                changes["silence_duration_ms"] = self._silence_target
+            self._silence_target = None
+        elif self._silence_turns >= self.min_turns and silence > self.silence_bounds[0]:
+            candidate = self._quantize_silence(silence - self.silence_step_ms)
+            if self._floor_turns_left > 0:
+                candidate = max(candidate, int(self._silence_floor))
+            candidate = max(candidate, self._settled_floor)
+            if candidate < silence:
+                changes["silence_duration_ms"] = candidate
+            self._silence_turns = 0
+        return changes
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self._speaking:
+                # 只在两轮之间调整，说话中的参数保持不变
+                continue
+            changes = self.propose()
+            if not changes:
+                continue
+            self.updates += 1
+            print(f" server_vad 参数调整: {changes}")
+            await self.client.set_turn_detection(**changes)
+            if self.on_update:
+                self.on_update(changes)
+
+    def stats(self) -> Dict[str, Any]:
+        waits: List[float] = list(self.tail_waits_ms)
+        return dict(
+            self.params,
+            turns=self.turns,
+            false_starts=self.false_starts,
+            splits=self.splits,
+            settled_silence_floor=self._settled_floor or None,
+            clipped=self.clipped,
+            mean_tail_ms=round(sum(waits) / len(waits)) if waits else None,
+            updates=self.updates,
+        )